@@ -0,0 +1,28 @@
+import os
+
+"""
+Configuracion de gunicorn para el servidor ASGI (Procfile)
+Cada proceso corre un event loop de uvicorn: las vistas async del catalogo esperan
+a la base de datos y a Dropbox sin ocupar el proceso
+"""
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+# Heroku define WEB_CONCURRENCY segun el tamano del dyno
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'linioexp.workers.AsgiWorker'
+# Las peticiones lentas a Dropbox no deben reiniciar al worker
+timeout = 60
+keepalive = 5
+# La aplicacion se carga una vez en el proceso principal, con lo que los workers usarian en
+# sus primeras peticiones (APP_WARMUP, ver main/startup.py); cada worker la hereda al crearse
+# Un cambio de codigo requiere reiniciar gunicorn, no basta con reiniciar los workers (HUP)
+preload_app = True
+os.environ.setdefault('APP_WARMUP', '1')
+
+
+# Las metricas de /metrics son de esta ejecucion: se borran las de los workers anteriores
+# (con preload_app la aplicacion ya esta cargada; no se ha atendido ninguna peticion)
+def on_starting(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'linioexp.settings')
+    from main.metrics import limpiar
+    limpiar()
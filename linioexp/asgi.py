@@ -9,8 +9,63 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'linioexp.settings')
+# Catalog views run as async views under ASGI (see ASYNC_VIEWS in settings)
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+
+# WsgiToAsgi does not close the WSGI response, so Django would never send
+# request_finished (which closes old database connections).
+# Django writes Set-Cookie values with a leading space, which WSGI servers strip
+# and h11 rejects, so header values are stripped here too.
+def closing(wsgi_application):
+    def application(environ, start_response):
+        def strip_headers(status, headers, exc_info=None):
+            return start_response(status, [(name, value.strip()) for name, value in headers], exc_info)
+
+        response = wsgi_application(environ, strip_headers)
+        try:
+            yield from response
+        finally:
+            response.close()
+    return application
+
+
+# Application factory: loads Django and builds the routing application.
+# With APP_WARMUP (gunicorn.conf.py preloads the app in the master process) it
+# also loads what workers would otherwise load on their first requests, once,
+# before the workers are forked (see main/startup.py).
+def get_application():
+    django_asgi = get_asgi_application()
+
+    # Imported once the apps are loaded
+    from django.urls import reverse
+    from main import eventos, startup
+
+    # Live courier orders: a long-lived stream served by an async app (see main/eventos.py)
+    eventos_path = reverse('eventos-repartidor')
+
+    # Streaming responses that read the database while streaming (ASGI_WSGI_PATHS)
+    # run through the WSGI handler in a worker thread, one chunk sent at a time.
+    django_wsgi = WsgiToAsgi(closing(get_wsgi_application()))
+    wsgi_paths = tuple(settings.ASGI_WSGI_PATHS)
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == eventos_path:
+            await eventos.application(scope, receive, send)
+        elif scope['type'] == 'http' and scope['path'].startswith(wsgi_paths):
+            await django_wsgi(scope, receive, send)
+        else:
+            await django_asgi(scope, receive, send)
+
+    if settings.APP_WARMUP:
+        startup.precargar()
+    return application
+
+
+application = get_application()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.RolesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -56,7 +59,8 @@ ROOT_URLCONF = 'linioexp.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django templates, with render time measured per view (see main/metrics.py)
+        'BACKEND': 'main.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -139,9 +143,231 @@ EMAIL_PORT = '2525'
 
 # Django Storages
 
-DEFAULT_FILE_STORAGE = 'storages.backends.dropbox.DropBoxStorage'
+# Dropbox with the temporary link of each file cached (see main/storage.py).
+# Links are cached until shortly before they expire; STORAGE_URL_CACHE_TIMEOUT
+# (seconds) overrides the storage's default. The Dropbox SDK is imported the
+# first time the storage is used (main/storage_dropbox.py).
+DEFAULT_FILE_STORAGE = 'main.storage_dropbox.CachedDropBoxStorage'
 DROPBOX_OAUTH2_TOKEN = 'lQYmeb7lgtgAAAAAAAAAAcwnmSYQ-q7EnJ2jrjwdxkyNsoVBOLq2AgzRto9XKwT_'
 
-# Django Heroku
-import django_heroku
-django_heroku.settings(locals())
+# User roles
+# Seconds the roles cached in the session are trusted before being
+# queried again. Creating or deleting a role replaces the user's version in
+# the 'shared' cache, which invalidates them at once in every worker.
+ROLES_CACHE_TIMEOUT = 300
+
+# Courier dispatch
+# Courier changes are listed in the 'shared' cache and each process reloads
+# only the changed couriers. Every DISPATCH_INDEX_TTL seconds the whole index
+# is rebuilt, which corrects load counts that drifted between workers;
+# checkouts keep using the old index until the new one replaces it.
+DISPATCH_INDEX_TTL = 60
+
+# Delivery fees
+# File holding the precomputed fee matrix, shared by the workers through mmap.
+# None means a file in the system temp dir. It is built at startup with
+# APP_WARMUP (gunicorn's master process, see main/startup.py); a process that
+# does not find it builds it in a thread and computes each fee from the
+# database meanwhile, so checkout never waits for the build.
+FEE_MATRIX_PATH = None
+
+# Product images
+# Uploads are saved to DEFAULT_FILE_STORAGE during the request and a background
+# thread pool renders the thumb/card/detail variants. Images left without
+# variants (e.g. a worker restart) are completed by generate_image_variants.
+# Set IMAGE_VARIANTS_ASYNC = False to render them inline.
+IMAGE_VARIANTS_ASYNC = True
+IMAGE_VARIANTS_WORKERS = 2
+
+# Reference data
+# Seconds each worker trusts its in-memory copy of Categoria and Localizacion.
+# Writes replace a version in the 'shared' cache and every worker reloads
+# when it sees it change; this only bounds writes that skip the signals.
+REFERENCE_CACHE_TTL = 300
+
+# Home page
+# Seconds the "latest products" fragment stays cached. Each worker keeps its
+# render in the default cache; product signals replace its version in the
+# 'shared' cache, so every worker renders it again on its next request.
+HOME_CACHE_TIMEOUT = 300
+
+# Product search
+# Dotted path to a main.search backend. None uses SQLite FTS5 on SQLite
+# and falls back to icontains filtering on other databases.
+SEARCH_BACKEND = None
+
+# Catalog API
+# Page size of /api/productos (clients may ask for up to API_MAX_PAGE_SIZE
+# with ?limit=). Rows are fetched and streamed API_CHUNK_SIZE at a time.
+# The catalog version (the ETag source) is kept in the 'shared' cache, so all
+# workers answer with the same ETag and writes replace it at once;
+# API_CACHE_TIMEOUT bounds how long it is trusted after writes that skip the
+# signals.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 1000
+API_CHUNK_SIZE = 200
+API_CACHE_TIMEOUT = 300
+
+# Sales export
+# A merchant's products are exported EXPORT_PRODUCTS_PER_QUERY at a time; their
+# order lines are read EXPORT_CHUNK_SIZE at a time with a server-side cursor
+# and sent in parts of about EXPORT_BUFFER_SIZE characters.
+EXPORT_PRODUCTS_PER_QUERY = 500
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Sales dashboard
+# Reads the daily rollup table (main.VentaDiaria); shows the last
+# SALES_DASHBOARD_DAYS days by default and at most SALES_DASHBOARD_MAX_DAYS.
+SALES_DASHBOARD_DAYS = 30
+SALES_DASHBOARD_MAX_DAYS = 366
+
+# Async views
+# Serve the catalog (home, product list and detail) with async views. The
+# ASGI entry point (linioexp/asgi.py) turns this on; under WSGI every async
+# view would need its own event loop, so the sync views are used instead.
+# ORM, cache and template work of async views runs in a pool of
+# ASYNC_ORM_WORKERS threads, which also bounds each worker's DB connections.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+ASYNC_ORM_WORKERS = 8
+# Under ASGI, Django 3.1 iterates streaming responses on the event loop, where
+# the ORM cannot run. Paths starting with these prefixes stream while reading
+# the database, so linioexp/asgi.py serves them through the WSGI handler in a
+# thread instead.
+ASGI_WSGI_PATHS = ['/api/productos', '/ventas/export.']
+
+# Live courier orders (server-sent events)
+# Each stream checks the courier's open orders every SSE_POLL_INTERVAL seconds
+# (changes made by other processes) and ends after SSE_MAX_DURATION seconds;
+# the browser reconnects after SSE_RETRY_MS milliseconds. Under ASGI the
+# stream is served by main.eventos.application without holding a thread.
+SSE_POLL_INTERVAL = 10
+SSE_MAX_DURATION = 300
+SSE_RETRY_MS = 3000
+
+# Order comment thread
+# The order page shows COMMENTS_PAGE_SIZE comments per page and asks for
+# newer ones every COMMENTS_POLL_INTERVAL seconds, at most
+# COMMENTS_POLL_LIMIT per request.
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_POLL_INTERVAL = 5
+COMMENTS_POLL_LIMIT = 100
+
+# Caches, sessions and messages
+# SESSION_MODE selects where sessions are stored:
+#   db              the django_session table, read on every request (default)
+#   cached_db       the sessions cache, written through to the table and read
+#                   from it only on a cache miss
+#   cache           the sessions cache only (sessions are lost when evicted)
+#   signed_cookies  the signed session cookie itself, no server-side storage
+# The sessions cache is local to the host, with no external service: 'file'
+# (SESSION_CACHE_DIR) is shared by all workers, 'memory' only suits a single
+# process. The file cache checks its size every CULL_INTERVAL writes instead
+# of listing the directory on every write (see main/cache.py).
+# cached_db and cache are only safe with a single host (one Heroku dyno):
+# each host has its own cache, so a logout or session change on one host
+# stays stale on the others and a logged-out session keeps working there.
+# With several dynos keep db (or signed_cookies).
+# Compare the modes with: python manage.py bench_sessions
+SESSION_MODE = os.environ.get('SESSION_MODE', 'db')
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+if SESSION_MODE not in SESSION_ENGINES:
+    raise ValueError(f'SESSION_MODE must be one of {", ".join(SESSION_ENGINES)}, not {SESSION_MODE!r}')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_BACKEND = os.environ.get('SESSION_CACHE_BACKEND', 'file')
+SESSION_CACHE_DIR = os.environ.get('SESSION_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'linioexp-sessions')
+SESSION_CACHE_MAX_ENTRIES = 100000
+# The 'shared' cache holds the versions that tell every worker on the host
+# to drop what it keeps in memory (reference tables, courier index, roles,
+# cached fragments, API ETags) when another process writes. It is a file
+# cache in SHARED_CACHE_DIR; with several hosts point it at Redis/Memcached.
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'linioexp-shared')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'main.cache.FileBasedCache',
+        'LOCATION': SHARED_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_INTERVAL': 100},
+    },
+    'sessions': {
+        'BACKEND': 'main.cache.FileBasedCache',
+        'LOCATION': SESSION_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': SESSION_CACHE_MAX_ENTRIES, 'CULL_INTERVAL': 100},
+    } if SESSION_CACHE_BACKEND == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': SESSION_CACHE_MAX_ENTRIES},
+    },
+}
+# Flash messages travel in a signed cookie, so views that call messages.success
+# (payment, order cancellation) never write the session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Metrics
+# main.middleware.MetricsMiddleware measures every request by URL name:
+# latency histogram (METRICS_BUCKETS, seconds), responses by status class,
+# and the count and time of database queries, template renders and external
+# storage calls. Each process writes its totals to its own file in
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds; /metrics sums the files
+# of all workers on the host in Prometheus text format. gunicorn clears the
+# directory when it starts. If METRICS_TOKEN is set, /metrics requires it
+# as a bearer token.
+METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'linioexp-metrics')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Slow query log
+# Queries taking SLOW_QUERY_MS milliseconds or more (None: off) are appended
+# to SLOW_QUERY_LOG as JSON lines with their view, the project line that ran
+# them and a fingerprint of their SQL. The first time a process sees a
+# fingerprint it also stores its EXPLAIN plan. The file rotates past
+# SLOW_QUERY_LOG_MAX_BYTES, keeping SLOW_QUERY_LOG_BACKUPS old copies.
+# Summarize it with: python manage.py slow_queries
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or os.path.join(tempfile.gettempdir(), 'linioexp-slow-queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Startup
+# Code that not every request needs is loaded on first use (the Dropbox SDK,
+# Pillow, compiled templates), so manage.py commands and the release phase
+# skip it. APP_WARMUP loads it while the ASGI application is built instead:
+# gunicorn.conf.py turns it on together with preload_app, so the master
+# process pays for it once and the workers inherit it when forked.
+# Measure with: python manage.py startup_profile
+APP_WARMUP = os.environ.get('APP_WARMUP', '0') == '1'
+
+# Heroku
+# The configuration django_heroku.settings(locals()) used to apply, inlined:
+# importing django_heroku loads django.test.runner (about 150 ms) in every
+# process, including each web worker and the release dyno.
+# Its LOGGING only set up an unused 'testlogger', so Django's default
+# logging is kept.
+if 'DATABASE_URL' in os.environ:
+    import dj_database_url
+    DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=True)
+    if 'CI' in os.environ:
+        DATABASES['default']['TEST'] = DATABASES['default']
+if 'CI' in os.environ:
+    # Imported by the test command only
+    TEST_RUNNER = 'django_heroku.HerokuDiscoverRunner'
+if 'SECRET_KEY' in os.environ:
+    SECRET_KEY = os.environ['SECRET_KEY']
+ALLOWED_HOSTS = ['*']
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATIC_URL = '/static/'
+os.makedirs(STATIC_ROOT, exist_ok=True)
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# WhiteNoise goes first, as django_heroku placed it; its async-capable
+# subclass keeps requests under ASGI from being forced through a single
+# sync thread.
+MIDDLEWARE = ['main.middleware.AsyncWhiteNoiseMiddleware'] + MIDDLEWARE
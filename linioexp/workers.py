@@ -0,0 +1,10 @@
+from uvicorn.workers import UvicornWorker
+
+"""
+Worker de gunicorn para servir linioexp.asgi con uvicorn (ver gunicorn.conf.py)
+"""
+
+# Django 3.1 no implementa el protocolo lifespan de ASGI
+# asyncio y h11 (puro Python): no requieren uvloop ni httptools
+class AsgiWorker(UvicornWorker):
+    CONFIG_KWARGS = {'loop': 'asyncio', 'http': 'h11', 'lifespan': 'off'}
@@ -39,6 +39,8 @@ class ProductoAdmin(admin.ModelAdmin):
     inlines = [
         ProductoImageInline,
     ]
+    # La imagen principal se asigna automaticamente
+    readonly_fields = ['imagen_principal']
 
 # Register your models here.
 # Todos los modelos que se pueden editar
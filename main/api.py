@@ -0,0 +1,294 @@
+import hashlib
+import itertools
+import json
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+
+from .models import Producto, ProductoImage
+from .pagination import decode_cursor, encode_cursor, filter_after
+from .search import get_search_backend
+from .storage import precargar_urls
+from . import cache, reference
+
+"""
+API JSON de solo lectura del catalogo (productos, categorias e imagenes)
+
+    GET /api/productos?categoria=3&orden=precio_asc&fields=id,nombre,precio&limit=50
+    GET /api/productos?cursor=<next de la pagina anterior>
+    GET /api/productos/12?fields=id,imagenes
+    GET /api/categorias
+
+Las listas se paginan por cursor (keyset) y se envian por partes, sin armar la
+respuesta completa en memoria
+Cada respuesta lleva un ETag fuerte y Last-Modified derivados de la version del
+catalogo guardada en el cache compartido ('shared'), la misma en todos los procesos;
+con If-None-Match o If-Modified-Since vigentes se responde 304 sin consultar la base
+de datos
+"""
+
+# Clave de la version del catalogo en el cache compartido
+VERSION_KEY = 'api:catalogo:version'
+
+
+# Version actual del catalogo: {'token': str, 'modificado': segundos desde epoch}
+# Si no esta en el cache se crea una nueva (el catalogo pudo cambiar mientras no estaba)
+def get_version():
+    shared = cache.shared()
+    version = shared.get(VERSION_KEY)
+    if version is None:
+        version = nueva_version()
+        if not shared.add(VERSION_KEY, version, getattr(settings, 'API_CACHE_TIMEOUT', 300)):
+            version = shared.get(VERSION_KEY) or version
+    return version
+
+
+def nueva_version():
+    return {'token': cache.nueva_version(), 'modificado': int(time.time())}
+
+
+def bump_version():
+    cache.shared().set(VERSION_KEY, nueva_version(), getattr(settings, 'API_CACHE_TIMEOUT', 300))
+
+
+# Invalida los ETags del catalogo; se llama al escribir productos, categorias o imagenes
+# Se repite al confirmar la transaccion: otra peticion pudo leer la version antes del commit
+def invalidar():
+    bump_version()
+    transaction.on_commit(bump_version)
+
+
+# Error en los parametros de la peticion (respuesta 400)
+class ParametroInvalido(ValueError):
+    pass
+
+
+# Campos seleccionables (?fields=) de un modelo
+# Cada campo: (columnas que necesita, funcion que retorna su valor)
+class Campos:
+    def __init__(self, campos, por_defecto):
+        self.campos = campos
+        self.por_defecto = por_defecto
+
+    # Campos pedidos en ?fields= (o los por defecto), en el orden de la peticion
+    def elegir(self, request, por_defecto=None):
+        valor = request.GET.get('fields')
+        if not valor:
+            return list(por_defecto or self.por_defecto)
+        nombres = list(dict.fromkeys(nombre.strip() for nombre in valor.split(',') if nombre.strip()))
+        desconocidos = [nombre for nombre in nombres if nombre not in self.campos]
+        if desconocidos or not nombres:
+            raise ParametroInvalido(
+                f'Unknown fields: {", ".join(desconocidos) or valor}. '
+                f'Available: {", ".join(self.campos)}')
+        return nombres
+
+    # Columnas del modelo que se deben cargar para los campos
+    def columnas(self, nombres):
+        return list(dict.fromkeys(columna for nombre in nombres for columna in self.campos[nombre][0]))
+
+    def serializar(self, obj, nombres):
+        return {nombre: self.campos[nombre][1](obj) for nombre in nombres}
+
+
+def serializar_imagen(imagen):
+    return {
+        'id': imagen.pk,
+        'image': imagen.image.url if imagen.image else None,
+        'thumb': imagen.url_variante('thumb') or None,
+        'card': imagen.url_variante('card') or None,
+        'detail': imagen.url_variante('detail') or None,
+    }
+
+
+PRODUCTO = Campos({
+    'id': (('id',), lambda p: p.pk),
+    'nombre': (('nombre',), lambda p: p.nombre),
+    'descripcion': (('descripcion',), lambda p: p.descripcion),
+    'precio': (('precio',), lambda p: p.precio),
+    'descuento': (('descuento',), lambda p: p.descuento),
+    'precio_final': (('precio', 'descuento'), lambda p: p.get_precio_final()),
+    'estado': (('estado',), lambda p: p.estado),
+    'categoria': (('categoria',), lambda p: p.categoria_id),
+    'proveedor': (('proveedor',), lambda p: p.proveedor_id),
+    # Url de la variante 'card' de la imagen principal
+    'imagen': (('imagen_principal',),
+               lambda p: p.imagen_principal.url_variante('card') or None if p.imagen_principal else None),
+    # Todas las imagenes del producto (se cargan por bloques, ver cargar_imagenes)
+    'imagenes': (('id',), lambda p: [serializar_imagen(imagen) for imagen in p.api_imagenes]),
+}, por_defecto=('id', 'nombre', 'precio', 'descuento', 'precio_final', 'estado', 'categoria', 'proveedor',
+                'imagen'))
+
+CATEGORIA = Campos({
+    'id': ((), lambda c: c.pk),
+    'codigo': ((), lambda c: c.codigo),
+    'nombre': ((), lambda c: c.nombre),
+}, por_defecto=('id', 'codigo', 'nombre'))
+
+
+def dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+# Carga las imagenes que necesitan los campos de un bloque de productos (una consulta)
+# y resuelve sus urls juntas
+def cargar_imagenes(productos, nombres):
+    archivos = []
+    if 'imagenes' in nombres:
+        por_producto = {producto.pk: [] for producto in productos}
+        for imagen in ProductoImage.objects.filter(product_id__in=list(por_producto)).order_by('id'):
+            por_producto[imagen.product_id].append(imagen)
+            archivos += [imagen.image] + [imagen.archivo_variante(variante) for variante in ('thumb', 'card', 'detail')]
+        for producto in productos:
+            producto.api_imagenes = por_producto[producto.pk]
+    if 'imagen' in nombres:
+        archivos += [producto.imagen_principal.archivo_variante('card')
+                     for producto in productos if producto.imagen_principal]
+    precargar_urls(archivos)
+
+
+# Base de las vistas de la API: respuestas condicionales (ETag / Last-Modified) y errores en JSON
+class CatalogoAPIView(View):
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        version = get_version()
+        # ETag fuerte: misma version del catalogo y misma url (parametros en orden) = mismo contenido
+        query = urlencode(sorted((clave, valor) for clave, valores in request.GET.lists() for valor in valores))
+        digest = hashlib.sha1(f'{version["token"]}:{request.path}?{query}'.encode()).hexdigest()
+        etag = quote_etag(digest)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(version['modificado']),
+            # Los clientes pueden guardar la respuesta, pero deben revalidarla
+            'Cache-Control': 'no-cache',
+        }
+        response = get_conditional_response(request, etag=etag, last_modified=version['modificado'])
+        if response is None:
+            try:
+                response = self.respuesta(request, *args, **kwargs)
+            except ParametroInvalido as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            except Http404 as e:
+                return JsonResponse({'error': str(e) or 'Not found'}, status=404)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def respuesta(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+
+# Lista de productos paginada por cursor
+# Filtros: categoria (id), proveedor (id), q (busqueda, ordenada por relevancia)
+# Orden: orden=recientes|precio_asc|precio_desc
+class ProductoListAPI(CatalogoAPIView):
+    ORDENES = {
+        'recientes': ('-id',),
+        'precio_asc': ('precio', 'id'),
+        'precio_desc': ('-precio', '-id'),
+    }
+
+    def entero(self, request, parametro, default=None):
+        valor = request.GET.get(parametro)
+        if valor is None:
+            return default
+        try:
+            return int(valor)
+        except ValueError:
+            raise ParametroInvalido(f'{parametro} must be an integer')
+
+    def respuesta(self, request):
+        nombres = PRODUCTO.elegir(request)
+        limit = self.entero(request, 'limit', getattr(settings, 'API_PAGE_SIZE', 50))
+        maximo = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+        if not 1 <= limit <= maximo:
+            raise ParametroInvalido(f'limit must be between 1 and {maximo}')
+
+        query = request.GET.get('q')
+        queryset = get_search_backend().search(query) if query else Producto.objects.all()
+        for filtro in ('categoria', 'proveedor'):
+            valor = self.entero(request, filtro)
+            if valor is not None:
+                queryset = queryset.filter(**{f'{filtro}_id': valor})
+        orden = request.GET.get('orden')
+        if orden:
+            if orden not in self.ORDENES:
+                raise ParametroInvalido(f'orden must be one of {", ".join(self.ORDENES)}')
+            queryset = queryset.order_by(*self.ORDENES[orden])
+        # Orden del cursor, terminado en un campo unico
+        ordering = tuple(queryset.query.order_by) or ('-id',)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id',)
+        queryset = queryset.order_by(*ordering)
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                raise ParametroInvalido('Invalid cursor')
+            if direction != 'n' or len(values) != len(ordering):
+                raise ParametroInvalido('Invalid cursor')
+            try:
+                queryset = filter_after(queryset, ordering, values)
+            except ValueError:
+                raise ParametroInvalido('Invalid cursor')
+
+        columnas = PRODUCTO.columnas(nombres) + [field.lstrip('-') for field in ordering if field.lstrip('-') != 'rank']
+        queryset = queryset.only(*dict.fromkeys(columnas))
+        if 'imagen' in nombres:
+            queryset = queryset.select_related('imagen_principal')
+        # Una fila extra indica si hay otra pagina (sin COUNT)
+        filas = queryset[:limit + 1].iterator(chunk_size=getattr(settings, 'API_CHUNK_SIZE', 200))
+        return StreamingHttpResponse(self.stream(request, filas, nombres, ordering, limit),
+                                     content_type='application/json')
+
+    # Escribe {"results": [...], "next": url} un bloque de productos a la vez
+    def stream(self, request, filas, nombres, ordering, limit):
+        yield '{"results":['
+        enviados = 0
+        ultimo = None
+        while enviados < limit:
+            bloque = list(itertools.islice(filas, min(getattr(settings, 'API_CHUNK_SIZE', 200), limit - enviados)))
+            if not bloque:
+                break
+            cargar_imagenes(bloque, nombres)
+            yield (',' if enviados else '') + ','.join(dumps(PRODUCTO.serializar(p, nombres)) for p in bloque)
+            enviados += len(bloque)
+            ultimo = bloque[-1]
+        siguiente = None
+        if ultimo is not None and next(filas, None) is not None:
+            params = request.GET.copy()
+            params['cursor'] = encode_cursor('n', [getattr(ultimo, field.lstrip('-')) for field in ordering])
+            siguiente = f'{request.path}?{params.urlencode()}'
+        yield f'],"next":{dumps(siguiente)}}}'
+
+
+# Detalle de un producto (por defecto, todos los campos)
+class ProductoDetailAPI(CatalogoAPIView):
+    def respuesta(self, request, pk):
+        nombres = PRODUCTO.elegir(request, por_defecto=PRODUCTO.campos)
+        queryset = Producto.objects.only(*PRODUCTO.columnas(nombres))
+        if 'imagen' in nombres:
+            queryset = queryset.select_related('imagen_principal')
+        producto = queryset.filter(pk=pk).first()
+        if producto is None:
+            raise Http404(f'Producto {pk} not found')
+        cargar_imagenes([producto], nombres)
+        return JsonResponse(PRODUCTO.serializar(producto, nombres), encoder=DjangoJSONEncoder)
+
+
+# Todas las categorias (desde la copia en memoria, sin consulta)
+class CategoriaListAPI(CatalogoAPIView):
+    def respuesta(self, request):
+        nombres = CATEGORIA.elegir(request)
+        return JsonResponse({'results': [CATEGORIA.serializar(categoria, nombres)
+                                         for categoria in reference.categorias.all()]})
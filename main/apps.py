@@ -5,3 +5,7 @@ MainConfig: Declara la aplicacion web
 """
 class MainConfig(AppConfig):
     name = 'main'
+
+    # Registra las senales de la aplicacion
+    def ready(self):
+        from . import signals
@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+"""
+Codigo sincrono (ORM, cache, templates) desde vistas async
+Se ejecuta en un pool de hilos acotado (ASYNC_ORM_WORKERS): el event loop no se bloquea,
+varias consultas de una misma peticion pueden ir en paralelo y el pool limita las
+conexiones a la base de datos que abre cada proceso
+Cada hilo cierra su conexion cuando vence (CONN_MAX_AGE) o falla, como al terminar
+una peticion sincrona
+"""
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_ORM_WORKERS', 8), thread_name_prefix='orm')
+    return _executor
+
+
+def _ejecutar(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+# Ejecuta func(*args, **kwargs) en el pool y espera su resultado
+async def en_hilo(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), context.run, functools.partial(_ejecutar, func, args, kwargs))
+
+
+# Marca una vista como async para el handler de Django (view.as_view() retorna una funcion sincrona)
+def marcar_async(view):
+    view._is_coroutine = asyncio.coroutines._is_coroutine
+    return view
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends import filebased
+
+try:
+    import fcntl
+except ImportError:
+    # Sin fcntl (Windows) los procesos no se coordinan al modificar una clave
+    fcntl = None
+
+"""
+Backends de cache locales (sin servicios externos) y versiones compartidas
+Las versiones estan en el cache 'shared', comun a todos los procesos del host: el
+proceso que escribe reemplaza la version y los demas, al verla distinta, descartan lo
+que guardan en memoria (tablas de referencia, indices, fragmentos, roles, ETags)
+"""
+
+# Alias del cache compartido por los procesos (ver CACHES en settings)
+SHARED = 'shared'
+
+
+# Cache en archivos compartido por los workers del host (cache de sesiones)
+# El backend de Django lista todo el directorio en cada escritura para ver si debe
+# borrar entradas (costo proporcional a la cantidad de entradas); aqui se revisa
+# cada CULL_INTERVAL escrituras de cada instancia
+class FileBasedCache(filebased.FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = max(int(params.get('OPTIONS', {}).get('CULL_INTERVAL', 100)), 1)
+        self._writes = 0
+
+    def _cull(self):
+        self._writes += 1
+        if self._writes % self._cull_interval == 0:
+            super()._cull()
+
+
+def shared():
+    return caches[SHARED]
+
+
+# Valor nuevo de una version
+# Se reemplaza en vez de incrementarse: incr del cache en archivos lee y escribe por
+# separado, y dos procesos que escriben a la vez perderian un cambio
+def nueva_version():
+    return f'{time.time_ns():x}.{os.getpid():x}'
+
+
+# Version actual de la clave; si falta (nunca se escribio o el cache la borro) se crea
+# una nueva, asi lo guardado con la version anterior deja de valer
+def get_version(key):
+    cache = shared()
+    version = cache.get(key)
+    if version is None:
+        version = nueva_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key) or version
+    return version
+
+
+def bump_version(key):
+    shared().set(key, nueva_version(), None)
+
+
+# Lee, modifica y guarda una clave del cache compartido; retorna (anterior, nuevo)
+# funcion recibe el valor actual (None si falta) y retorna el nuevo
+# Un lock de archivo en el directorio del cache evita que dos procesos pisen sus cambios
+# (con un cache que no es de archivos, coordina solo a los procesos del host)
+def modificar(key, funcion, timeout=None):
+    cache = shared()
+    directorio = getattr(cache, '_dir', None) or tempfile.gettempdir()
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, 'modificar.lock'), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        anterior = cache.get(key)
+        nuevo = funcion(anterior)
+        cache.set(key, nuevo, timeout)
+    return anterior, nuevo
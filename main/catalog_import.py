@@ -0,0 +1,370 @@
+import itertools
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, reset_queries, transaction
+from django.db.models import Max
+
+from .models import Categoria, Localizacion, Proveedor, Producto, Comerciante
+from .roles import bump_version
+from .search import get_search_backend
+from . import api, fragments, reference, tarifas
+
+"""
+Importacion masiva del catalogo (categorias, localizaciones, proveedores y productos)
+Lee archivos JSON (formato de fixture, como linioData.json) o NDJSON sin cargarlos
+completos en memoria, valida por lotes y escribe con bulk_create / bulk_update
+Cada lote se escribe en su propia transaccion
+"""
+
+# Modelos importables, en orden de dependencia (se escriben antes los referenciados)
+MODELOS = {
+    'main.categoria': Categoria,
+    'main.localizacion': Localizacion,
+    'main.proveedor': Proveedor,
+    'main.producto': Producto,
+}
+
+# Claves naturales aceptadas en lugar del id al referenciar un registro
+CLAVES_NATURALES = {
+    Categoria: 'codigo',
+    Proveedor: 'ruc',
+}
+
+# Campos que no se importan (se mantienen con senales)
+EXCLUIDOS = {'imagen_principal'}
+
+# Modelo de los registros NDJSON que no indican 'model'
+MODELO_POR_DEFECTO = 'main.producto'
+
+# Caracteres que separan los elementos de un arreglo JSON
+SEPARADORES = ' \t\r\n,'
+
+
+# Lee un arreglo JSON elemento por elemento, a partir de trozos de texto
+def iter_json_array(chunks):
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+    started = False
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is not None:
+            buffer = buffer[pos:] + chunk
+            pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in SEPARADORES:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento incompleto: se lee el siguiente trozo
+                if chunk is None:
+                    raise
+                break
+            yield obj
+            pos = end
+    raise ValueError('Unexpected end of JSON array')
+
+
+# Lee un archivo NDJSON (un objeto JSON por linea), a partir de trozos de texto
+def iter_ndjson(chunks):
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+# Registros de un archivo abierto en modo texto; el formato se detecta si es 'auto'
+def iter_records(stream, format='auto', chunk_size=1 << 16):
+    chunks = iter(lambda: stream.read(chunk_size), '')
+    first = next(chunks, '')
+    if format == 'auto':
+        format = 'json' if first.lstrip().startswith('[') else 'ndjson'
+    chunks = itertools.chain([first], chunks)
+    if format == 'json':
+        return iter_json_array(chunks)
+    return iter_ndjson(chunks)
+
+
+# Registro invalido; se reporta y se omite
+class RegistroInvalido(Exception):
+    pass
+
+
+# Cache de los ids (y claves naturales) de los registros referenciables
+class ReferenceCache:
+    def __init__(self):
+        self.pks = {}
+        self.naturales = {}
+
+    def load(self, model):
+        if model not in self.pks:
+            campo = CLAVES_NATURALES.get(model)
+            self.pks[model] = set()
+            self.naturales[model] = {}
+            for pk, clave in model.objects.values_list('pk', campo or 'pk').iterator():
+                self.add(model, pk, clave if campo else None)
+
+    def add(self, model, pk, clave=None):
+        self.pks[model].add(pk)
+        if clave is not None:
+            self.naturales[model][clave] = pk
+
+    # Id referenciado por el valor (id o clave natural); None si aun no existe
+    def resolve(self, model, value):
+        self.load(model)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value if value in self.pks[model] else None
+        if isinstance(value, str):
+            pk = self.naturales[model].get(value)
+            if pk is None and value.isdigit() and int(value) in self.pks[model]:
+                pk = int(value)
+            return pk
+        raise RegistroInvalido(f'Invalid reference: {value!r}')
+
+
+# Importador del catalogo
+class CatalogImporter:
+    def __init__(self, batch_size=2000, strict=False, on_error=None):
+        self.batch_size = batch_size
+        self.strict = strict
+        self.on_error = on_error
+        self.cache = ReferenceCache()
+        self.buffers = {model: [] for model in MODELOS.values()}
+        # Registros con referencias a registros que aun no se han leido
+        self.pendientes = []
+        self.next_pk = {}
+        self.campos = {model: self.get_campos(model) for model in MODELOS.values()}
+        self.requeridos = {
+            model: {name for name, (field, _) in campos.items() if not field.null and not field.has_default()}
+            for model, campos in self.campos.items()}
+        self.stats = {model: {'creados': 0, 'actualizados': 0, 'invalidos': 0} for model in MODELOS.values()}
+        self.categorias_actualizadas = set()
+        self.proveedores_actualizados = set()
+        self.usa_ids_explicitos = set()
+        self.localizaciones = False
+        self.search = get_search_backend()
+
+    # Campos importables del modelo: (nombre, campo, modelo referenciado o None)
+    def get_campos(self, model):
+        campos = {}
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.name in EXCLUIDOS:
+                continue
+            campos[field.name] = (field, field.related_model if field.is_relation else None)
+        return campos
+
+    # Normaliza un registro: (modelo, pk, campos)
+    # Acepta el formato de fixture ({model, pk, fields}) o un objeto plano con los campos
+    def parse(self, record):
+        if not isinstance(record, dict):
+            raise RegistroInvalido('Record must be an object')
+        label = record.get('model', MODELO_POR_DEFECTO)
+        model = MODELOS.get(label)
+        if model is None:
+            raise RegistroInvalido(f'Unsupported model: {label}')
+        if 'fields' in record:
+            pk, fields = record.get('pk'), record['fields']
+        else:
+            fields = {key: value for key, value in record.items() if key not in ('model', 'pk', 'id')}
+            pk = record.get('pk', record.get('id'))
+        if pk is not None and not isinstance(pk, int):
+            raise RegistroInvalido(f'Invalid pk: {pk!r}')
+        unknown = set(fields) - set(self.campos[model]) - EXCLUIDOS
+        if unknown:
+            raise RegistroInvalido(f'Unknown fields: {", ".join(sorted(unknown))}')
+        return model, pk, fields
+
+    def error(self, model, pk, mensaje):
+        if model is not None:
+            self.stats[model]['invalidos'] += 1
+        if self.on_error:
+            self.on_error(model, pk, mensaje)
+        if self.strict:
+            raise RegistroInvalido(mensaje)
+
+    # Agrega un registro; escribe el lote cuando se llena
+    def add(self, record):
+        try:
+            model, pk, fields = self.parse(record)
+        except RegistroInvalido as e:
+            self.error(None, None, str(e))
+            return
+        buffer = self.buffers[model]
+        buffer.append((pk, fields))
+        if len(buffer) >= self.batch_size:
+            self.flush(model)
+
+    def import_records(self, records):
+        for record in records:
+            self.add(record)
+        self.finish()
+
+    # Convierte y valida los campos de un lote
+    # Retorna las instancias validas; las referencias desconocidas quedan pendientes
+    def build(self, model, rows, final=False):
+        campos = self.campos[model]
+        clave = CLAVES_NATURALES.get(model)
+        instances = []
+        for pk, fields in rows:
+            values = {}
+            try:
+                faltantes = self.requeridos[model] - set(fields)
+                if faltantes:
+                    raise RegistroInvalido(f'Missing fields: {", ".join(sorted(faltantes))}')
+                pendiente = False
+                for name, value in fields.items():
+                    if name in EXCLUIDOS:
+                        continue
+                    field, related = campos[name]
+                    if related is not None and value is not None:
+                        referencia = self.cache.resolve(related, value)
+                        if referencia is None:
+                            if not final:
+                                pendiente = True
+                                break
+                            raise RegistroInvalido(f'{name}: unknown reference {value!r}')
+                        values[field.attname] = referencia
+                        continue
+                    try:
+                        value = field.to_python(value)
+                    except ValidationError as e:
+                        raise RegistroInvalido(f'{name}: {"; ".join(e.messages)}')
+                    if value is None and not field.null:
+                        raise RegistroInvalido(f'{name}: cannot be null')
+                    if field.max_length is not None and value is not None and len(value) > field.max_length:
+                        raise RegistroInvalido(f'{name}: longer than {field.max_length} characters')
+                    values[field.attname] = value
+                if pendiente:
+                    self.pendientes.append((model, pk, fields))
+                    continue
+                # Sin id, un registro con clave natural actualiza al existente
+                if pk is None and clave is not None:
+                    self.cache.load(model)
+                    pk = self.cache.naturales[model].get(values[clave])
+                instance = model(pk=pk, **values)
+                # Reglas de validacion del modelo (validate_data)
+                if hasattr(instance, 'validate_data'):
+                    try:
+                        instance.validate_data()
+                    except ValidationError as e:
+                        raise RegistroInvalido('; '.join(e.messages))
+                instances.append(instance)
+            except RegistroInvalido as e:
+                self.error(model, pk, str(e))
+        return instances
+
+    # Asigna ids a los registros nuevos si la base de datos no los retorna en bulk_create
+    def assign_pks(self, model, instances):
+        if connection.features.can_return_rows_from_bulk_insert:
+            return
+        sin_pk = [instance for instance in instances if instance.pk is None]
+        if not sin_pk:
+            return
+        if model not in self.next_pk:
+            self.next_pk[model] = (model.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        for instance in sin_pk:
+            instance.pk = self.next_pk[model]
+            self.next_pk[model] += 1
+
+    # Escribe el lote de un modelo (y antes, los lotes de los modelos que referencia)
+    def flush(self, model, final=False):
+        for label, dependency in MODELOS.items():
+            if dependency is model:
+                break
+            if self.buffers[dependency]:
+                self.flush(dependency, final)
+        rows, self.buffers[model] = self.buffers[model], []
+        if not rows:
+            return
+        with transaction.atomic():
+            self.write(model, self.build(model, rows, final))
+        # Con DEBUG = True Django guarda cada consulta; se descartan para no crecer en memoria
+        reset_queries()
+
+    def write(self, model, instances):
+        if not instances:
+            return
+        pks = [instance.pk for instance in instances if instance.pk is not None]
+        existentes = set(model.objects.filter(pk__in=pks).values_list('pk', flat=True)) if pks else set()
+        nuevos = [instance for instance in instances if instance.pk not in existentes]
+        actualizados = [instance for instance in instances if instance.pk in existentes]
+
+        if nuevos:
+            self.assign_pks(model, nuevos)
+            if any(instance.pk is not None for instance in nuevos):
+                self.usa_ids_explicitos.add(model)
+            model.objects.bulk_create(nuevos, batch_size=self.batch_size)
+        # Como loaddata, un registro existente se reemplaza completo
+        if actualizados:
+            model.objects.bulk_update(actualizados, list(self.campos[model]), batch_size=self.batch_size)
+
+        self.stats[model]['creados'] += len(nuevos)
+        self.stats[model]['actualizados'] += len(actualizados)
+        self.after_write(model, instances, existentes)
+
+    # Mantiene caches e indices (bulk_create y bulk_update no envian senales)
+    def after_write(self, model, instances, existentes):
+        if model in reference.TABLES:
+            reference.TABLES[model].invalidate()
+        if model in CLAVES_NATURALES or model is Localizacion:
+            self.cache.load(model)
+            campo = CLAVES_NATURALES.get(model)
+            for instance in instances:
+                self.cache.add(model, instance.pk, getattr(instance, campo) if campo else None)
+        if model in (Producto, Categoria):
+            api.invalidar()
+        if model is Producto:
+            self.search.index_productos([instance.pk for instance in instances])
+            fragments.invalidate(fragments.HOME_LATEST)
+        elif model is Categoria:
+            self.categorias_actualizadas.update(existentes)
+        elif model is Proveedor:
+            self.proveedores_actualizados.update(existentes)
+            comerciantes = [instance.comerciante_id for instance in instances if instance.comerciante_id]
+            for user_id in Comerciante.objects.filter(pk__in=comerciantes).values_list(
+                    'user_profile__user_id', flat=True):
+                bump_version(user_id)
+        elif model is Localizacion:
+            self.localizaciones = True
+
+    # Escribe los lotes restantes y los registros pendientes
+    def finish(self):
+        for model in MODELOS.values():
+            self.flush(model)
+        pendientes, self.pendientes = self.pendientes, []
+        for model, pk, fields in pendientes:
+            self.buffers[model].append((pk, fields))
+            if len(self.buffers[model]) >= self.batch_size:
+                self.flush(model, final=True)
+        for model in MODELOS.values():
+            self.flush(model, final=True)
+
+        for categoria_id in self.categorias_actualizadas:
+            self.search.index_categoria(categoria_id)
+        for proveedor_id in self.proveedores_actualizados:
+            self.search.index_proveedor(proveedor_id)
+        if self.localizaciones:
+            tarifas.reconstruir_matriz()
+        # Como loaddata: las secuencias de ids continuan despues de los ids importados
+        if self.usa_ids_explicitos:
+            statements = connection.ops.sequence_reset_sql(no_style(), list(self.usa_ids_explicitos))
+            if statements:
+                with connection.cursor() as cursor:
+                    for sql in statements:
+                        cursor.execute(sql)
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
+from django.views.generic import View
+
+from .models import Comment, Pedido
+
+"""
+Hilo de comentarios de un pedido (entre el cliente y el repartidor)
+La pagina del pedido muestra los comentarios mas recientes y enlaza a los anteriores
+por cursor (?antes=<id>); mientras esta abierta, consulta solo los comentarios con id
+mayor al ultimo que muestra (?since=<id>)
+Ambas consultas recorren el indice (pedido, id): su costo depende de los comentarios
+leidos y no del largo del hilo
+"""
+
+
+# Pagina del hilo: hasta COMMENTS_PAGE_SIZE comentarios, de los mas recientes a los mas antiguos
+# antes: id del ultimo comentario de la pagina anterior (o None para la primera)
+# usuario_id: solo los comentarios de ese usuario (quien no participa en el pedido)
+# Retorna (comentarios, id para la siguiente pagina o None)
+def pagina(pedido_id, antes=None, usuario_id=None):
+    tamano = getattr(settings, 'COMMENTS_PAGE_SIZE', 20)
+    comentarios = Comment.objects.filter(pedido_id=pedido_id).select_related('usuario').order_by('-id')
+    if usuario_id is not None:
+        comentarios = comentarios.filter(usuario_id=usuario_id)
+    if antes is not None:
+        comentarios = comentarios.filter(id__lt=antes)
+    comentarios = list(comentarios[:tamano + 1])
+    if len(comentarios) > tamano:
+        return comentarios[:tamano], comentarios[tamano - 1].pk
+    return comentarios, None
+
+
+# Comentarios con id mayor a 'since', de los mas antiguos a los mas recientes
+# Retorna (comentarios, hay mas): a lo mas COMMENTS_POLL_LIMIT por consulta
+def nuevos(pedido_id, since):
+    limite = getattr(settings, 'COMMENTS_POLL_LIMIT', 100)
+    comentarios = list(Comment.objects.filter(pedido_id=pedido_id, id__gt=since).select_related(
+        'usuario').order_by('id')[:limite + 1])
+    return comentarios[:limite], len(comentarios) > limite
+
+
+# True si el usuario (sus roles) es el cliente o el repartidor del pedido
+def participa(roles, cliente_id, repartidor_id):
+    return ((roles.cliente_id is not None and roles.cliente_id == cliente_id)
+            or (roles.colaborador_id is not None and roles.colaborador_id == repartidor_id))
+
+
+# Comentario en la pagina del pedido
+def html(comentario):
+    return render_to_string('main/comment.html', {'comment': comentario})
+
+
+# Id de un parametro GET (o None si no esta); Http404 si no es un entero
+def parametro_id(request, nombre):
+    valor = request.GET.get(nombre)
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise Http404(f'{nombre} must be an integer')
+
+
+# Comentarios nuevos de un pedido en JSON (consulta periodica de la pagina del pedido)
+# Solo para el cliente y el repartidor del pedido
+#   GET /pedido/12/comentarios?since=340
+#   {"comments": [{"id", "usuario", "body", "created_on", "html"}], "since": 352, "more": false}
+class ComentariosNuevosView(View):
+    def get(self, request, pedido_pk):
+        pedido = Pedido.objects.filter(pk=pedido_pk).values_list('cliente_id', 'repartidor_id').first()
+        if pedido is None or not participa(request.roles, *pedido):
+            raise Http404('Pedido not found')
+        since = parametro_id(request, 'since') or 0
+        comentarios, more = nuevos(pedido_pk, since)
+        return JsonResponse({
+            'comments': [{
+                'id': comentario.pk,
+                'usuario': comentario.usuario.get_username(),
+                'body': comentario.body,
+                'created_on': comentario.created_on,
+                'html': html(comentario),
+            } for comentario in comentarios],
+            'since': comentarios[-1].pk if comentarios else since,
+            'more': more,
+        })
@@ -0,0 +1,307 @@
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import cache
+from .models import Colaborador, Pedido
+
+"""
+Asignacion de repartidores
+Indice en memoria: para cada localizacion, un heap de los colaboradores que la cubren,
+ordenado por carga (pedidos pagados sin entregar) ponderada por reputacion
+Elegir el repartidor cuesta O(log n)
+Los cambios de colaboradores se anotan en una lista en el cache compartido ('shared');
+cada proceso, antes de asignar, vuelve a leer de la base de datos solo los colaboradores
+cambiados desde su version
+El indice completo se reconstruye cada DISPATCH_INDEX_TTL segundos (corrige las cargas,
+que cada proceso cuenta por su lado) sin tomar el lock: las asignaciones siguen usando
+el indice anterior hasta que el nuevo lo reemplaza
+"""
+
+# Clave de la lista de cambios en el cache compartido: [(version, ids)], la ultima es la
+# version actual; ids None pide reconstruir el indice
+CAMBIOS_KEY = 'dispatch:cambios'
+# Cambios que se conservan; un proceso mas atrasado reconstruye su indice
+MAX_CAMBIOS = 200
+# Cambios de mas colaboradores se anotan como una reconstruccion
+MAX_IDS_CAMBIO = 1000
+
+# Heap de todos los colaboradores (si nadie cubre la ubicacion del pedido)
+TODAS = None
+
+
+class DispatchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Ultimo cambio aplicado y momento de la ultima reconstruccion (0: sin construir)
+        self.version = None
+        self.built_at = 0
+        self.reputacion = {}
+        self.perfil = {}
+        self.cobertura = {}
+        self.carga = {}
+        # Cada cambio de un colaborador invalida sus entradas anteriores en los heaps
+        self.stamp = {}
+        self.heaps = {}
+        self.pushes = 0
+
+    # Prioridad: menor carga por unidad de reputacion primero
+    def score(self, colaborador_id):
+        peso = 1.0 + max(self.reputacion[colaborador_id], 0.0)
+        return (self.carga.get(colaborador_id, 0) + 1) / peso
+
+    def entry(self, colaborador_id):
+        return (self.score(colaborador_id), -self.reputacion[colaborador_id],
+                colaborador_id, self.stamp[colaborador_id])
+
+    # Carga el indice a partir de datos en memoria
+    # colaboradores: [(id, reputacion, user_profile_id)]; coberturas: [(colaborador_id, localizacion_id)]
+    # cargas: {colaborador_id: pedidos abiertos}
+    def load(self, colaboradores, coberturas, cargas):
+        self.reputacion = {}
+        self.perfil = {}
+        self.cobertura = {}
+        self.stamp = {}
+        for colaborador_id, reputacion, perfil_id in colaboradores:
+            self.reputacion[colaborador_id] = reputacion or 0.0
+            self.perfil[colaborador_id] = perfil_id
+            self.cobertura[colaborador_id] = set()
+            self.stamp[colaborador_id] = 0
+        for colaborador_id, localizacion_id in coberturas:
+            if colaborador_id in self.cobertura:
+                self.cobertura[colaborador_id].add(localizacion_id)
+        self.carga = dict(cargas)
+        self.reheap()
+
+    # Reconstruye los heaps desde el estado en memoria (descarta entradas viejas)
+    def reheap(self):
+        heaps = {TODAS: []}
+        for colaborador_id, localizaciones in self.cobertura.items():
+            entry = self.entry(colaborador_id)
+            heaps[TODAS].append(entry)
+            for localizacion_id in localizaciones:
+                heaps.setdefault(localizacion_id, []).append(entry)
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self.heaps = heaps
+        self.pushes = 0
+
+    # Carga el indice desde la base de datos
+    def rebuild(self):
+        through = Colaborador.cobertura_entrega.through
+        self.load(
+            Colaborador.objects.values_list('id', 'reputacion', 'user_profile_id').iterator(),
+            through.objects.values_list('colaborador_id', 'localizacion_id').iterator(),
+            Pedido.objects.filter(estado='PAG', repartidor__isnull=False).values_list(
+                'repartidor').annotate(n=Count('id')).order_by(),
+        )
+        self.built_at = time.monotonic()
+
+    # Toma el contenido de otro indice (reconstruido aparte)
+    def replace(self, other, version):
+        self.reputacion = other.reputacion
+        self.perfil = other.perfil
+        self.cobertura = other.cobertura
+        self.carga = other.carga
+        self.stamp = other.stamp
+        self.heaps = other.heaps
+        self.pushes = other.pushes
+        self.built_at = other.built_at
+        self.version = version
+
+    # Vuelve a insertar al colaborador con su prioridad actual
+    def push(self, colaborador_id):
+        self.stamp[colaborador_id] += 1
+        entry = self.entry(colaborador_id)
+        heapq.heappush(self.heaps[TODAS], entry)
+        for localizacion_id in self.cobertura[colaborador_id]:
+            heapq.heappush(self.heaps.setdefault(localizacion_id, []), entry)
+            self.pushes += 1
+        # Compacta cuando las entradas viejas superan a las vigentes
+        if self.pushes > 2 * len(self.stamp) + 1000:
+            self.reheap()
+
+    # Mejor colaborador del heap, sin contar al perfil excluido
+    def peek(self, localizacion_id, excluir_perfil_id=None):
+        heap = self.heaps.get(localizacion_id)
+        if not heap:
+            return None
+        saltados = []
+        elegido = None
+        while heap:
+            _, _, colaborador_id, stamp = heap[0]
+            if self.stamp.get(colaborador_id) != stamp:
+                heapq.heappop(heap)
+            elif self.perfil[colaborador_id] == excluir_perfil_id:
+                saltados.append(heapq.heappop(heap))
+            else:
+                elegido = colaborador_id
+                break
+        for entry in saltados:
+            heapq.heappush(heap, entry)
+        return elegido
+
+    def add_carga(self, colaborador_id, delta):
+        if colaborador_id in self.stamp:
+            self.carga[colaborador_id] = max(0, self.carga.get(colaborador_id, 0) + delta)
+            self.push(colaborador_id)
+
+    def set_colaborador(self, colaborador_id, reputacion, perfil_id, localizaciones):
+        self.reputacion[colaborador_id] = reputacion or 0.0
+        self.perfil[colaborador_id] = perfil_id
+        self.cobertura[colaborador_id] = set(localizaciones)
+        self.stamp.setdefault(colaborador_id, 0)
+        self.push(colaborador_id)
+
+    def remove_colaborador(self, colaborador_id):
+        # Sin stamp, sus entradas se descartan al llegar al tope del heap
+        for data in (self.reputacion, self.perfil, self.cobertura, self.carga, self.stamp):
+            data.pop(colaborador_id, None)
+
+
+# Indice del proceso
+_index = DispatchIndex()
+# Solo un hilo reconstruye el indice a la vez
+_rebuild_lock = threading.Lock()
+
+
+# Elige el repartidor de un pedido y le suma la carga; retorna el id o None
+# Prefiere colaboradores que cubren la ubicacion; si no hay, cualquiera
+def asignar_repartidor(ubicacion_id, excluir_perfil_id=None):
+    ensure_fresh()
+    with _index.lock:
+        while True:
+            colaborador_id = _index.peek(ubicacion_id, excluir_perfil_id)
+            if colaborador_id is None and ubicacion_id is not TODAS:
+                colaborador_id = _index.peek(TODAS, excluir_perfil_id)
+            if colaborador_id is None:
+                return None
+            # El colaborador pudo ser eliminado desde otro proceso
+            if Colaborador.objects.filter(pk=colaborador_id).exists():
+                _index.add_carga(colaborador_id, 1)
+                return colaborador_id
+            _index.remove_colaborador(colaborador_id)
+
+
+# Resta un pedido a la carga del repartidor (entregado o cancelado)
+def liberar_repartidor(colaborador_id):
+    if colaborador_id is None:
+        return
+    with _index.lock:
+        _index.add_carga(colaborador_id, -1)
+
+
+# Pone al dia el indice del proceso: aplica los cambios de otros procesos o lo reconstruye
+# Las consultas se hacen sin el lock del indice
+def ensure_fresh():
+    if not _index.built_at:
+        # Primer uso (o despues de invalidar_indice): se espera al indice
+        with _rebuild_lock:
+            if not _index.built_at:
+                rebuild()
+        return
+    cambios = cache.shared().get(CAMBIOS_KEY) or []
+    ids = pendientes(cambios, _index.version)
+    ttl = getattr(settings, 'DISPATCH_INDEX_TTL', 60)
+    if ids is None or time.monotonic() - _index.built_at > ttl:
+        # Si otro hilo ya reconstruye, se sigue con el indice actual
+        if _rebuild_lock.acquire(blocking=False):
+            try:
+                rebuild()
+            finally:
+                _rebuild_lock.release()
+    elif ids:
+        aplicar(ids, cambios[-1][0])
+
+
+# Ids cambiados despues de la version (conjunto vacio si esta al dia), o None si el
+# indice se debe reconstruir (version fuera de la lista o un cambio que lo pide)
+def pendientes(cambios, version):
+    versiones = [cambio for cambio, _ in cambios]
+    if version not in versiones:
+        return None
+    ids = set()
+    for _, cambio in cambios[versiones.index(version) + 1:]:
+        if cambio is None:
+            return None
+        ids.update(cambio)
+    return ids
+
+
+# Construye un indice nuevo desde la base de datos y reemplaza al del proceso
+def rebuild():
+    cambios = cache.shared().get(CAMBIOS_KEY)
+    if not cambios:
+        _, cambios = anotar([])
+    nuevo = DispatchIndex()
+    nuevo.rebuild()
+    with _index.lock:
+        # Los cambios anotados durante la construccion se aplican en la siguiente asignacion
+        _index.replace(nuevo, cambios[-1][0])
+
+
+# Vuelve a leer los colaboradores de la base de datos y los actualiza en el indice
+# Los que ya no existen se quitan
+def aplicar(colaborador_ids, version=None):
+    through = Colaborador.cobertura_entrega.through
+    coberturas = {}
+    for colaborador_id, localizacion_id in through.objects.filter(
+            colaborador_id__in=colaborador_ids).values_list('colaborador_id', 'localizacion_id'):
+        coberturas.setdefault(colaborador_id, []).append(localizacion_id)
+    colaboradores = list(Colaborador.objects.filter(pk__in=colaborador_ids).values_list(
+        'id', 'reputacion', 'user_profile_id'))
+    with _index.lock:
+        for colaborador_id in set(colaborador_ids) - {colaborador_id for colaborador_id, _, _ in colaboradores}:
+            _index.remove_colaborador(colaborador_id)
+        for colaborador_id, reputacion, perfil_id in colaboradores:
+            _index.set_colaborador(colaborador_id, reputacion, perfil_id, coberturas.get(colaborador_id, []))
+        if version is not None:
+            _index.version = version
+
+
+# Anota un cambio en la lista compartida; retorna (lista anterior, lista nueva)
+def anotar(colaborador_ids):
+    if colaborador_ids is not None and len(colaborador_ids) > MAX_IDS_CAMBIO:
+        colaborador_ids = None
+    cambio = (cache.nueva_version(), None if colaborador_ids is None else list(colaborador_ids))
+    return cache.modificar(CAMBIOS_KEY, lambda cambios: (cambios or [])[-(MAX_CAMBIOS - 1):] + [cambio])
+
+
+# Anota un cambio ya aplicado en este proceso; si el indice estaba al dia, queda al dia
+def publicar(colaborador_ids):
+    anteriores, cambios = anotar(colaborador_ids)
+    with _index.lock:
+        if anteriores and _index.version == anteriores[-1][0]:
+            _index.version = cambios[-1][0]
+
+
+# Publica el cambio ahora y otra vez al confirmar la transaccion: otro proceso pudo
+# leer los colaboradores antes del commit
+def notificar(colaborador_ids):
+    publicar(colaborador_ids)
+    transaction.on_commit(lambda: publicar(colaborador_ids))
+
+
+# Actualiza (o agrega) colaboradores en el indice; se llama desde las senales
+def actualizar_colaboradores(colaborador_ids):
+    if _index.built_at:
+        aplicar(colaborador_ids)
+    notificar(colaborador_ids)
+
+
+# Invalida el indice en todos los procesos, incluido este (despues de cargas masivas)
+def invalidar_indice():
+    with _index.lock:
+        _index.built_at = 0
+    notificar(None)
+
+
+# Quita un colaborador del indice; se llama desde las senales
+def eliminar_colaborador(colaborador_id):
+    with _index.lock:
+        _index.remove_colaborador(colaborador_id)
+    notificar([colaborador_id])
@@ -0,0 +1,294 @@
+import asyncio
+import io
+import json
+import queue
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import auth
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.generic import View
+
+from .asyncdb import en_hilo
+from .models import Pedido
+from .roles import get_roles
+
+"""
+Pedidos en vivo de cada repartidor (server-sent events)
+Las senales publican los cambios de los pedidos (asignado, entregado, retirado,
+cancelado) en un canal en memoria del proceso; cada conexion del repartidor recibe
+los de sus pedidos sin recargar la pagina
+Los cambios hechos en otros procesos se detectan consultando cada SSE_POLL_INTERVAL
+segundos los pedidos por entregar del repartidor (indice repartidor, estado)
+El id de cada mensaje son los pedidos por entregar que conoce el navegador: al
+reconectarse (Last-Event-ID) se envian los cambios ocurridos mientras no estaba
+Bajo ASGI el stream es una aplicacion async (linioexp/asgi.py); bajo WSGI cada
+conexion ocupa un hilo hasta SSE_MAX_DURATION segundos
+"""
+
+# Suscripciones de cada colaborador en este proceso: {colaborador_id: set(Suscripcion)}
+_suscripciones = {}
+_lock = threading.Lock()
+
+
+# Cola de eventos de un colaborador mientras dura la conexion (with)
+class Suscripcion:
+    def __init__(self, colaborador_id):
+        self.colaborador_id = colaborador_id
+
+    def __enter__(self):
+        with _lock:
+            _suscripciones.setdefault(self.colaborador_id, set()).add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            suscripciones = _suscripciones.get(self.colaborador_id, set())
+            suscripciones.discard(self)
+            if not suscripciones:
+                _suscripciones.pop(self.colaborador_id, None)
+
+    # Recibe un evento; se llama desde cualquier hilo
+    def entregar(self, evento):
+        raise NotImplementedError
+
+
+# Suscripcion de un stream sincrono (WSGI)
+class SuscripcionSincrona(Suscripcion):
+    def __init__(self, colaborador_id):
+        super().__init__(colaborador_id)
+        self.cola = queue.Queue()
+
+    def entregar(self, evento):
+        self.cola.put_nowait(evento)
+
+    # Siguiente evento, o None si no llega ninguno en timeout segundos
+    def esperar(self, timeout):
+        try:
+            return self.cola.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+
+# Suscripcion de un stream async (ASGI): los eventos pasan al event loop de la conexion
+class SuscripcionAsync(Suscripcion):
+    def __init__(self, colaborador_id):
+        super().__init__(colaborador_id)
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue()
+
+    def entregar(self, evento):
+        self.loop.call_soon_threadsafe(self.cola.put_nowait, evento)
+
+
+# Envia un evento a las conexiones del colaborador en este proceso
+def publicar(colaborador_id, evento):
+    with _lock:
+        suscripciones = list(_suscripciones.get(colaborador_id, ()))
+    for suscripcion in suscripciones:
+        suscripcion.entregar(evento)
+
+
+# Publica el evento al confirmar la transaccion (el stream lee el pedido ya guardado)
+def notificar(colaborador_id, tipo, pedido_id):
+    if colaborador_id is not None:
+        transaction.on_commit(lambda: publicar(colaborador_id, {'tipo': tipo, 'pedido': pedido_id}))
+
+
+# Publica los cambios de un pedido guardado
+# anterior: (estado, repartidor_id) antes de guardarlo, o None si es nuevo
+def pedido_guardado(pedido, anterior):
+    estado, repartidor_id = anterior or (None, None)
+    abierto_antes = repartidor_id if estado == 'PAG' else None
+    abierto_ahora = pedido.repartidor_id if pedido.estado == 'PAG' else None
+    if abierto_antes == abierto_ahora:
+        return
+    if abierto_antes is not None:
+        entregado = pedido.estado == 'ENT' and pedido.repartidor_id == abierto_antes
+        notificar(abierto_antes, 'entregado' if entregado else 'retirado', pedido.pk)
+    if abierto_ahora is not None:
+        notificar(abierto_ahora, 'asignado', pedido.pk)
+
+
+# Publica la cancelacion de un pedido por entregar
+def pedido_eliminado(pedido):
+    if pedido.estado == 'PAG':
+        notificar(pedido.repartidor_id, 'cancelado', pedido.pk)
+
+
+# Tarjeta del pedido en la lista de pedidos del colaborador
+def tarjeta(pedido, colaborador_id):
+    return render_to_string('main/pedido_card.html', {'pedido': pedido, 'colaborador_id': colaborador_id})
+
+
+# Pedidos por entregar del colaborador (indice repartidor, estado)
+def pedidos_abiertos(colaborador_id):
+    return set(Pedido.objects.filter(repartidor_id=colaborador_id, estado='PAG').values_list('pk', flat=True))
+
+
+# Estado de la conexion de un colaborador: pedidos por entregar que conoce el navegador
+# Los metodos consultan la base de datos y retornan los mensajes a enviar (texto SSE)
+class Seguimiento:
+    def __init__(self, colaborador_id, ultimo_id=None):
+        self.colaborador_id = colaborador_id
+        self.abiertos = None
+        # Last-Event-ID: 'p' seguido de los ids separados por puntos (ver ultimo_id)
+        partes = (ultimo_id or '').split('.')
+        if partes[0] == 'p':
+            try:
+                self.abiertos = {int(pk) for pk in partes[1:]}
+            except ValueError:
+                pass
+
+    # Id de los mensajes: los pedidos por entregar que conoce el navegador
+    def ultimo_id(self):
+        return '.'.join(['p'] + [str(pk) for pk in sorted(self.abiertos)])
+
+    # Primer mensaje: tiempo de reconexion y, si el navegador se reconecta, lo que cambio
+    def inicio(self):
+        if self.abiertos is None:
+            self.abiertos = pedidos_abiertos(self.colaborador_id)
+            mensajes = []
+        else:
+            mensajes = self.sondear()
+        retry = getattr(settings, 'SSE_RETRY_MS', 3000)
+        return f'id: {self.ultimo_id()}\nretry: {retry}\n\n' + ''.join(mensajes)
+
+    # Compara los pedidos por entregar con los conocidos (cambios de otros procesos)
+    def sondear(self):
+        actuales = pedidos_abiertos(self.colaborador_id)
+        salientes = self.abiertos - actuales
+        eventos = [{'tipo': 'asignado', 'pedido': pk} for pk in sorted(actuales - self.abiertos)]
+        if salientes:
+            estados = dict((pk, (estado, repartidor_id)) for pk, estado, repartidor_id in Pedido.objects.filter(
+                pk__in=salientes).values_list('pk', 'estado', 'repartidor_id'))
+            for pk in sorted(salientes):
+                if pk not in estados:
+                    tipo = 'cancelado'
+                elif estados[pk] == ('ENT', self.colaborador_id):
+                    tipo = 'entregado'
+                else:
+                    tipo = 'retirado'
+                eventos.append({'tipo': tipo, 'pedido': pk})
+        return [self.mensaje(evento) for evento in eventos]
+
+    # Mensaje SSE de un evento; '' si el navegador ya lo conoce
+    def mensaje(self, evento):
+        tipo, pk = evento['tipo'], evento['pedido']
+        if (tipo == 'asignado') == (pk in self.abiertos):
+            return ''
+        data = {'pedido': pk}
+        if tipo == 'asignado':
+            self.abiertos.add(pk)
+        else:
+            self.abiertos.discard(pk)
+        if tipo in ('asignado', 'entregado'):
+            pedido = Pedido.objects.select_related(
+                'cliente__user_profile__user', 'repartidor__user_profile__user', 'ubicacion').filter(pk=pk).first()
+            if pedido is None:
+                return ''
+            data['html'] = tarjeta(pedido, self.colaborador_id)
+        return f'id: {self.ultimo_id()}\nevent: {tipo}\ndata: {json.dumps(data)}\n\n'
+
+
+HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Sin buffer en proxies (nginx): cada evento llega al navegador cuando se envia
+    'X-Accel-Buffering': 'no',
+}
+
+
+# Stream sincrono (WSGI): eventos del canal, sondeo periodico y comentario de keep-alive
+def stream(colaborador_id, ultimo_id=None):
+    intervalo = getattr(settings, 'SSE_POLL_INTERVAL', 10)
+    fin = time.monotonic() + getattr(settings, 'SSE_MAX_DURATION', 300)
+    seguimiento = Seguimiento(colaborador_id, ultimo_id)
+    with SuscripcionSincrona(colaborador_id) as suscripcion:
+        yield seguimiento.inicio()
+        sondeo = time.monotonic() + intervalo
+        while time.monotonic() < fin:
+            evento = suscripcion.esperar(min(sondeo, fin) - time.monotonic())
+            if evento is not None:
+                yield seguimiento.mensaje(evento)
+            elif time.monotonic() >= sondeo:
+                yield ''.join(seguimiento.sondear()) or ': ping\n\n'
+                sondeo = time.monotonic() + intervalo
+
+
+# Stream de los pedidos del repartidor (WSGI; bajo ASGI responde application)
+# Sin rol de colaborador responde 204: el navegador no vuelve a conectarse
+class EventosRepartidorView(View):
+    def get(self, request):
+        colaborador_id = request.roles.colaborador_id
+        if colaborador_id is None:
+            return HttpResponse(status=204)
+        response = StreamingHttpResponse(stream(colaborador_id, request.headers.get('Last-Event-ID')),
+                                         content_type='text/event-stream')
+        for header, value in HEADERS.items():
+            response[header] = value
+        return response
+
+
+# Sesion, usuario y roles de una peticion fuera de los middlewares de Django (en un hilo)
+def colaborador_de_asgi(request):
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    request.user = auth.get_user(request)
+    colaborador_id = get_roles(request).colaborador_id
+    # get_roles guarda los roles en la sesion
+    if request.session.modified and not request.session.is_empty():
+        request.session.save()
+    return colaborador_id
+
+
+async def esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+# Stream async (ASGI): mismo protocolo que EventosRepartidorView; una conexion no ocupa un hilo
+# mientras espera, solo las consultas a la base de datos usan el pool de asyncdb
+async def application(scope, receive, send):
+    request = ASGIRequest(scope, io.BytesIO())
+    colaborador_id = await en_hilo(colaborador_de_asgi, request)
+    if colaborador_id is None:
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    headers = [(b'Content-Type', b'text/event-stream')]
+    headers += [(header.encode(), value.encode()) for header, value in HEADERS.items()]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    async def enviar(texto):
+        if texto:
+            await send({'type': 'http.response.body', 'body': texto.encode(), 'more_body': True})
+
+    intervalo = getattr(settings, 'SSE_POLL_INTERVAL', 10)
+    fin = time.monotonic() + getattr(settings, 'SSE_MAX_DURATION', 300)
+    seguimiento = Seguimiento(colaborador_id, request.headers.get('Last-Event-ID'))
+    desconexion = asyncio.ensure_future(esperar_desconexion(receive))
+    try:
+        with SuscripcionAsync(colaborador_id) as suscripcion:
+            await enviar(await en_hilo(seguimiento.inicio))
+            sondeo = time.monotonic() + intervalo
+            while time.monotonic() < fin and not desconexion.done():
+                siguiente = asyncio.ensure_future(suscripcion.cola.get())
+                await asyncio.wait({siguiente, desconexion}, timeout=max(min(sondeo, fin) - time.monotonic(), 0),
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if siguiente.done():
+                    await enviar(await en_hilo(seguimiento.mensaje, siguiente.result()))
+                else:
+                    siguiente.cancel()
+                    if time.monotonic() >= sondeo and not desconexion.done():
+                        await enviar(''.join(await en_hilo(seguimiento.sondear)) or ': ping\n\n')
+                        sondeo = time.monotonic() + intervalo
+        if not desconexion.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        desconexion.cancel()
@@ -0,0 +1,126 @@
+import csv
+import datetime
+import io
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.views.generic import View
+
+from .models import DetallePedido, Producto
+
+"""
+Exportacion de ventas del proveedor (CSV o NDJSON)
+Una fila por producto vendido: cada detalle de un pedido pagado o entregado que
+contiene productos del proveedor
+La respuesta se escribe por partes mientras se leen las filas con un cursor del
+servidor (iterator): la memoria del worker no crece con el historial
+"""
+
+# Columnas de la exportacion: (nombre, campo de DetallePedido)
+COLUMNAS = [
+    ('pedido', 'pedido_id'),
+    ('fecha', 'pedido__fecha_creacion'),
+    ('estado', 'pedido__estado'),
+    ('fecha_entrega', 'pedido__fecha_entrega'),
+    ('distrito', 'pedido__ubicacion__distrito'),
+    ('producto', 'producto_id'),
+    ('nombre', 'producto__nombre'),
+    ('cantidad', 'cantidad'),
+    ('precio_unitario', 'precio_unitario'),
+]
+
+# precio_unitario es el precio final (con descuento) guardado en el detalle al venderse
+ENCABEZADO = [nombre for nombre, _ in COLUMNAS] + ['subtotal']
+
+
+# Detalles vendidos de un grupo de productos, en orden de producto y pedido
+# (recorre el indice producto, pedido sin ordenar aparte)
+# desde / hasta: fechas (inclusive) de creacion del pedido
+def ventas(producto_ids, desde=None, hasta=None):
+    queryset = DetallePedido.objects.filter(producto_id__in=producto_ids, pedido__estado__in=['PAG', 'ENT'])
+    if desde:
+        queryset = queryset.filter(pedido__fecha_creacion__gte=inicio_del_dia(desde))
+    if hasta:
+        queryset = queryset.filter(pedido__fecha_creacion__lt=inicio_del_dia(hasta + datetime.timedelta(days=1)))
+    return queryset.order_by('producto_id', 'pedido_id').values_list(*(campo for _, campo in COLUMNAS))
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+# Filas de la exportacion (con el subtotal) de todos los productos del proveedor
+# Los productos se consultan por grupos y sus detalles se leen por bloques con un cursor del servidor
+def filas(proveedor_id, desde=None, hasta=None):
+    producto_ids = list(Producto.objects.filter(proveedor_id=proveedor_id).order_by('id').values_list('id', flat=True))
+    grupo = getattr(settings, 'EXPORT_PRODUCTS_PER_QUERY', 500)
+    for inicio in range(0, len(producto_ids), grupo):
+        queryset = ventas(producto_ids[inicio:inicio + grupo], desde, hasta)
+        for fila in queryset.iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)):
+            cantidad, precio = fila[-2:]
+            yield fila + (round((cantidad or 0) * precio, 2),)
+
+
+# Agrupa las filas ya escritas en partes de al menos EXPORT_BUFFER_SIZE caracteres
+def por_partes(lineas):
+    tamano = getattr(settings, 'EXPORT_BUFFER_SIZE', 64 * 1024)
+    buffer = io.StringIO()
+    for linea in lineas:
+        buffer.write(linea)
+        if buffer.tell() >= tamano:
+            yield buffer.getvalue()
+            buffer = io.StringIO()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_lineas(filas):
+    # csv.writer escribe en un buffer de una linea, que se retorna y se vacia
+    linea = io.StringIO()
+    writer = csv.writer(linea)
+    writer.writerow(ENCABEZADO)
+    yield linea.getvalue()
+    for fila in filas:
+        linea.seek(0)
+        linea.truncate()
+        writer.writerow(fila)
+        yield linea.getvalue()
+
+
+def ndjson_lineas(filas):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for fila in filas:
+        yield encoder.encode(dict(zip(ENCABEZADO, fila))) + '\n'
+
+
+FORMATOS = {
+    'csv': (csv_lineas, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lineas, 'application/x-ndjson'),
+}
+
+
+# Descarga de las ventas del proveedor del usuario
+# Parametros GET opcionales: desde, hasta (AAAA-MM-DD)
+class ExportVentasView(View):
+    def get(self, request, formato):
+        if formato not in FORMATOS:
+            raise Http404('Unknown export format')
+        proveedor_id = request.roles.proveedor_id
+        if proveedor_id is None:
+            return redirect('/no_provider/')
+        try:
+            desde, hasta = (datetime.date.fromisoformat(request.GET[parametro]) if request.GET.get(parametro)
+                            else None for parametro in ('desde', 'hasta'))
+        except ValueError:
+            return HttpResponseBadRequest('desde and hasta must be dates (YYYY-MM-DD)')
+
+        lineas, content_type = FORMATOS[formato]
+        response = StreamingHttpResponse(
+            por_partes(lineas(filas(proveedor_id, desde, hasta))), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="ventas-{proveedor_id}.{formato}"'
+        # Sin buffer en proxies (nginx): las partes llegan al cliente mientras se generan
+        response['X-Accel-Buffering'] = 'no'
+        return response
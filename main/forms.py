@@ -1,9 +1,54 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.forms.models import ModelChoiceIterator
+from django.core.exceptions import ValidationError
 from django.http import Http404
 
 from .models import *
+from . import reference
+
+
+"""
+Campo de seleccion sobre una tabla de referencia (main.reference)
+Las opciones y la validacion usan la copia en memoria, sin consultar la base de datos
+"""
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.table.all():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.table.all()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.table.all())
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    iterator = ReferenceChoiceIterator
+
+    def __init__(self, table, **kwargs):
+        self.table = table
+        super().__init__(queryset=table.model.objects.all(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.table.model):
+            value = value.pk
+        try:
+            obj = self.table.get(int(value))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                  params={'value': value})
+        return obj
+
+
 
 """
 Formulario para crear un usuario
@@ -43,13 +88,13 @@ class UserForm(UserCreationForm):
     # Reputacion: Variable tipo float
     reputacion = forms.FloatField(required=False)
     # Cobertura entrega: Variable seleccion multiple, cuya data proviene de la base de datos
-    cobertura_entrega = forms.ModelChoiceField(queryset=Localizacion.objects.all(), required=False)
+    cobertura_entrega = ReferenceChoiceField(reference.localizaciones, required=False)
 
     # Cliente attributes
     # Es cliente? Variable tipo boolean (checkbox)
     is_cliente = forms.BooleanField(required=False)
     # Preferencias: Variable seleccion multiple, cuya data proviene de la base de datos
-    preferencias = forms.ModelChoiceField(queryset=Categoria.objects.all(), required=False)
+    preferencias = ReferenceChoiceField(reference.categorias, required=False)
 
     # Comerciatne attributes
     # Es comerciante? Variable tipo boolean (checkbox)
@@ -87,13 +132,16 @@ class CommerceForm(forms.Form):
     razon_social = forms.CharField(max_length=20)
     # Telefono: Variable string. Validacion 9 caracteres maximo
     telefono = forms.CharField(max_length=9)
+    # Ubicacion: Variable seleccion. Origen de los envios (para la tarifa)
+    ubicacion = ReferenceChoiceField(reference.localizaciones, required=False)
 
     # Modelo Comercio y sus campos
     class Meta:
         model = Proveedor
         fields = ['ruc',
         'razon_social',
-        'telefono'
+        'telefono',
+        'ubicacion'
         ]
 
     def __init__(self, *args, **kwargs):
@@ -109,7 +157,7 @@ Contiene los campos requeridos y opcionales (required=False) para crear un produ
 """
 class ProductForm(forms.Form):
     # Categoria: Variable seleccion multiple.
-    categoria = forms.ModelChoiceField(queryset=Categoria.objects.all(), required=False)
+    categoria = ReferenceChoiceField(reference.categorias, required=False)
     # Nombre: Variable string. Validacion 20 caracteres maximo
     nombre = forms.CharField(max_length=20)
     # Descripcion: Variable texto.
@@ -129,6 +177,18 @@ class ProductForm(forms.Form):
         super(ProductForm, self).__init__(*args, **kwargs)
 
 
+"""
+Formulario para el checkout de un pedido
+La ubicacion se elige de la copia en memoria de las localizaciones
+"""
+class PedidoForm(forms.ModelForm):
+    ubicacion = ReferenceChoiceField(reference.localizaciones, required=False)
+
+    class Meta:
+        model = Pedido
+        fields = ['ubicacion', 'direccion_entrega', 'comprobante']
+
+
 # Clase para guardar comentarios (comunicacion entre proveedor y cliente)
 class CommentForm(forms.Form):
     # Body: Texto del cuerpo.
@@ -0,0 +1,33 @@
+from django.db import transaction
+
+from . import cache
+
+"""
+Fragmentos de templates cacheados ({% cache %})
+Cada fragmento usa una version guardada en el cache compartido ('shared') como parte de
+su clave; las senales la reemplazan y los fragmentos viejos dejan de usarse en todos los
+procesos, aunque cada uno guarde sus renders en su propio cache
+"""
+
+# Ultimos productos de la pagina principal (compartido por todos los usuarios)
+HOME_LATEST = 'home_latest'
+
+
+def version_key(fragment):
+    return f'fragments:{fragment}:version'
+
+
+# Version actual del fragmento (se pasa como argumento de {% cache %})
+def get_version(fragment):
+    return cache.get_version(version_key(fragment))
+
+
+def bump_version(fragment):
+    cache.bump_version(version_key(fragment))
+
+
+# Invalida el fragmento en todos sus renders cacheados
+# Se repite al confirmar la transaccion: otro proceso pudo renderizarlo antes del commit
+def invalidate(fragment):
+    bump_version(fragment)
+    transaction.on_commit(lambda: bump_version(fragment))
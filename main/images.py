@@ -0,0 +1,118 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from .models import ProductoImage
+from . import api
+
+"""
+Imagenes de productos
+La generacion de variantes de tamano fijo (thumb, card, detail) se hace en un hilo
+de fondo, fuera de la peticion; la peticion solo sube el original al storage (Dropbox)
+"""
+
+logger = logging.getLogger(__name__)
+
+# Variantes: (ancho, alto, recortar); sin recorte la imagen se ajusta dentro del tamano
+VARIANTES = {
+    'thumb': (128, 128, True),
+    'card': (400, 400, True),
+    'detail': (1024, 1024, False),
+}
+
+# Calidad de compresion de las variantes
+CALIDAD = 80
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANTS_WORKERS', 2), thread_name_prefix='images')
+    return _executor
+
+
+# Ejecuta la tarea en segundo plano despues del commit (o en el momento si IMAGE_VARIANTS_ASYNC es False)
+def encolar(tarea, *args):
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        tarea(*args)
+        return
+
+    def ejecutar():
+        try:
+            tarea(*args)
+        except Exception:
+            logger.exception('Image task %s%r failed', tarea.__name__, args)
+        finally:
+            # Cada hilo usa su propia conexion a la base de datos
+            connection.close()
+
+    transaction.on_commit(lambda: get_executor().submit(ejecutar))
+
+
+# Formato de las variantes: WebP si Pillow lo soporta, si no JPEG
+# Pillow se importa al procesar la primera imagen, no al iniciar cada proceso
+def formato():
+    from PIL import features
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+# Genera las variantes de una imagen (archivo abierto en modo binario)
+# Retorna {variante: ContentFile}
+def generar_variantes(archivo, nombre):
+    from PIL import Image, ImageOps
+    formato_pil, extension = formato()
+    base = os.path.splitext(os.path.basename(nombre))[0]
+    with Image.open(archivo) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        if formato_pil == 'JPEG' and original.mode == 'RGBA':
+            original = original.convert('RGB')
+        variantes = {}
+        for variante, (ancho, alto, recortar) in VARIANTES.items():
+            if recortar:
+                imagen = ImageOps.fit(original, (ancho, alto), Image.LANCZOS)
+            else:
+                imagen = original.copy()
+                imagen.thumbnail((ancho, alto), Image.LANCZOS)
+            buffer = io.BytesIO()
+            imagen.save(buffer, formato_pil, quality=CALIDAD)
+            variantes[variante] = ContentFile(buffer.getvalue(), name=f'{base}_{variante}.{extension}')
+    return variantes
+
+
+# Guarda las variantes en el storage y en la imagen (sin senales)
+def guardar_variantes(imagen, variantes):
+    campos = {}
+    for variante, contenido in variantes.items():
+        campo = getattr(imagen, variante)
+        campo.save(contenido.name, contenido, save=False)
+        campos[variante] = campo.name
+    ProductoImage.objects.filter(pk=imagen.pk).update(**campos)
+    api.invalidar()
+
+
+# Genera las variantes de una imagen ya guardada en el storage
+def procesar_imagen(imagen_id):
+    imagen = ProductoImage.objects.filter(pk=imagen_id).first()
+    if imagen is None or not imagen.image:
+        return
+    with imagen.image.open('rb') as archivo:
+        variantes = generar_variantes(archivo, imagen.image.name)
+    guardar_variantes(imagen, variantes)
+
+
+# Registra la imagen de un producto: el original se sube al storage en la peticion
+# y las variantes se generan en segundo plano (senal generate_variantes)
+# Si el hilo no termina (reinicio del worker, error), la imagen queda con su original
+# y sin variantes; generate_image_variants las genera despues
+def registrar_imagen(producto, archivo):
+    return ProductoImage.objects.create(product=producto, image=archivo)
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+
+from main import cache, metrics
+
+"""
+Utilidades compartidas por los comandos de benchmark
+Las mediciones corren sobre una base de datos temporal (la de tests),
+nunca sobre la base de datos real
+"""
+
+# Archivos del host que tambien leen los workers en produccion, en un directorio temporal:
+# la matriz de tarifas, las metricas de /metrics, el log de consultas lentas y los caches
+# compartido (versiones de roles, repartidores, API...) y de sesiones
+def ajustes_temporales(directorio):
+    caches = dict(settings.CACHES)
+    for alias in (cache.SHARED, settings.SESSION_CACHE_ALIAS):
+        # Un cache en memoria ya es propio del proceso; los demas (archivos, Redis...) pasan a archivos
+        if caches[alias]['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+            caches[alias] = {'BACKEND': 'main.cache.FileBasedCache',
+                             'LOCATION': os.path.join(directorio, f'cache-{alias}'),
+                             'OPTIONS': caches[alias].get('OPTIONS', {})}
+    return {
+        'FEE_MATRIX_PATH': os.path.join(directorio, 'tarifas.bin'),
+        'METRICS_DIR': os.path.join(directorio, 'metrics'),
+        'SLOW_QUERY_LOG': os.path.join(directorio, 'slow-queries.log'),
+        'CACHES': caches,
+    }
+
+
+# Crea una base de datos temporal y la destruye al terminar
+# shared: varios hilos usan la base de datos (en SQLite se usa un archivo en vez de memoria)
+# Los archivos del host tambien son temporales (ver ajustes_temporales): la medicion no
+# cambia lo que ven los workers que atienden la base de datos real
+@contextmanager
+def benchmark_database(verbosity=0, shared=False):
+    test_settings = connection.settings_dict['TEST']
+    test_name = test_settings.get('NAME')
+    if shared and connection.vendor == 'sqlite' and not test_name:
+        test_settings['NAME'] = os.path.join(tempfile.gettempdir(), f'linioexp-bench-{os.getpid()}.sqlite3')
+    directory = tempfile.mkdtemp(prefix='linioexp-bench-')
+    try:
+        # Desde antes de crear la base de datos (createcachetable abre todos los caches)
+        with override_settings(**ajustes_temporales(directory)):
+            old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+            if shared and connection.vendor == 'sqlite':
+                # WAL: las lecturas no esperan a las escrituras de otros hilos
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode=WAL')
+            try:
+                yield
+            finally:
+                # Las metricas medidas se escriben ahora, no al salir en el directorio del host
+                metrics.registro.escribir()
+                connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+    finally:
+        test_settings['NAME'] = test_name
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# Ejecuta fn varias veces y retorna la duracion de cada ejecucion (segundos)
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# Percentil p (0-100) de una lista de valores
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+# Inserta objetos en bloques con bulk_create
+def bulk_insert(model, objects, batch_size=5000):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch, batch_size=batch_size)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch, batch_size=batch_size)
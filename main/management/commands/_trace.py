@@ -0,0 +1,227 @@
+import json
+import random
+
+from main.synthetic import VOCABULARIO, elegir, pesos_zipf
+
+"""
+Trazas de peticiones para bench_routes (JSON lines, una peticion por linea)
+
+    {"url_name": "product-detail", "kwargs": {"pk": 12}, "user": "cliente-3"}
+    {"url_name": "pedido-update", "method": "POST", "kwargs": {"pk": "$carrito"}, "user": "cliente-3",
+     "data": {"ubicacion": 4, "direccion_entrega": "Calle 1", "comprobante": "Boleta"}}
+    {"path": "/productos?q=polo"}
+
+Cada peticion indica url_name (con kwargs y params) o path; method es GET por defecto
+data: formulario enviado por POST; en sus valores {n} se reemplaza por un numero unico
+user: <rol>-<n>, con rol cliente, colaborador, comerciante, proveedor o anonimo;
+las peticiones de un mismo user comparten cookies (sin user: anonimo sin sesion propia)
+referer: cabecera Referer (las vistas del carrito redirigen a ella)
+Los kwargs que empiezan con $ se resuelven al reproducir la peticion:
+$carrito (pedido en proceso del usuario), $pagado (ultimo pedido pagado del usuario),
+$asignado (pedido por entregar del repartidor), $producto (un producto del proveedor)
+"""
+
+# Peso de cada tipo de sesion en la traza sintetica
+MEZCLA = {
+    'anonimo': 40,
+    'cliente': 35,
+    'colaborador': 10,
+    'proveedor': 10,
+    'comerciante': 5,
+}
+
+# Paginas de aviso (sin datos)
+AVISOS = ['empty-car', 'no-client', 'no-provider', 'invalid-age', 'invalid-dni', 'invalid-ruc', 'invalid-phone',
+          'invalid-price', 'invalid-discount']
+
+# Fraccion de las sesiones anonimas que son clientes de la API JSON (en vez de un navegador)
+SESIONES_API = 0.2
+
+
+def leer_traza(path):
+    with open(path) as archivo:
+        for line in archivo:
+            if line.strip():
+                yield json.loads(line)
+
+
+def escribir_traza(path, entradas):
+    with open(path, 'w') as archivo:
+        for entrada in entradas:
+            archivo.write(json.dumps(entrada) + '\n')
+
+
+def peticion(url_name, user=None, method='GET', **campos):
+    entrada = {'url_name': url_name}
+    if method != 'GET':
+        entrada['method'] = method
+    if user:
+        entrada['user'] = user
+    entrada.update((campo, valor) for campo, valor in campos.items() if valor)
+    return entrada
+
+
+# Traza sintetica: sesiones de usuarios de cada rol, intercaladas como si ocurrieran a la vez
+class TrazaSintetica:
+    # categorias: [(id, nombre)]
+    def __init__(self, producto_ids, categorias, localizacion_ids, semilla=1):
+        self.random = random.Random(f'{semilla}:traza')
+        # Popularidad de los productos: pocos reciben la mayoria de visitas
+        self.producto_ids = list(producto_ids)
+        self.random.shuffle(self.producto_ids)
+        self.producto_pesos = pesos_zipf(len(self.producto_ids))
+        self.categorias = list(categorias)
+        self.localizacion_ids = list(localizacion_ids)
+        self.sesiones = {rol: 0 for rol in MEZCLA}
+        self.avisos = 0
+
+    # Genera al menos 'total' peticiones; 'concurrencia': sesiones activas a la vez
+    def generar(self, total, concurrencia=50):
+        rnd = self.random
+        roles = list(MEZCLA)
+        pesos = list(MEZCLA.values())
+        activas = []
+        generadas = 0
+        while generadas < total:
+            while len(activas) < concurrencia:
+                activas.append(iter(self.sesion(rnd.choices(roles, pesos)[0])))
+            indice = rnd.randrange(len(activas))
+            entrada = next(activas[indice], None)
+            if entrada is None:
+                activas.pop(indice)
+                continue
+            generadas += 1
+            yield entrada
+
+    def sesion(self, rol):
+        self.sesiones[rol] += 1
+        return getattr(self, f'sesion_{rol}')(f'{rol}-{self.sesiones[rol]}')
+
+    def producto(self):
+        return elegir(self.random, self.producto_ids, self.producto_pesos)
+
+    # Lista de productos: todo el catalogo, una busqueda, una categoria o con orden
+    def listado(self, user):
+        rnd = self.random
+        opcion = rnd.random()
+        if opcion < 0.4:
+            params = {'q': rnd.choice(VOCABULARIO)}
+        elif opcion < 0.7 and self.categorias:
+            params = {'q': 'buscar_por_categoria', 'categoria': rnd.choice(self.categorias)[1]}
+        elif opcion < 0.85:
+            params = {'orden': rnd.choice(('precio_asc', 'precio_desc', 'recientes'))}
+        else:
+            params = None
+        return peticion('product-list', user, params=params)
+
+    def navegar(self, user):
+        rnd = self.random
+        entradas = [peticion('home', user)]
+        for _ in range(rnd.randint(1, 3)):
+            entradas.append(self.listado(user))
+            for _ in range(rnd.randint(0, 3)):
+                entradas.append(peticion('product-detail', user, kwargs={'pk': self.producto()}))
+        return entradas
+
+    # Cliente de la API JSON: categorias, listas con filtros y campos, y detalles
+    def consultar_api(self, user):
+        rnd = self.random
+        entradas = [peticion('api-categoria-list', user)]
+        for _ in range(rnd.randint(1, 3)):
+            params = {'limit': rnd.choice((20, 50))}
+            opcion = rnd.random()
+            if opcion < 0.3:
+                params['q'] = rnd.choice(VOCABULARIO)
+            elif opcion < 0.6 and self.categorias:
+                params['categoria'] = rnd.choice(self.categorias)[0]
+            if rnd.random() < 0.5:
+                params['orden'] = rnd.choice(('precio_asc', 'precio_desc', 'recientes'))
+            if rnd.random() < 0.5:
+                params['fields'] = 'id,nombre,precio_final,imagenes'
+            entradas.append(peticion('api-producto-list', user, params=params))
+            for _ in range(rnd.randint(0, 2)):
+                entradas.append(peticion('api-producto-detail', user, kwargs={'pk': self.producto()}))
+        return entradas
+
+    def sesion_anonimo(self, user):
+        rnd = self.random
+        if rnd.random() < SESIONES_API:
+            return self.consultar_api(user)
+        entradas = self.navegar(user)
+        if rnd.random() < 0.1:
+            entradas.append(peticion('register', user))
+            if rnd.random() < 0.3:
+                entradas.append(peticion('register', user, 'POST', data={
+                    'username': 'nuevo{n}', 'email': 'nuevo{n}@example.com',
+                    'password1': 'Clave-segura-{n}', 'password2': 'Clave-segura-{n}',
+                    'documento_identidad': '{n:08d}', 'fecha_nacimiento': '1990-05-17', 'estado': 'A',
+                    'genero': 'FE', 'is_cliente': 'on'}))
+        if rnd.random() < 0.3:
+            # En orden: todas las paginas de aviso aparecen aunque la traza sea corta
+            self.avisos += 1
+            entradas.append(peticion(AVISOS[self.avisos % len(AVISOS)], user))
+        # Lectura de las metricas (Prometheus, sin METRICS_TOKEN)
+        if rnd.random() < 0.05:
+            entradas.append(peticion('metrics', user))
+        return entradas
+
+    def sesion_cliente(self, user):
+        rnd = self.random
+        entradas = self.navegar(user)
+        agregados = [self.producto() for _ in range(rnd.randint(1, 3))]
+        for producto_id in agregados:
+            entradas.append(peticion('add-to-cart', user, kwargs={'product_pk': producto_id},
+                                     referer=f'/productos/{producto_id}'))
+        entradas.append(peticion('pedido-detail', user))
+        if rnd.random() < 0.3:
+            entradas.append(peticion('remove-from-cart', user, kwargs={'product_pk': agregados[0]},
+                                     referer='/carrito/'))
+        if rnd.random() < 0.6:
+            entradas.append(peticion('pedido-update', user, kwargs={'pk': '$carrito'}))
+            entradas.append(peticion('pedido-update', user, 'POST', kwargs={'pk': '$carrito'}, data={
+                'ubicacion': rnd.choice(self.localizacion_ids) if self.localizacion_ids else '',
+                'direccion_entrega': f'Calle {rnd.randint(1, 999)}', 'comprobante': 'Boleta'}))
+            entradas.append(peticion('payment', user))
+            entradas.append(peticion('complete-payment', user))
+            entradas.append(peticion('pedido-list', user))
+            entradas.append(peticion('paid-pedido-detail', user, kwargs={'pedido_pk': '$pagado'}))
+            # La pagina del pedido consulta periodicamente los comentarios nuevos
+            for _ in range(rnd.randint(1, 3)):
+                entradas.append(peticion('comentarios-nuevos', user, kwargs={'pedido_pk': '$pagado'},
+                                         params={'since': 0}))
+            if rnd.random() < 0.4:
+                entradas.append(peticion('registrar-comentario', user, kwargs={'pedido_pk': '$pagado'}))
+                entradas.append(peticion('registrar-comentario', user, 'POST', kwargs={'pedido_pk': '$pagado'},
+                                         data={'body': 'Hola, a que hora llega mi pedido?'}))
+            if rnd.random() < 0.1:
+                entradas.append(peticion('cancelar-pedido', user, kwargs={'pedido_pk': '$pagado'}))
+        else:
+            entradas.append(peticion('pedido-list', user))
+        return entradas
+
+    def sesion_colaborador(self, user):
+        # La lista de pedidos abre el stream de pedidos en vivo
+        entradas = [peticion('home', user), peticion('pedido-list', user), peticion('eventos-repartidor', user)]
+        for _ in range(self.random.randint(1, 2)):
+            entradas.append(peticion('pedido-delivered', user, kwargs={'pedido_pk': '$asignado'},
+                                     referer='/pedidos'))
+        entradas.append(peticion('pedido-list', user))
+        return entradas
+
+    def sesion_proveedor(self, user):
+        rnd = self.random
+        entradas = [peticion('home', user), peticion('registar-producto', user),
+                    peticion('product-detail', user, kwargs={'pk': '$producto'}),
+                    peticion('editar-producto', user, kwargs={'pk': '$producto'})]
+        if rnd.random() < 0.5:
+            entradas.append(peticion('editar-producto', user, 'POST', kwargs={'pk': '$producto'}, data={
+                'categoria': rnd.choice(self.categorias)[0] if self.categorias else '', 'nombre': ' '.join(rnd.sample(VOCABULARIO, 2))[:20],
+                'descripcion': ' '.join(rnd.choices(VOCABULARIO, k=12)),
+                'precio': round(rnd.uniform(5, 500), 2), 'estado': 'A', 'descuento': 0}))
+        entradas.append(peticion('ventas-dashboard', user))
+        if rnd.random() < 0.1:
+            entradas.append(peticion('exportar-ventas', user, kwargs={'formato': rnd.choice(('csv', 'ndjson'))}))
+        return entradas
+
+    def sesion_comerciante(self, user):
+        return [peticion('home', user), peticion('registar-comercio', user)]
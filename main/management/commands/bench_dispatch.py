@@ -0,0 +1,83 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main import dispatch
+from main.models import Cliente, Colaborador, Localizacion, Pedido, Profile
+
+from ._bench import benchmark_database, bulk_insert, measure, percentile
+
+"""
+Comando bench_dispatch: mide la asignacion de repartidores
+Compara el indice en memoria (main.dispatch) con el ORDER BY RANDOM() original
+sobre datos sinteticos: colaboradores, localizaciones y pedidos abiertos
+Las senales de los datos creados (roles, indice de repartidores) cambian versiones del
+cache compartido: corren dentro de benchmark_database, con los caches en su directorio
+temporal, para que los workers del host no descarten su indice ni sus roles
+"""
+class Command(BaseCommand):
+    help = 'Benchmark de la asignacion de repartidores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, default=100000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--locations', type=int, default=1800)
+        parser.add_argument('--picks', type=int, default=2000)
+        parser.add_argument('--random-picks', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        couriers = options['couriers']
+        locations = options['locations']
+
+        with benchmark_database():
+            start = time.perf_counter()
+            self.seed(rnd, couriers, options['orders'], locations)
+            self.stdout.write(f'Datos sinteticos: {time.perf_counter() - start:.1f} s')
+
+            index = dispatch._index
+            start = time.perf_counter()
+            dispatch.rebuild()
+            self.stdout.write(f'Construccion del indice: {time.perf_counter() - start:.2f} s')
+
+            ubicaciones = [rnd.randint(1, locations) for _ in range(options['picks'])]
+            self.report('indice (peek + carga)', measure(
+                lambda: index.add_carga(index.peek(ubicaciones.pop()), 1), options['picks']))
+
+            ubicaciones = [rnd.randint(1, locations) for _ in range(options['picks'])]
+            self.report('asignar_repartidor', measure(
+                lambda: dispatch.asignar_repartidor(ubicaciones.pop(), excluir_perfil_id=1), options['picks']))
+
+            self.report('ORDER BY RANDOM()', measure(
+                lambda: Colaborador.objects.filter(~Q(user_profile_id=1)).order_by('?').first(),
+                options['random_picks']))
+
+    def report(self, name, timings):
+        self.stdout.write('%-24s p50 %9.3f ms   p99 %9.3f ms' % (
+            name, percentile(timings, 50) * 1000, percentile(timings, 99) * 1000))
+
+    # Crea los datos con ids explicitos (bulk_create no retorna ids en SQLite)
+    def seed(self, rnd, couriers, orders, locations):
+        fecha = datetime.date(1990, 1, 1)
+        Localizacion.objects.bulk_create(
+            [Localizacion(id=i, distrito=f'D{i}', provincia='P', departamento='D') for i in range(1, locations + 1)])
+        # Perfil 1: cliente de todos los pedidos; perfiles 2..n+1: colaboradores
+        bulk_insert(User, (User(id=i, username=f'u{i}', password='!') for i in range(1, couriers + 2)))
+        bulk_insert(Profile, (Profile(id=i, user_id=i, documento_identidad='12345678', fecha_nacimiento=fecha,
+                                      estado='A', genero='NB') for i in range(1, couriers + 2)))
+        Cliente.objects.create(id=1, user_profile_id=1)
+        bulk_insert(Colaborador, (Colaborador(id=i, user_profile_id=i + 1, reputacion=rnd.uniform(1, 5))
+                                  for i in range(1, couriers + 1)))
+        through = Colaborador.cobertura_entrega.through
+        bulk_insert(through, (through(colaborador_id=i, localizacion_id=localizacion_id)
+                              for i in range(1, couriers + 1)
+                              for localizacion_id in rnd.sample(range(1, locations + 1), rnd.randint(1, 3))))
+        # Carga sesgada: pocos repartidores concentran muchos pedidos
+        bulk_insert(Pedido, (Pedido(cliente_id=1, estado='PAG', tarifa=10, ubicacion_id=rnd.randint(1, locations),
+                                    repartidor_id=min(couriers, int(rnd.paretovariate(0.8))))
+                             for _ in range(orders)))
@@ -0,0 +1,347 @@
+import itertools
+import json
+import logging
+import threading
+import time
+import zlib
+from contextlib import ExitStack
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.client import ClientHandler
+from django.urls import Resolver404, resolve, reverse
+
+from main import reference, urls
+from main.models import Cliente, Colaborador, Comerciante, Localizacion, Pedido, Producto, Proveedor
+from main.synthetic import Generador
+
+from ._bench import benchmark_database, percentile
+from ._trace import TrazaSintetica, escribir_traza, leer_traza
+
+"""
+Comando bench_routes: prueba de carga de todas las rutas de main/urls.py
+Genera datos sinteticos a la escala indicada y reproduce una traza de peticiones
+(grabada o sintetica, ver _trace.py) contra la aplicacion WSGI con varios hilos
+Reporta p50/p95/p99, throughput y consultas por ruta, y compara con un baseline guardado
+"""
+
+# Usuarios de cada rol de la traza: [(user_id, id del rol)], ordenados por id
+def usuarios_por_rol():
+    return {
+        'cliente': list(Cliente.objects.order_by('pk').values_list('user_profile__user_id', 'pk')),
+        'colaborador': list(Colaborador.objects.order_by('pk').values_list('user_profile__user_id', 'pk')),
+        'comerciante': list(Comerciante.objects.filter(proveedor__isnull=True).order_by('pk').values_list(
+            'user_profile__user_id', 'pk')),
+        'proveedor': list(Proveedor.objects.filter(comerciante__isnull=False).order_by('pk').values_list(
+            'comerciante__user_profile__user_id', 'pk')),
+    }
+
+
+# Valores $ de los kwargs: (rol, id del rol) -> id o None
+RESOLVER = {
+    '$carrito': lambda rol_id: Pedido.objects.filter(
+        cliente_id=rol_id, estado='EP').values_list('pk', flat=True).first(),
+    '$pagado': lambda rol_id: Pedido.objects.filter(
+        cliente_id=rol_id, estado='PAG').order_by('-pk').values_list('pk', flat=True).first(),
+    '$asignado': lambda rol_id: Pedido.objects.filter(
+        repartidor_id=rol_id, estado='PAG').order_by('pk').values_list('pk', flat=True).first(),
+    '$producto': lambda rol_id: Producto.objects.filter(
+        proveedor_id=rol_id).order_by('pk').values_list('pk', flat=True).first(),
+}
+
+
+# Reproduce las peticiones de la traza; cada usuario tiene su propio cliente (cookies, sesion)
+class Replay:
+    def __init__(self):
+        self.roles = usuarios_por_rol()
+        self.numeros = itertools.count(1)
+        self.turnos = itertools.count()
+        self.local = threading.local()
+        # Como la aplicacion WSGI: un solo handler (middlewares cargados una vez) para todos los hilos
+        self.handler = ClientHandler(enforce_csrf_checks=False)
+
+    # (user_id, id del rol) del usuario de la traza, o None si es anonimo
+    def usuario(self, user):
+        rol, _, numero = (user or '').rpartition('-')
+        if not user or rol == 'anonimo':
+            return None
+        if rol not in self.roles or not numero.isdigit():
+            raise CommandError(f'Unknown trace user: {user}')
+        if not self.roles[rol]:
+            raise CommandError(f'The dataset has no users with role {rol}')
+        return self.roles[rol][int(numero) % len(self.roles[rol])]
+
+    # Hilo que atiende al usuario: las peticiones de un mismo usuario se reproducen en orden
+    def worker(self, entrada, workers):
+        user = entrada.get('user')
+        usuario = self.usuario(user)
+        if usuario:
+            return usuario[0] % workers
+        if user:
+            return zlib.crc32(user.encode()) % workers
+        return next(self.turnos) % workers
+
+    # Cliente de cada usuario en el hilo actual (cada usuario se atiende en un solo hilo)
+    def client(self, user):
+        clients = self.local.clients
+        client = clients.get(user)
+        if client is None:
+            client = clients[user] = Client(raise_request_exception=False)
+            client.handler = self.handler
+            usuario = self.usuario(user)
+            if usuario:
+                client.force_login(User.objects.get(pk=usuario[0]))
+        return client
+
+    # Ruta de la peticion, o None si algun valor $ no se pudo resolver
+    def path(self, entrada):
+        if 'path' in entrada:
+            return entrada['path']
+        kwargs = dict(entrada.get('kwargs') or {})
+        for name, value in kwargs.items():
+            if isinstance(value, str) and value.startswith('$'):
+                usuario = self.usuario(entrada.get('user'))
+                kwargs[name] = RESOLVER[value](usuario[1]) if usuario else None
+                if kwargs[name] is None:
+                    return None
+        path = reverse(entrada['url_name'], kwargs=kwargs)
+        if entrada.get('params'):
+            path += '?' + urlencode(entrada['params'])
+        return path
+
+    def data(self, entrada):
+        data = entrada.get('data') or {}
+        if any(isinstance(value, str) and '{' in value for value in data.values()):
+            n = next(self.numeros)
+            data = {name: value.format(n=n) if isinstance(value, str) else value for name, value in data.items()}
+        return data
+
+    def contar(self, execute, sql, params, many, context):
+        self.local.consultas += 1
+        return execute(sql, params, many, context)
+
+    # En SQLite las transacciones toman el bloqueo de escritura al empezar: con BEGIN diferido,
+    # dos transacciones que leen y luego escriben a la vez fallan con 'database is locked'
+    # en vez de esperar (como OPTIONS transaction_mode='IMMEDIATE' en versiones nuevas de Django)
+    def begin_immediate(self, execute, sql, params, many, context):
+        if sql == 'BEGIN':
+            sql = 'BEGIN IMMEDIATE'
+        return execute(sql, params, many, context)
+
+    # Ejecuta una peticion; retorna (url_name, status, segundos, consultas) o None si se omite
+    def ejecutar(self, entrada):
+        path = self.path(entrada)
+        if path is None:
+            return None
+        client = self.client(entrada.get('user'))
+        data = self.data(entrada)
+        extra = {'HTTP_REFERER': entrada['referer']} if entrada.get('referer') else {}
+        url_name = entrada.get('url_name')
+        if url_name is None:
+            try:
+                url_name = resolve(path.split('?')[0]).url_name
+            except Resolver404:
+                url_name = '(404)'
+
+        self.local.consultas = 0
+        start = time.perf_counter()
+        if entrada.get('method', 'GET').upper() == 'POST':
+            response = client.post(path, data, **extra)
+        else:
+            response = client.generic(entrada.get('method', 'GET').upper(), path, **extra)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = time.perf_counter() - start
+        return url_name, response.status_code, elapsed, self.local.consultas
+
+    # Reproduce una lista de peticiones en el hilo actual
+    def reproducir(self, entradas, resultados):
+        self.local.consultas = 0
+        self.local.clients = {}
+        try:
+            with ExitStack() as stack:
+                if connection.vendor == 'sqlite':
+                    stack.enter_context(connection.execute_wrapper(self.begin_immediate))
+                stack.enter_context(connection.execute_wrapper(self.contar))
+                for entrada in entradas:
+                    resultado = self.ejecutar(entrada)
+                    resultados.append(resultado or (entrada.get('url_name'), None, None, None))
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de carga de todas las rutas (reproduce una traza de peticiones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Escala de los datos sinteticos')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--trace', help='Traza a reproducir (JSON lines); por defecto una sintetica')
+        parser.add_argument('--requests', type=int, default=3000, help='Peticiones de la traza sintetica')
+        parser.add_argument('--write-trace', help='Guarda la traza reproducida en este archivo')
+        parser.add_argument('--workers', type=int, default=4, help='Hilos que envian peticiones a la vez')
+        parser.add_argument('--warmup', type=int, default=200, help='Peticiones iniciales que no se miden')
+        parser.add_argument('--baseline', help='Resultado guardado con el que se compara (JSON)')
+        parser.add_argument('--save-baseline', help='Guarda el resultado en este archivo (JSON)')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Aumento tolerado del p95 y throughput')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Diferencia minima de p95 a reportar')
+        parser.add_argument('--min-requests', type=int, default=20,
+                            help='Peticiones minimas de una ruta para comparar su p95')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        with benchmark_database(shared=workers > 1):
+            start = time.perf_counter()
+            creadas = Generador(escala=options['scale'], semilla=options['seed']).generar()
+            self.stdout.write('Datos sinteticos: %s (%.1f s)' % (
+                ', '.join(f'{n} {tabla}' for tabla, n in creadas.items()), time.perf_counter() - start))
+
+            entradas = self.traza(options)
+            if options['write_trace']:
+                escribir_traza(options['write_trace'], entradas)
+
+            replay = Replay()
+            warmup, medidas = entradas[:options['warmup']], entradas[options['warmup']:]
+            colas = [[] for _ in range(workers)]
+            for entrada in medidas:
+                colas[replay.worker(entrada, workers)].append(entrada)
+
+            # Como en produccion: sin DEBUG (registro de consultas, pagina de error detallada)
+            # y con los archivos estaticos sin manifest (no requiere collectstatic)
+            # Los streams de pedidos en vivo terminan despues del estado inicial: se mide la
+            # conexion y no los SSE_MAX_DURATION segundos de espera
+            produccion = override_settings(
+                DEBUG=False, ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+                STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                SSE_MAX_DURATION=0)
+            # Los errores se cuentan por ruta; el traceback de cada 500 no se imprime
+            logger = logging.getLogger('django.request')
+            nivel = logger.level
+            logger.setLevel(logging.CRITICAL)
+            try:
+                produccion.enable()
+                replay.handler.load_middleware()
+                replay.reproducir(warmup, [])
+                resultados = [[] for _ in range(workers)]
+                hilos = [threading.Thread(target=replay.reproducir, args=(cola, resultado))
+                         for cola, resultado in zip(colas, resultados)]
+                start = time.perf_counter()
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                duracion = time.perf_counter() - start
+            finally:
+                produccion.disable()
+                logger.setLevel(nivel)
+
+        resultado = self.resumen([r for parcial in resultados for r in parcial], duracion)
+        resultado['config'] = {
+            'scale': options['scale'], 'seed': options['seed'], 'workers': workers,
+            'trace': options['trace'] or f'synthetic:{options["requests"]}', 'warmup': options['warmup']}
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as archivo:
+                baseline = json.load(archivo)
+        regresiones = self.reporte(resultado, baseline, options)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as archivo:
+                json.dump(resultado, archivo, indent=2, sort_keys=True)
+        if regresiones:
+            raise CommandError(f'{regresiones} regressions against {options["baseline"]}')
+
+    def traza(self, options):
+        if options['trace']:
+            return list(leer_traza(options['trace']))
+        traza = TrazaSintetica(
+            Producto.objects.values_list('pk', flat=True),
+            [(categoria.pk, categoria.nombre) for categoria in reference.categorias.all()],
+            Localizacion.objects.values_list('pk', flat=True),
+            semilla=options['seed'])
+        return list(traza.generar(options['requests'] + options['warmup']))
+
+    # Estadisticas por ruta
+    def resumen(self, resultados, duracion):
+        por_ruta = {}
+        omitidas = {}
+        for url_name, status, elapsed, consultas in resultados:
+            if status is None:
+                omitidas[url_name] = omitidas.get(url_name, 0) + 1
+            else:
+                por_ruta.setdefault(url_name, []).append((status, elapsed, consultas))
+        rutas = {}
+        for url_name, medidas in por_ruta.items():
+            # Las latencias son de las respuestas correctas (los errores se cuentan aparte)
+            tiempos = [elapsed for status, elapsed, _ in medidas if status < 400] or [
+                elapsed for _, elapsed, _ in medidas]
+            consultas = [n for _, _, n in medidas]
+            rutas[url_name] = {
+                'requests': len(medidas),
+                'errors': sum(1 for status, _, _ in medidas if status >= 400),
+                'p50': percentile(tiempos, 50) * 1000,
+                'p95': percentile(tiempos, 95) * 1000,
+                'p99': percentile(tiempos, 99) * 1000,
+                'queries': sum(consultas) / len(consultas),
+                'max_queries': max(consultas),
+            }
+        total = sum(ruta['requests'] for ruta in rutas.values())
+        return {'routes': rutas, 'skipped': omitidas, 'requests': total, 'seconds': duracion,
+                'throughput': total / duracion if duracion else 0.0}
+
+    # Imprime el reporte; retorna la cantidad de regresiones frente al baseline
+    def reporte(self, resultado, baseline, options):
+        base_rutas = (baseline or {}).get('routes', {})
+        if baseline and baseline.get('config') != resultado['config']:
+            self.stdout.write(self.style.WARNING(
+                f'The baseline was measured with a different configuration: {baseline.get("config")}'))
+
+        self.stdout.write('%-22s %6s %5s %8s %8s %8s %9s %4s  %s' % (
+            'ruta', 'n', 'err', 'p50 ms', 'p95 ms', 'p99 ms', 'consultas', 'max', 'baseline' if baseline else ''))
+        regresiones = 0
+        for url_name, ruta in sorted(resultado['routes'].items()):
+            comparacion = ''
+            if baseline:
+                problemas, comparacion = self.comparar(ruta, base_rutas.get(url_name), options)
+                if problemas:
+                    regresiones += 1
+                    comparacion = self.style.ERROR(comparacion)
+            self.stdout.write('%-22s %6d %5d %8.2f %8.2f %8.2f %9.1f %4d  %s' % (
+                url_name, ruta['requests'], ruta['errors'], ruta['p50'], ruta['p95'], ruta['p99'],
+                ruta['queries'], ruta['max_queries'], comparacion))
+
+        self.stdout.write('Total: %d peticiones en %.1f s, %.1f peticiones/s (%d hilos)' % (
+            resultado['requests'], resultado['seconds'], resultado['throughput'], resultado['config']['workers']))
+        if baseline and resultado['throughput'] < baseline['throughput'] * (1 - options['tolerance']):
+            regresiones += 1
+            self.stdout.write(self.style.ERROR('Throughput: %.1f peticiones/s en el baseline' % baseline['throughput']))
+        if resultado['skipped']:
+            self.stdout.write('Omitidas (sin pedido o producto para el usuario): ' + ', '.join(
+                f'{url_name} {n}' for url_name, n in sorted(resultado['skipped'].items())))
+        sin_trafico = [pattern.name for pattern in urls.urlpatterns
+                       if pattern.name and pattern.name not in resultado['routes']]
+        if sin_trafico:
+            self.stdout.write(self.style.WARNING('Rutas sin peticiones medidas: ' + ', '.join(sin_trafico)))
+        return regresiones
+
+    # Compara una ruta con el baseline; retorna (hay regresion, descripcion)
+    def comparar(self, ruta, base, options):
+        if base is None:
+            return False, 'nueva'
+        problemas = []
+        if (min(ruta['requests'], base['requests']) >= options['min_requests']
+                and ruta['p95'] > base['p95'] * (1 + options['tolerance'])
+                and ruta['p95'] - base['p95'] > options['min_delta_ms']):
+            problemas.append('p95 %+.0f%%' % ((ruta['p95'] / base['p95'] - 1) * 100))
+        if ruta['max_queries'] > base['max_queries']:
+            problemas.append('consultas %d -> %d' % (base['max_queries'], ruta['max_queries']))
+        if ruta['errors'] / ruta['requests'] > base['errors'] / base['requests']:
+            problemas.append('errores %d -> %d' % (base['errors'], ruta['errors']))
+        if problemas:
+            return True, 'REGRESION: ' + ', '.join(problemas)
+        return False, 'p95 %+.0f%%' % ((ruta['p95'] / base['p95'] - 1) * 100 if base['p95'] else 0)
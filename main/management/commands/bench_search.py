@@ -0,0 +1,84 @@
+import itertools
+import random
+
+from django.core.management.base import BaseCommand
+
+from main.models import Categoria, Producto, Proveedor
+from main.search import ORMSearchBackend, get_search_backend
+
+from ._bench import benchmark_database, bulk_insert, measure, percentile
+
+"""
+Comando bench_search: mide la latencia de la busqueda de productos
+Compara el backend configurado contra el filtro original (nombre__icontains)
+con catalogos sinteticos de distintos tamanos y palabras de distinta frecuencia
+"""
+class Command(BaseCommand):
+    help = 'Benchmark de la busqueda de productos a distintos tamanos de catalogo'
+
+    # Tamano del vocabulario sintetico (frecuencia de palabras tipo Zipf)
+    vocabulary_size = 20000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=20, help='Consultas por tipo de palabra')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.vocabulary = ['w%05d' % i for i in range(self.vocabulary_size)]
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(self.vocabulary_size)))
+        page_size = options['page_size']
+
+        # Tipos de consulta segun la frecuencia de la palabra buscada
+        query_kinds = [
+            ('frecuente', self.vocabulary[:10]),
+            ('media', self.vocabulary[100:1000]),
+            ('rara', self.vocabulary[5000:]),
+            ('sin resultados', ['zz%04d' % i for i in range(1000)]),
+        ]
+
+        with benchmark_database():
+            categorias = Categoria.objects.bulk_create(
+                [Categoria(codigo=str(i), nombre='categoria%d' % i) for i in range(50)])
+            proveedores = Proveedor.objects.bulk_create(
+                [Proveedor(ruc='%011d' % i, razon_social='proveedor%d' % i, telefono='999999999') for i in range(500)])
+            backend = get_search_backend()
+            legacy = ORMSearchBackend()
+            cases = [
+                ('icontains (original)', lambda q: list(Producto.objects.filter(nombre__icontains=q)[:page_size])),
+                ('icontains (4 campos)', lambda q: list(legacy.search(q)[:page_size])),
+                (type(backend).__name__, lambda q: list(backend.search(q)[:page_size])),
+            ]
+
+            self.stdout.write('%10s %-15s %-22s %10s %10s' % ('productos', 'palabra', 'backend', 'p50 ms', 'p95 ms'))
+            total = 0
+            for size in sorted(options['sizes']):
+                bulk_insert(Producto, (self.producto(categorias, proveedores) for _ in range(total, size)))
+                total = size
+                backend.rebuild()
+
+                for kind, words in query_kinds:
+                    queries = [self.random.choice(words) for _ in range(options['queries'])]
+                    for name, run in cases:
+                        timings = []
+                        for query in queries:
+                            timings.extend(measure(lambda: run(query), 1))
+                        self.stdout.write('%10d %-15s %-22s %10.2f %10.2f' % (
+                            size, kind, name,
+                            percentile(timings, 50) * 1000,
+                            percentile(timings, 95) * 1000))
+
+    def words(self, k):
+        return self.random.choices(self.vocabulary, cum_weights=self.cum_weights, k=k)
+
+    def producto(self, categorias, proveedores):
+        return Producto(
+            nombre=' '.join(self.words(2))[:20],
+            descripcion=' '.join(self.words(12)),
+            precio=round(self.random.uniform(1, 500), 2),
+            estado='ACT',
+            descuento=0,
+            categoria=self.random.choice(categorias),
+            proveedor=self.random.choice(proveedores))
@@ -0,0 +1,130 @@
+import random
+import shutil
+import tempfile
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from ._bench import benchmark_database, measure, percentile
+
+"""
+Comando bench_sessions: mide el costo de la sesion y los mensajes por peticion
+para cada modo de sesion (SESSION_MODE) y backend del cache de sesiones
+Cada peticion pasa solo por SessionMiddleware y MessageMiddleware con una vista
+minima, asi la medicion no incluye el resto de la aplicacion
+Escenarios:
+    lectura  la vista lee la sesion (usuario autenticado, roles vigentes)
+    escritura la vista modifica la sesion (roles vencidos que se vuelven a guardar)
+    mensaje  la vista agrega un mensaje (pago o cancelacion de un pedido)
+"""
+
+# Modos a comparar: (nombre, SESSION_ENGINE, cache de sesiones)
+# 'file (django)' es el backend de archivos de Django, sin main.cache
+MODOS = [
+    ('db', 'django.contrib.sessions.backends.db', None),
+    ('cached_db (file)', 'django.contrib.sessions.backends.cached_db', 'file'),
+    ('cached_db (file, django)', 'django.contrib.sessions.backends.cached_db', 'file (django)'),
+    ('cached_db (memory)', 'django.contrib.sessions.backends.cached_db', 'memory'),
+    ('cache (file)', 'django.contrib.sessions.backends.cache', 'file'),
+    ('cache (file, django)', 'django.contrib.sessions.backends.cache', 'file (django)'),
+    ('cache (memory)', 'django.contrib.sessions.backends.cache', 'memory'),
+    ('signed_cookies', 'django.contrib.sessions.backends.signed_cookies', None),
+]
+
+
+def vista_lectura(request):
+    request.session.get('_auth_user_id')
+    request.session.get('_roles')
+    return HttpResponse()
+
+
+def vista_escritura(request):
+    roles = dict(request.session['_roles'])
+    roles['time'] += 1
+    request.session['_roles'] = roles
+    return HttpResponse()
+
+
+def vista_mensaje(request):
+    request.session.get('_auth_user_id')
+    messages.success(request, 'Gracias por tu compra! Un repartidor ha sido asignado a tu pedido.')
+    return HttpResponse()
+
+
+ESCENARIOS = [
+    ('lectura', vista_lectura),
+    ('escritura', vista_escritura),
+    ('mensaje', vista_mensaje),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark del costo por peticion de cada modo de sesion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=2000, help='Sesiones guardadas antes de medir')
+        parser.add_argument('--requests', type=int, default=2000, help='Peticiones por modo y escenario')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.factory = RequestFactory()
+        self.stdout.write('%-26s %-10s %10s %10s %12s' % ('modo', 'escenario', 'p50 ms', 'p95 ms', 'consultas'))
+        with benchmark_database():
+            for nombre, engine, backend in MODOS:
+                directorio = tempfile.mkdtemp(prefix='linioexp-bench-sessions-')
+                try:
+                    with override_settings(SESSION_ENGINE=engine, CACHES=self.caches(backend, directorio)):
+                        self.medir(nombre, engine, options)
+                finally:
+                    shutil.rmtree(directorio, ignore_errors=True)
+
+    # Cache de sesiones del modo (los de archivos en un directorio temporal)
+    def caches(self, backend, directorio):
+        opciones = {'MAX_ENTRIES': settings.SESSION_CACHE_MAX_ENTRIES}
+        sesiones = {
+            'memory': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-sessions'},
+            'file': {'BACKEND': 'main.cache.FileBasedCache', 'LOCATION': directorio,
+                     'OPTIONS': dict(opciones, CULL_INTERVAL=100)},
+            'file (django)': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': directorio},
+        }.get(backend, {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+        sesiones.setdefault('OPTIONS', opciones)
+        return dict(settings.CACHES, **{settings.SESSION_CACHE_ALIAS: sesiones})
+
+    def medir(self, nombre, engine, options):
+        store = import_module(engine).SessionStore
+        keys = [self.crear_sesion(store, i) for i in range(options['sessions'])]
+        for escenario, vista in ESCENARIOS:
+            middleware = SessionMiddleware(MessageMiddleware(vista))
+            timings = []
+            consultas = []
+            with connection.execute_wrapper(lambda execute, *args: consultas.append(1) or execute(*args)):
+                for _ in range(options['requests']):
+                    request = self.factory.get('/')
+                    request.COOKIES[settings.SESSION_COOKIE_NAME] = self.random.choice(keys)
+                    timings.extend(measure(lambda: middleware(request), 1))
+            self.stdout.write('%-26s %-10s %10.3f %10.3f %12.2f' % (
+                nombre, escenario,
+                percentile(timings, 50) * 1000,
+                percentile(timings, 95) * 1000,
+                len(consultas) / options['requests']))
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+
+    # Sesion de un usuario autenticado, como la que guarda el login y get_roles
+    def crear_sesion(self, store, i):
+        session = store()
+        session['_auth_user_id'] = str(i)
+        session['_auth_user_backend'] = 'django.contrib.auth.backends.ModelBackend'
+        session['_auth_user_hash'] = '%064x' % self.random.getrandbits(256)
+        session['_roles'] = {'user': i, 'version': 0, 'time': 0, 'ids': {'profile': i, 'cliente': i}}
+        session.save()
+        return session.session_key
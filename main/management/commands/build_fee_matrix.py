@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.tarifas import get_matrix
+
+"""
+Comando build_fee_matrix: reconstruye la matriz de tarifas de envio
+Se usa despues de cargar localizaciones con fixtures (loaddata) o cargas masivas
+"""
+class Command(BaseCommand):
+    help = 'Reconstruye la matriz de tarifas de envio'
+
+    def handle(self, *args, **options):
+        matrix = get_matrix()
+        matrix.build()
+        matrix.ensure_current()
+        self.stdout.write(self.style.SUCCESS(
+            f'Matriz de tarifas reconstruida: {len(matrix.slots)} localizaciones en {matrix.path}'))
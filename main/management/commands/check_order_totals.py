@@ -0,0 +1,50 @@
+from django.db.models import F, Q
+from django.db.models.functions import Abs, Coalesce
+from django.core.management.base import BaseCommand
+
+from main.models import Pedido
+
+"""
+Comando check_order_totals: compara los totales materializados de los pedidos
+con el agregado calculado desde DetallePedido; con --fix los corrige
+El agregado usa el precio guardado en cada detalle: un cambio de precio del producto
+no vuelve inconsistentes (ni cambia con --fix) los pedidos ya pagados
+"""
+class Command(BaseCommand):
+    help = 'Verifica (y opcionalmente corrige) los totales materializados de los pedidos'
+
+    # Pedidos corregidos por cada UPDATE
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recalcula los pedidos inconsistentes')
+        parser.add_argument('--tolerance', type=float, default=0.005)
+        parser.add_argument('--show', type=int, default=20, help='Pedidos inconsistentes a listar')
+
+    def handle(self, *args, **options):
+        tolerance = options['tolerance']
+        # Todo el calculo se hace en la base de datos
+        inconsistentes = Pedido.objects.annotate(
+            calculado=Pedido.subtotal_calculado(),
+        ).annotate(
+            diff_subtotal=Abs(F('subtotal') - F('calculado')),
+            diff_total=Abs(F('total') - F('calculado') - Coalesce('tarifa', 0.0)),
+        ).filter(Q(diff_subtotal__gt=tolerance) | Q(diff_total__gt=tolerance)).order_by('pk')
+
+        ids = list(inconsistentes.values_list('pk', flat=True))
+        if not ids:
+            self.stdout.write(self.style.SUCCESS('Todos los totales son consistentes'))
+            return
+
+        for pedido in inconsistentes[:options['show']]:
+            self.stdout.write(
+                f'Pedido {pedido.pk}: subtotal {pedido.subtotal} (calculado {pedido.calculado}), '
+                f'total {pedido.total}, tarifa {pedido.tarifa}')
+        self.stdout.write(self.style.WARNING(f'{len(ids)} pedidos inconsistentes'))
+
+        if options['fix']:
+            for start in range(0, len(ids), self.batch_size):
+                batch = Pedido.objects.filter(pk__in=ids[start:start + self.batch_size])
+                batch.update(subtotal=Pedido.subtotal_calculado())
+                batch.update(total=F('subtotal') + Coalesce('tarifa', 0.0))
+            self.stdout.write(self.style.SUCCESS(f'{len(ids)} pedidos corregidos'))
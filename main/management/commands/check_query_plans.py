@@ -0,0 +1,99 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from main.export import ventas
+from main.models import Comment, Pedido, DetallePedido, Producto, VentaDiaria
+
+"""
+Comando check_query_plans: revisa con EXPLAIN que las consultas mas frecuentes
+(carrito, pedidos del repartidor, detalle del pedido, catalogo) usen un indice
+Falla si alguna recorre la tabla completa o necesita ordenar fuera del indice
+"""
+
+# Consultas: (descripcion, queryset)
+# Los valores de los filtros no importan, el plan no depende de ellos
+def consultas():
+    return [
+        ('Carrito del cliente (get_or_create EP)',
+         Pedido.objects.filter(cliente_id=1, estado='EP')),
+        ('Pedidos del repartidor por estado',
+         Pedido.objects.filter(repartidor_id=1, estado='PAG')),
+        ('Pedidos de un cliente, recientes primero (rama de la lista de pedidos)',
+         Pedido.objects.filter(cliente_id=1, estado__in=['PAG', 'ENT']).order_by('-id').values('pk')[:25]),
+        ('Pedidos de un repartidor, recientes primero (rama de la lista de pedidos)',
+         Pedido.objects.filter(repartidor_id=1, estado__in=['PAG', 'ENT']).order_by('-id').values('pk')[:25]),
+        ('Repartidor con pedidos (inicio)',
+         Pedido.objects.filter(repartidor_id=1).values('pk')[:1]),
+        ('Detalle de un producto en el pedido (get_or_create)',
+         DetallePedido.objects.filter(pedido_id=1, producto_id=1)),
+        ('Detalle de un pedido',
+         DetallePedido.objects.filter(pedido_id=1)),
+        ('Pagina del hilo de comentarios de un pedido',
+         Comment.objects.filter(pedido_id=1, id__lt=100).order_by('-id')[:21]),
+        ('Comentarios nuevos de un pedido',
+         Comment.objects.filter(pedido_id=1, id__gt=100).order_by('id')[:101]),
+        ('Productos de una categoria, recientes primero',
+         Producto.objects.filter(categoria_id=1).order_by('-id')[:24]),
+        ('Productos por precio',
+         Producto.objects.order_by('precio', 'id')[:24]),
+        ('Ventas de un grupo de productos (exportacion)',
+         ventas([1, 2, 3])),
+        ('Resumen diario de ventas del proveedor',
+         VentaDiaria.objects.filter(proveedor_id=1, fecha__range=('2020-01-01', '2020-01-31'))),
+    ]
+
+
+# Problemas del plan segun la base de datos; lista vacia si usa indices
+def problemas_sqlite(plan):
+    problemas = []
+    for line in plan.splitlines():
+        match = re.search(r'\bSCAN (?:TABLE )?(\w+)(.*)', line)
+        if match and 'USING' not in match.group(2):
+            problemas.append(f'full scan of {match.group(1)}')
+        if 'USE TEMP B-TREE FOR ORDER BY' in line:
+            problemas.append('sort outside an index')
+    return problemas
+
+
+def problemas_postgresql(plan):
+    problemas = [f'sequential scan of {table}' for table in re.findall(r'Seq Scan on (\w+)', plan)]
+    if re.search(r'^\s*(->\s*)?Sort\b', plan, re.MULTILINE):
+        problemas.append('sort outside an index')
+    return problemas
+
+
+class Command(BaseCommand):
+    help = 'Verifica que las consultas frecuentes usen indices (EXPLAIN)'
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Query plans are not checked on {vendor}')
+
+        fallidas = 0
+        for descripcion, queryset in consultas():
+            with transaction.atomic():
+                if vendor == 'postgresql':
+                    # En tablas pequenas PostgreSQL prefiere recorrerlas; se pregunta si puede usar un indice
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+                    plan = queryset.explain()
+                    problemas = problemas_postgresql(plan)
+                else:
+                    plan = queryset.explain()
+                    problemas = problemas_sqlite(plan)
+
+            if problemas:
+                fallidas += 1
+                self.stdout.write(self.style.ERROR(f'FALLA  {descripcion}: {", ".join(problemas)}'))
+            else:
+                self.stdout.write(f'OK     {descripcion}')
+            if problemas or options['verbosity'] > 1:
+                for line in plan.splitlines():
+                    self.stdout.write(f'         {line}')
+
+        if fallidas:
+            raise CommandError(f'{fallidas} consultas sin indice')
+        self.stdout.write(self.style.SUCCESS('Todas las consultas usan indices'))
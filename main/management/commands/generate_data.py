@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.synthetic import VOLUMEN, Generador
+
+"""
+Comando generate_data: llena la base de datos con datos sinteticos de gran volumen
+(usuarios con todos los roles, catalogo, pedidos y detalles) para pruebas de carga
+Los datos se agregan a los existentes; la misma semilla genera los mismos datos con
+cualquier cantidad de procesos
+"""
+class Command(BaseCommand):
+    help = 'Genera datos sinteticos de gran volumen (usuarios, productos, pedidos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help='Multiplica el volumen base: ' + ', '.join(
+                                f'{n} {tabla}' for tabla, n in VOLUMEN.items()))
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Procesos que generan las filas')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por INSERT')
+        for tabla in VOLUMEN:
+            parser.add_argument(f'--{tabla}', type=int, help=f'Cantidad de {tabla} (reemplaza a la escala)')
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0 or options['batch_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--scale, --batch-size and --workers must be positive')
+        volumen = {tabla: options[tabla] for tabla in VOLUMEN if options[tabla] is not None}
+        if any(n <= 0 for n in volumen.values()):
+            raise CommandError('Table volumes must be positive')
+
+        inicio = {}
+
+        def progreso(tabla, filas, total):
+            if not filas:
+                inicio[tabla] = time.perf_counter()
+            elif options['verbosity'] > 1 or filas == total:
+                elapsed = time.perf_counter() - inicio[tabla]
+                self.stdout.write(f'{tabla}: {filas}/{total} ({filas / max(elapsed, 1e-9):.0f}/s)')
+
+        generador = Generador(escala=options['scale'], semilla=options['seed'], batch_size=options['batch_size'],
+                              workers=options['workers'], volumen=volumen, progreso=progreso)
+        start = time.perf_counter()
+        creadas = generador.generar()
+        elapsed = time.perf_counter() - start
+
+        total = sum(creadas.values())
+        for tabla, n in creadas.items():
+            self.stdout.write(f'{tabla}: {n} creados')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} filas generadas en {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)'))
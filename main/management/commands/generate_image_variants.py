@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main.images import procesar_imagen
+from main.models import ProductoImage
+
+"""
+Comando generate_image_variants: genera las variantes (thumb, card, detail) de las
+imagenes de productos que aun no las tienen; con --all las regenera todas
+Se usa para las imagenes cargadas antes de las variantes o si fallo el hilo de fondo
+"""
+class Command(BaseCommand):
+    help = 'Genera las variantes de las imagenes de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenera tambien las que ya tienen variantes')
+
+    def handle(self, *args, **options):
+        imagenes = ProductoImage.objects.exclude(Q(image='') | Q(image__isnull=True))
+        if not options['all']:
+            imagenes = imagenes.filter(Q(card='') | Q(card__isnull=True))
+        procesadas = errores = 0
+        for imagen_id in imagenes.order_by('pk').values_list('pk', flat=True).iterator():
+            try:
+                procesar_imagen(imagen_id)
+                procesadas += 1
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f'Imagen {imagen_id}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'{procesadas} imagenes procesadas, {errores} con errores'))
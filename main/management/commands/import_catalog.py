@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.catalog_import import CatalogImporter, RegistroInvalido, iter_records
+
+"""
+Comando import_catalog: importa el catalogo desde archivos JSON (formato de fixture,
+como linioData.json) o NDJSON, leyendolos por partes y escribiendo por lotes
+Reemplaza a loaddata para cargas grandes; los registros invalidos se reportan y se omiten
+"""
+class Command(BaseCommand):
+    help = 'Importa categorias, localizaciones, proveedores y productos desde JSON o NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--format', choices=['auto', 'json', 'ndjson'], default='auto')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Registros por transaccion')
+        parser.add_argument('--strict', action='store_true', help='Se detiene en el primer registro invalido')
+        parser.add_argument('--show', type=int, default=20, help='Registros invalidos a listar')
+
+    def handle(self, *args, **options):
+        errores = 0
+
+        def on_error(model, pk, mensaje):
+            nonlocal errores
+            errores += 1
+            if errores <= options['show']:
+                nombre = model._meta.label_lower if model else 'registro'
+                if pk is not None:
+                    nombre += f' pk={pk}'
+                self.stderr.write(f'{nombre}: {mensaje}')
+
+        importer = CatalogImporter(options['batch_size'], options['strict'], on_error)
+        start = time.perf_counter()
+        try:
+            for path in options['files']:
+                with open(path, encoding='utf-8') as stream:
+                    for record in iter_records(stream, options['format']):
+                        importer.add(record)
+            importer.finish()
+        except RegistroInvalido as e:
+            raise CommandError(f'Invalid record: {e}')
+        except ValueError as e:
+            raise CommandError(f'Could not parse {path}: {e}')
+        elapsed = time.perf_counter() - start
+
+        total = 0
+        for model, stats in importer.stats.items():
+            total += stats['creados'] + stats['actualizados']
+            if any(stats.values()):
+                self.stdout.write(
+                    f"{model._meta.label_lower}: {stats['creados']} creados, "
+                    f"{stats['actualizados']} actualizados, {stats['invalidos']} invalidos")
+        if errores:
+            self.stdout.write(self.style.WARNING(f'{errores} registros invalidos omitidos'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} registros importados en {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)'))
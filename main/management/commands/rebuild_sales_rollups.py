@@ -0,0 +1,35 @@
+import argparse
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import ventas
+
+"""
+Comando rebuild_sales_rollups: recalcula el resumen diario de ventas (VentaDiaria)
+desde los pedidos pagados y entregados
+Se usa para llenar la tabla por primera vez, despues de cargas masivas o para
+corregir el resumen de un rango de fechas o de un proveedor
+"""
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen diario de ventas por proveedor y categoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=fecha, help='Primer dia a recalcular (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=fecha, help='Ultimo dia a recalcular (AAAA-MM-DD)')
+        parser.add_argument('--proveedor', type=int, help='Recalcula solo las ventas de este proveedor')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde must not be after --hasta')
+        creadas = ventas.reconstruir(options['desde'], options['hasta'], options['proveedor'],
+                                     batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Resumen de ventas reconstruido: {creadas} filas'))
+
+
+def fecha(valor):
+    try:
+        return datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date: {valor} (expected YYYY-MM-DD)')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.search import get_search_backend
+
+"""
+Comando rebuild_search_index: reconstruye el indice de busqueda de productos
+Se usa despues de cargar fixtures (loaddata) o cargas masivas
+"""
+class Command(BaseCommand):
+    help = 'Reconstruye el indice de busqueda de productos'
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS('Indice de busqueda reconstruido'))
@@ -0,0 +1,108 @@
+import datetime
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from main import slowlog
+
+from ._bench import percentile
+from .check_query_plans import problemas_postgresql, problemas_sqlite
+from .rebuild_sales_rollups import fecha
+
+"""
+Comando slow_queries: resume el registro de consultas lentas (main/slowlog.py)
+Agrupa las consultas por huella y muestra las que mas tiempo suman (o las mas
+frecuentes, o las mas lentas), con sus vistas, la linea que las hace, su SQL y los
+problemas de su plan (recorridos completos, ordenamientos fuera de un indice)
+"""
+
+ORDENES = {
+    'total': lambda grupo: grupo['total'],
+    'count': lambda grupo: grupo['count'],
+    'max': lambda grupo: grupo['max'],
+    'p95': lambda grupo: percentile(grupo['tiempos'], 95),
+}
+
+PROBLEMAS = {'sqlite': problemas_sqlite, 'postgresql': problemas_postgresql}
+
+
+class Command(BaseCommand):
+    help = 'Resume las consultas lentas registradas (SLOW_QUERY_LOG)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Consultas a mostrar')
+        parser.add_argument('--sort', choices=sorted(ORDENES), default='total',
+                            help='total: tiempo sumado, count: ejecuciones, max/p95: duracion')
+        parser.add_argument('--view', help='Solo las consultas de esta vista (nombre de la url)')
+        parser.add_argument('--desde', type=fecha, help='Solo las consultas desde este dia (AAAA-MM-DD)')
+        parser.add_argument('--explain', action='store_true', help='Muestra el plan de cada consulta')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = timezone.make_aware(datetime.datetime.combine(options['desde'], datetime.time()))
+
+        grupos = {}
+        for entrada in slowlog.entradas():
+            if options['view'] and entrada.get('view') != options['view']:
+                continue
+            if desde and datetime.datetime.fromisoformat(entrada['time']) < desde:
+                continue
+            grupo = grupos.setdefault(entrada['fingerprint'], {
+                'sql': entrada['sql'], 'alias': entrada.get('alias', 'default'), 'explain': None,
+                'count': 0, 'total': 0.0, 'max': 0.0, 'tiempos': [],
+                'vistas': Counter(), 'origenes': Counter(),
+            })
+            grupo['count'] += 1
+            grupo['total'] += entrada['ms']
+            grupo['max'] = max(grupo['max'], entrada['ms'])
+            grupo['tiempos'].append(entrada['ms'])
+            grupo['vistas'][entrada.get('view') or '(sin peticion)'] += 1
+            grupo['origenes'][entrada.get('frame') or '(desconocido)'] += 1
+            grupo['explain'] = grupo['explain'] or entrada.get('explain')
+
+        if not grupos:
+            raise CommandError(f'No slow queries in {slowlog.log_path()}')
+
+        ordenados = sorted(grupos.items(), key=lambda item: ORDENES[options['sort']](item[1]), reverse=True)
+        total = sum(grupo['count'] for grupo in grupos.values())
+        self.stdout.write(f'{total} consultas lentas, {len(grupos)} distintas ({slowlog.log_path()})')
+        for posicion, (fingerprint, grupo) in enumerate(ordenados[:options['top']], 1):
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(
+                f'#{posicion} {fingerprint}  {grupo["count"]} ejecuciones  total {grupo["total"] / 1000:.2f} s  '
+                f'p95 {percentile(grupo["tiempos"], 95):.1f} ms  max {grupo["max"]:.1f} ms'))
+            self.stdout.write(f'   vistas:  {contar(grupo["vistas"])}')
+            self.stdout.write(f'   origen:  {contar(grupo["origenes"])}')
+            sql = grupo['sql'] if options['verbosity'] > 1 else recortar(grupo['sql'], 300)
+            self.stdout.write(f'   sql:     {sql}')
+            self.escribir_plan(grupo, options['explain'])
+
+    def escribir_plan(self, grupo, completo):
+        plan = grupo['explain']
+        if not plan:
+            self.stdout.write('   plan:    (sin plan: no es un SELECT o no se pudo obtener)')
+            return
+        vendor = connections[grupo['alias']].vendor if grupo['alias'] in connections else None
+        problemas = PROBLEMAS[vendor]('\n'.join(plan)) if vendor in PROBLEMAS else []
+        if problemas:
+            self.stdout.write(self.style.ERROR(f'   plan:    {", ".join(problemas)}'))
+        elif not completo:
+            self.stdout.write('   plan:    usa indices')
+        if completo:
+            for linea in plan:
+                self.stdout.write(f'            {linea}')
+
+
+# 'a (3), b (1)': los valores mas frecuentes con sus cantidades
+def contar(contador, maximo=3):
+    texto = ', '.join(f'{valor} ({cantidad})' for valor, cantidad in contador.most_common(maximo))
+    if len(contador) > maximo:
+        texto += f', {len(contador) - maximo} mas'
+    return texto
+
+
+def recortar(texto, largo):
+    return texto if len(texto) <= largo else texto[:largo - 3] + '...'
@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+"""
+Comando startup_profile: mide el arranque de un proceso nuevo, por etapa y por import
+Cada corrida es un interprete nuevo (python -X importtime) que carga lo mismo que:
+    manage   un comando de manage.py (release: migrate): settings y apps
+    wsgi     un worker WSGI (linioexp.wsgi)
+    asgi     un worker de gunicorn sin preload (linioexp.asgi)
+    preload  el proceso principal de gunicorn con preload_app (linioexp.asgi con APP_WARMUP)
+Reporta la mediana de cada etapa y los paquetes y modulos que mas tardan en importarse
+"""
+
+# Codigo de cada corrida: imprime [(etapa, ms)] como JSON en la ultima linea
+CODIGO = '''
+import json, os, sys, time
+etapas = []
+inicio = time.perf_counter()
+
+def etapa(nombre):
+    global inicio
+    fin = time.perf_counter()
+    etapas.append((nombre, (fin - inicio) * 1000))
+    inicio = fin
+
+import django
+etapa('django')
+from django.conf import settings
+settings.INSTALLED_APPS
+etapa('settings')
+django.setup()
+etapa('apps')
+objetivo = sys.argv[1]
+if objetivo == 'wsgi':
+    import linioexp.wsgi
+    etapa('wsgi')
+elif objetivo in ('asgi', 'preload'):
+    import linioexp.asgi
+    etapa('asgi' if objetivo == 'asgi' else 'asgi + warmup')
+print(json.dumps(etapas))
+'''
+
+OBJETIVOS = ('manage', 'wsgi', 'asgi', 'preload')
+
+# Linea de -X importtime: 'import time:  self [us] | cumulative | paquete' (sangria = profundidad)
+IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de arranque de un proceso nuevo por etapa y por import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=OBJETIVOS, default='asgi', help='Que carga el proceso medido')
+        parser.add_argument('--runs', type=int, default=5, help='Corridas (se reporta la mediana)')
+        parser.add_argument('--top', type=int, default=15, help='Paquetes y modulos a mostrar')
+
+    def handle(self, *args, **options):
+        corridas = [self.correr(options['target']) for _ in range(max(options['runs'], 1))]
+
+        self.stdout.write(f'Arranque de un proceso {options["target"]} (mediana de {len(corridas)} corridas)')
+        total = 0.0
+        for nombre in [nombre for nombre, _ in corridas[0][0]]:
+            ms = statistics.median(dict(etapas)[nombre] for etapas, _ in corridas)
+            total += ms
+            self.stdout.write(f'  {nombre:<16} {ms:8.1f} ms')
+        self.stdout.write(f'  {"total":<16} {total:8.1f} ms')
+
+        # Tiempo propio de cada modulo (sin sus imports), mediana entre corridas
+        propio = defaultdict(list)
+        acumulado = defaultdict(list)
+        for _, imports in corridas:
+            for modulo, (self_us, acumulado_us) in imports.items():
+                propio[modulo].append(self_us)
+                acumulado[modulo].append(acumulado_us)
+        propio = {modulo: statistics.median(valores) / 1000 for modulo, valores in propio.items()}
+        acumulado = {modulo: statistics.median(valores) / 1000 for modulo, valores in acumulado.items()}
+
+        paquetes = defaultdict(float)
+        for modulo, ms in propio.items():
+            paquetes[modulo.split('.')[0]] += ms
+        self.stdout.write('')
+        self.stdout.write(f'Imports por paquete (tiempo propio, {len(propio)} modulos, {sum(propio.values()):.1f} ms)')
+        for paquete, ms in sorted(paquetes.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {paquete:<40} {ms:8.1f} ms')
+
+        self.stdout.write('')
+        self.stdout.write('Modulos mas lentos (incluye sus imports)')
+        for modulo, ms in sorted(acumulado.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {modulo:<40} {ms:8.1f} ms')
+
+        if 'pkg_resources' in propio:
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(
+                f'pkg_resources ({acumulado["pkg_resources"]:.1f} ms) se importa porque setuptools reemplaza a '
+                f'distutils (django.utils.version); SETUPTOOLS_USE_DISTUTILS=stdlib en el entorno lo evita'))
+
+    # Una corrida en un interprete nuevo: ([(etapa, ms)], {modulo: (self us, acumulado us)})
+    def correr(self, objetivo):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'linioexp.settings'))
+        env['APP_WARMUP'] = '1' if objetivo == 'preload' else '0'
+        if objetivo in ('asgi', 'preload'):
+            # Como linioexp.asgi, que lo define antes de cargar settings
+            env.setdefault('ASYNC_VIEWS', '1')
+        proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODIGO, objetivo],
+                                 cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            raise CommandError(f'Startup failed:\n{proceso.stderr[-2000:]}')
+        imports = {}
+        for linea in proceso.stderr.splitlines():
+            match = IMPORTTIME.match(linea)
+            if match:
+                imports[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+        return json.loads(proceso.stdout.strip().splitlines()[-1]), imports
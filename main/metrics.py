@@ -0,0 +1,359 @@
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+from django.views.generic import View
+
+"""
+Metricas por vista en formato Prometheus (/metrics)
+MetricsMiddleware (main/middleware.py) mide cada peticion y la suma a su vista (el
+nombre de la url resuelta): latencia (histograma), respuestas por codigo, consultas a
+la base de datos, render de templates y llamadas al storage externo, con su tiempo
+Cada proceso acumula sus metricas en memoria y un hilo las escribe cada
+METRICS_FLUSH_INTERVAL segundos en un archivo propio en METRICS_DIR; /metrics suma los
+archivos de todos los procesos del host (workers de gunicorn, incluidos los que ya
+terminaron: los contadores no bajan si un worker se reinicia)
+La latencia es hasta que la vista retorna la respuesta: en las respuestas en streaming
+(exportaciones, API) no incluye el envio del cuerpo
+"""
+
+# Tipos de trabajo medidos dentro de una peticion
+TIPOS = ('db', 'template', 'storage')
+
+# Vista de las peticiones que no resuelven a una url (404, archivos estaticos)
+SIN_VISTA = 'none'
+
+# Medicion de la peticion en curso
+# Los hilos de asyncdb (en_hilo) y de sync_to_async copian el contexto: sus consultas
+# se suman a la peticion que los usa
+_medicion = contextvars.ContextVar('medicion', default=None)
+
+
+# Trabajo de una peticion: {tipo: [cantidad, segundos]}
+# Varios hilos pueden sumar a la vez (consultas en paralelo de una vista async)
+class Medicion:
+    def __init__(self, request=None):
+        self.request = request
+        self.inicio = time.perf_counter()
+        self.tipos = {tipo: [0, 0.0] for tipo in TIPOS}
+        self.lock = threading.Lock()
+
+    def sumar(self, tipo, segundos, cantidad=1):
+        with self.lock:
+            total = self.tipos[tipo]
+            total[0] += cantidad
+            total[1] += segundos
+
+    # Nombre de la vista de la peticion (SIN_VISTA antes de resolver la url o si no resuelve)
+    def vista(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match is not None else SIN_VISTA
+
+
+# Mide el bloque y lo suma a la peticion en curso (sin peticion no hace nada)
+# cantidad: llamadas que hace el bloque (varias urls resueltas en paralelo cuentan su tiempo una vez)
+@contextmanager
+def medir(tipo, cantidad=1):
+    medicion = _medicion.get()
+    if medicion is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.sumar(tipo, time.perf_counter() - inicio, cantidad)
+
+
+# Wrapper de las consultas de una conexion (ver instrumentar)
+def medir_consulta(execute, sql, params, many, context):
+    with medir('db'):
+        return execute(sql, params, many, context)
+
+
+# Mide las consultas de una conexion a la base de datos (senal connection_created)
+# Va primero en la lista: connection.execute_wrapper() quita el ultimo wrapper al salir
+def instrumentar(connection):
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, medir_consulta)
+
+
+# Vista de la peticion en curso, o None fuera de una peticion (comandos, hilos de fondo)
+def vista_actual():
+    medicion = _medicion.get()
+    return medicion.vista() if medicion is not None else None
+
+
+# Inicia la medicion de una peticion; retorna el token para terminar()
+def iniciar(request):
+    return _medicion.set(Medicion(request))
+
+
+# Termina la medicion de la peticion y la suma a su vista
+# response: None si un middleware lanzo una excepcion (cuenta como 500)
+def terminar(token, request, response):
+    medicion = _medicion.get()
+    _medicion.reset(token)
+    if medicion is None:
+        return
+    vista = medicion.vista()
+    status = response.status_code if response is not None else 500
+    registro.sumar(vista, status, time.perf_counter() - medicion.inicio, medicion)
+    if response is not None and response.streaming:
+        response.streaming_content = cuerpo_medido(response.streaming_content, request, vista)
+
+
+# Cuerpo de una respuesta en streaming que suma a la vista las consultas, templates y
+# llamadas al storage hechas al generarlo (despues de que la vista retorna)
+# El contexto se fija en cada parte: el servidor puede pedirlas desde otro hilo o contexto
+def cuerpo_medido(contenido, request, vista):
+    medicion = Medicion(request)
+    partes = iter(contenido)
+    try:
+        while True:
+            token = _medicion.set(medicion)
+            try:
+                parte = next(partes)
+            except StopIteration:
+                return
+            finally:
+                _medicion.reset(token)
+            yield parte
+    finally:
+        registro.sumar_trabajo(vista, medicion)
+
+
+# Limites de los buckets del histograma de latencia (segundos)
+def limites():
+    return sorted(float(limite) for limite in getattr(
+        settings, 'METRICS_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+
+
+# Metricas vacias de una vista (buckets sin acumular; el ultimo es +Inf)
+def metricas_vacias(cantidad_limites):
+    metricas = {'buckets': [0] * (cantidad_limites + 1), 'count': 0, 'sum': 0.0, 'status': {}}
+    metricas.update({tipo: [0, 0.0] for tipo in TIPOS})
+    return metricas
+
+
+# Suma las metricas de una vista (de otro proceso) a un total
+def acumular(total, metricas):
+    total['buckets'] = [a + b for a, b in zip(total['buckets'], metricas['buckets'])]
+    total['count'] += metricas['count']
+    total['sum'] += metricas['sum']
+    for status, cantidad in metricas['status'].items():
+        total['status'][status] = total['status'].get(status, 0) + cantidad
+    for tipo in TIPOS:
+        total[tipo] = [a + b for a, b in zip(total[tipo], metricas[tipo])]
+
+
+def sumar_tipos(metricas, medicion):
+    with medicion.lock:
+        for tipo, (cantidad, tiempo) in medicion.tipos.items():
+            metricas[tipo][0] += cantidad
+            metricas[tipo][1] += tiempo
+
+
+# Metricas de este proceso, escritas en su archivo de METRICS_DIR
+class Registro:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.escritura = threading.Lock()
+        self.pid = None
+
+    # Estado de un proceso nuevo (o de un hijo creado con fork despues de medir peticiones)
+    def iniciar_proceso(self):
+        self.pid = os.getpid()
+        self.limites = limites()
+        self.vistas = {}
+        self.cambios = False
+        # El archivo no se reutiliza aunque otro proceso del host tenga el mismo pid
+        self.archivo = f'{self.pid}-{time.time_ns()}.json'
+        hilo = threading.Thread(target=self.escribir_periodicamente, args=(self.pid,),
+                                name='metrics', daemon=True)
+        hilo.start()
+
+    # Metricas de la vista en este proceso (con self.lock tomado)
+    def metricas(self, vista):
+        if self.pid != os.getpid():
+            self.iniciar_proceso()
+        metricas = self.vistas.get(vista)
+        if metricas is None:
+            metricas = self.vistas[vista] = metricas_vacias(len(self.limites))
+        self.cambios = True
+        return metricas
+
+    # Suma una peticion: su latencia, su codigo de respuesta y su trabajo
+    def sumar(self, vista, status, segundos, medicion):
+        with self.lock:
+            metricas = self.metricas(vista)
+            metricas['buckets'][bisect.bisect_left(self.limites, segundos)] += 1
+            metricas['count'] += 1
+            metricas['sum'] += segundos
+            clase = f'{status // 100}xx'
+            metricas['status'][clase] = metricas['status'].get(clase, 0) + 1
+            sumar_tipos(metricas, medicion)
+
+    # Suma el trabajo hecho al enviar el cuerpo de una respuesta (ver cuerpo_medido)
+    def sumar_trabajo(self, vista, medicion):
+        with self.lock:
+            sumar_tipos(self.metricas(vista), medicion)
+
+    # Escribe las metricas del proceso si cambiaron (reemplazo atomico del archivo)
+    def escribir(self):
+        with self.escritura:
+            with self.lock:
+                if self.pid != os.getpid() or not self.cambios:
+                    return
+                datos = json.dumps({'buckets': self.limites, 'vistas': self.vistas})
+                self.cambios = False
+            try:
+                directorio = metrics_dir()
+                os.makedirs(directorio, exist_ok=True)
+                ruta = os.path.join(directorio, self.archivo)
+                with open(ruta + '.tmp', 'w') as archivo:
+                    archivo.write(datos)
+                os.replace(ruta + '.tmp', ruta)
+            except OSError:
+                # Se vuelve a intentar en la siguiente escritura
+                self.cambios = True
+                raise
+
+    def escribir_periodicamente(self, pid):
+        while self.pid == pid:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 5))
+            try:
+                self.escribir()
+            except OSError:
+                pass
+
+
+registro = Registro()
+atexit.register(registro.escribir)
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'linioexp-metrics')
+
+
+# Metricas de todos los procesos del host: (limites, {vista: metricas})
+# Los archivos escritos con otros limites (antes de cambiar METRICS_BUCKETS) se omiten
+def leer():
+    registro.escribir()
+    actuales = limites()
+    vistas = {}
+    for ruta in glob.glob(os.path.join(metrics_dir(), '*.json')):
+        try:
+            with open(ruta) as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            continue
+        if datos['buckets'] != actuales:
+            continue
+        for vista, metricas in datos['vistas'].items():
+            acumular(vistas.setdefault(vista, metricas_vacias(len(actuales))), metricas)
+    return actuales, vistas
+
+
+# Borra las metricas de ejecuciones anteriores (al iniciar gunicorn, ver gunicorn.conf.py)
+def limpiar():
+    for ruta in glob.glob(os.path.join(metrics_dir(), '*.json*')):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+# Contadores de trabajo por tipo: (nombre, tipo, posicion en [cantidad, segundos], ayuda)
+CONTADORES = [
+    ('linioexp_db_queries_total', 'db', 0, 'Database queries run by the view'),
+    ('linioexp_db_query_seconds_total', 'db', 1, 'Time spent in database queries by the view'),
+    ('linioexp_template_renders_total', 'template', 0, 'Templates rendered by the view'),
+    ('linioexp_template_render_seconds_total', 'template', 1, 'Time spent rendering templates by the view'),
+    ('linioexp_storage_calls_total', 'storage', 0, 'Calls to the external file storage made by the view'),
+    ('linioexp_storage_seconds_total', 'storage', 1, 'Time spent waiting on the external file storage by the view'),
+]
+
+
+def etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def numero(valor):
+    if math.isinf(valor):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# Texto de las metricas en el formato de exposicion de Prometheus (version 0.0.4)
+def exposicion(buckets, vistas):
+    lineas = []
+
+    def encabezado(nombre, tipo, ayuda):
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+
+    nombre = 'linioexp_request_duration_seconds'
+    encabezado(nombre, 'histogram', 'Time until the view returns its response')
+    for vista in sorted(vistas):
+        metricas, view = vistas[vista], etiqueta(vista)
+        acumulado = 0
+        for limite, cantidad in zip(buckets + [math.inf], metricas['buckets']):
+            acumulado += cantidad
+            lineas.append(f'{nombre}_bucket{{view="{view}",le="{numero(limite)}"}} {acumulado}')
+        lineas.append(f'{nombre}_sum{{view="{view}"}} {numero(metricas["sum"])}')
+        lineas.append(f'{nombre}_count{{view="{view}"}} {metricas["count"]}')
+
+    nombre = 'linioexp_responses_total'
+    encabezado(nombre, 'counter', 'Responses by view and status class')
+    for vista in sorted(vistas):
+        for status, cantidad in sorted(vistas[vista]['status'].items()):
+            lineas.append(f'{nombre}{{view="{etiqueta(vista)}",status="{etiqueta(status)}"}} {cantidad}')
+
+    for nombre, tipo, posicion, ayuda in CONTADORES:
+        encabezado(nombre, 'counter', ayuda)
+        for vista in sorted(vistas):
+            lineas.append(f'{nombre}{{view="{etiqueta(vista)}"}} {numero(vistas[vista][tipo][posicion])}')
+    return '\n'.join(lineas) + '\n'
+
+
+# Metricas de todos los workers del host para Prometheus
+# Si METRICS_TOKEN esta definido, se pide como bearer token (Authorization: Bearer <token>)
+class MetricsView(View):
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Invalid metrics token', status=401, content_type='text/plain')
+        return HttpResponse(exposicion(*leer()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Backend de templates de Django que mide el render de cada template (settings.TEMPLATES)
+# Los templates incluidos ({% include %}, {% extends %}) cuentan dentro del que los usa
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with medir('template'):
+            return super().render(context, request)
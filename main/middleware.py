@@ -0,0 +1,85 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+from .roles import get_roles
+
+"""
+Middlewares de la aplicacion
+Funcionan en modo sincrono (WSGI) y async (ASGI): bajo ASGI, un middleware solo
+sincrono obliga a Django a ejecutar el resto de la peticion en un unico hilo
+"""
+
+# Expone los roles del usuario como request.roles
+# Se resuelven solo si la vista los usa (debe ir despues de AuthenticationMiddleware)
+class RolesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request))
+        return self.get_response(request)
+
+
+# Mide cada peticion para /metrics (ver main/metrics.py)
+# Va primero en MIDDLEWARE: la latencia incluye a los demas middlewares
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = metrics.iniciar(request)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            metrics.terminar(token, request, response)
+
+    async def __acall__(self, request):
+        token = metrics.iniciar(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            metrics.terminar(token, request, response)
+
+
+# WhiteNoise con soporte async: los archivos estaticos se sirven en un hilo
+# y el resto de peticiones sigue en el event loop
+# django_heroku agrega whitenoise.middleware.WhiteNoiseMiddleware; settings lo reemplaza por este
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_file(request.path_info) if self.autorefresh else self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# Crea la tabla FTS5 del indice de busqueda (solo en SQLite) y la llena
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS main_producto_fts '
+        "USING fts5(nombre, descripcion, categoria, proveedor, tokenize='unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        'INSERT INTO main_producto_fts(rowid, nombre, descripcion, categoria, proveedor) '
+        "SELECT p.id, p.nombre, p.descripcion, COALESCE(c.nombre, ''), COALESCE(v.razon_social, '') "
+        'FROM main_producto p '
+        'LEFT JOIN main_categoria c ON c.id = p.categoria_id '
+        'LEFT JOIN main_proveedor v ON v.id = p.proveedor_id')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS main_producto_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_comment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_producto_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['precio', 'id'], name='main_produc_precio_ad99d3_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Asigna a cada producto su primera imagen como imagen principal
+def set_imagen_principal(apps, schema_editor):
+    Producto = apps.get_model('main', 'Producto')
+    ProductoImage = apps.get_model('main', 'ProductoImage')
+    primera = ProductoImage.objects.filter(product=models.OuterRef('pk')).order_by('id').values('id')[:1]
+    Producto.objects.update(imagen_principal=models.Subquery(primera))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_producto_precio_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_principal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.productoimage'),
+        ),
+        migrations.RunPython(set_imagen_principal, migrations.RunPython.noop),
+    ]
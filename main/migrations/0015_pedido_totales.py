@@ -0,0 +1,38 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:06
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+# Calcula subtotal y total de los pedidos existentes
+def calcular_totales(apps, schema_editor):
+    Pedido = apps.get_model('main', 'Pedido')
+    DetallePedido = apps.get_model('main', 'DetallePedido')
+    detalle = DetallePedido.objects.filter(pedido=models.OuterRef('pk')).values('pedido').annotate(
+        subtotal=models.Sum(
+            models.F('cantidad') * models.F('producto__precio') * (1 - models.F('producto__descuento')),
+            output_field=models.FloatField())).values('subtotal')
+    subtotal = Coalesce(models.Subquery(detalle), 0.0, output_field=models.FloatField())
+    Pedido.objects.update(subtotal=subtotal)
+    Pedido.objects.update(total=models.F('subtotal') + Coalesce('tarifa', 0.0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_producto_imagen_principal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='subtotal',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_localizacion_coordenadas_proveedor_ubicacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productoimage',
+            name='card',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/variants'),
+        ),
+        migrations.AddField(
+            model_name='productoimage',
+            name='detail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/variants'),
+        ),
+        migrations.AddField(
+            model_name='productoimage',
+            name='thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/variants'),
+        ),
+    ]
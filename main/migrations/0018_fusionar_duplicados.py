@@ -0,0 +1,55 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+# Suma en un solo detalle los detalles repetidos de un producto en el mismo pedido
+def fusionar_detalles(DetallePedido):
+    repetidos = DetallePedido.objects.values('pedido_id', 'producto_id').annotate(
+        n=models.Count('id'), primero=models.Min('id')).filter(n__gt=1).order_by()
+    for repetido in repetidos:
+        filas = DetallePedido.objects.filter(pedido_id=repetido['pedido_id'], producto_id=repetido['producto_id'])
+        cantidad = filas.aggregate(total=models.Sum('cantidad'))['total']
+        DetallePedido.objects.filter(pk=repetido['primero']).update(cantidad=cantidad)
+        filas.exclude(pk=repetido['primero']).delete()
+
+
+# Antes de agregar las restricciones unicas (0019_indices_pedidos_carrito) se fusionan
+# los datos que las violan: los carritos ('EP') repetidos de un cliente pasan al mas reciente
+def fusionar_duplicados(apps, schema_editor):
+    Pedido = apps.get_model('main', 'Pedido')
+    DetallePedido = apps.get_model('main', 'DetallePedido')
+
+    carritos = []
+    repetidos = Pedido.objects.filter(estado='EP').values('cliente_id').annotate(
+        n=models.Count('id'), ultimo=models.Max('id')).filter(n__gt=1).order_by()
+    for repetido in repetidos:
+        viejos = Pedido.objects.filter(cliente_id=repetido['cliente_id'], estado='EP').exclude(pk=repetido['ultimo'])
+        DetallePedido.objects.filter(pedido__in=viejos).update(pedido_id=repetido['ultimo'])
+        viejos.delete()
+        carritos.append(repetido['ultimo'])
+
+    fusionar_detalles(DetallePedido)
+
+    # Totales materializados de los carritos fusionados
+    detalle = DetallePedido.objects.filter(pedido=models.OuterRef('pk')).values('pedido').annotate(
+        subtotal=models.Sum(
+            models.F('cantidad') * models.F('producto__precio') * (1 - models.F('producto__descuento')),
+            output_field=models.FloatField())).values('subtotal')
+    fusionados = Pedido.objects.filter(pk__in=carritos)
+    fusionados.update(subtotal=Coalesce(models.Subquery(detalle), 0.0, output_field=models.FloatField()))
+    fusionados.update(total=models.F('subtotal') + Coalesce('tarifa', 0.0))
+
+
+# Va en su propia migracion (transaccion): en PostgreSQL, ALTER TABLE falla en la misma
+# transaccion que modifico filas de la tabla ("pending trigger events")
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_productoimage_variantes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+    ]
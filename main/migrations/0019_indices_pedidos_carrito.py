@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_fusionar_duplicados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['repartidor', 'estado'], name='main_pedido_reparti_d36c71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', '-id'], name='main_produc_categor_52f313_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='detallepedido',
+            constraint=models.UniqueConstraint(fields=('pedido', 'producto'), name='un_detalle_por_producto'),
+        ),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(condition=models.Q(estado='EP'), fields=('cliente',), name='un_carrito_por_cliente'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_indices_pedidos_carrito'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['producto', 'pedido'], name='main_detall_product_5ebd65_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_indice_ventas_producto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.FloatField(default=0)),
+                ('categoria', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.categoria')),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.proveedor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(fields=('proveedor', 'fecha', 'categoria'), name='una_venta_por_dia_y_categoria'),
+        ),
+    ]
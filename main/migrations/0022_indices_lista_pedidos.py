@@ -0,0 +1,21 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_ventas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cliente', '-id'], name='main_pedido_cliente_f0b02d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['repartidor', '-id'], name='main_pedido_reparti_184a08_idx'),
+        ),
+    ]
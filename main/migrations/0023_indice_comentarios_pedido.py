@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_indices_lista_pedidos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['pedido', 'id'], name='main_commen_pedido__75207e_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:55
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+# Antes de agregar la restriccion de la fila sin categoria (0025_venta_sin_categoria_unica)
+# las filas sin categoria repetidas de un proveedor y dia se reemplazan por una sola
+# Sus montos no se suman (cada aporte se sumaba a todas las filas repetidas): se recalculan
+# desde los pedidos vendidos del dia con el mismo agregado que ventas.reconstruir
+def fusionar_sin_categoria(apps, schema_editor):
+    VentaDiaria = apps.get_model('main', 'VentaDiaria')
+    DetallePedido = apps.get_model('main', 'DetallePedido')
+    repetidas = VentaDiaria.objects.filter(categoria__isnull=True).values('proveedor_id', 'fecha').annotate(
+        n=models.Count('id'), primera=models.Min('id')).filter(n__gt=1).order_by()
+    for repetida in repetidas:
+        fecha = repetida['fecha']
+        venta = DetallePedido.objects.filter(
+            pedido__estado__in=('PAG', 'ENT'), producto__proveedor_id=repetida['proveedor_id'],
+            producto__categoria__isnull=True, pedido__fecha_creacion__gte=inicio_del_dia(fecha),
+            pedido__fecha_creacion__lt=inicio_del_dia(fecha + datetime.timedelta(days=1))).aggregate(
+            unidades=models.Sum('cantidad'), ingresos=models.Sum(
+                models.F('cantidad') * models.F('producto__precio') * (1 - models.F('producto__descuento')),
+                output_field=models.FloatField()))
+        filas = VentaDiaria.objects.filter(
+            categoria__isnull=True, proveedor_id=repetida['proveedor_id'], fecha=fecha)
+        if venta['unidades'] is None:
+            # Sin ventas ese dia: reconstruir no crea la fila
+            filas.delete()
+            continue
+        filas.filter(pk=repetida['primera']).update(unidades=venta['unidades'], ingresos=venta['ingresos'] or 0)
+        filas.exclude(pk=repetida['primera']).delete()
+
+
+# Va en su propia migracion (transaccion): en PostgreSQL, ALTER TABLE falla en la misma
+# transaccion que modifico filas de la tabla ("pending trigger events")
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_indice_comentarios_pedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_sin_categoria, migrations.RunPython.noop),
+    ]
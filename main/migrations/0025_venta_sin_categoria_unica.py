@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_fusionar_ventas_sin_categoria'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(condition=models.Q(categoria__isnull=True), fields=('proveedor', 'fecha'), name='una_venta_por_dia_sin_categoria'),
+        ),
+    ]
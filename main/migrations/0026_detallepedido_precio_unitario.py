@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+# Los detalles existentes no tienen el precio de su venta: se usa el precio final actual
+# de su producto, el mismo con el que se calcularon los totales materializados (0015_pedido_totales)
+def precio_actual(apps, schema_editor):
+    DetallePedido = apps.get_model('main', 'DetallePedido')
+    Producto = apps.get_model('main', 'Producto')
+    producto = Producto.objects.filter(pk=models.OuterRef('producto_id'))
+    DetallePedido.objects.update(precio_unitario=models.Subquery(
+        producto.values(precio_final=models.F('precio') * (1 - models.F('descuento')))[:1],
+        output_field=models.FloatField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_venta_sin_categoria_unica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='precio_unitario',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(precio_actual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Los detalles existentes toman la categoria actual de su producto, la misma con la que
+# se calculo el resumen de ventas
+def categoria_actual(apps, schema_editor):
+    DetallePedido = apps.get_model('main', 'DetallePedido')
+    Producto = apps.get_model('main', 'Producto')
+    DetallePedido.objects.update(categoria_id=models.Subquery(
+        Producto.objects.filter(pk=models.OuterRef('producto_id')).values('categoria_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_detallepedido_precio_unitario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='categoria',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.categoria'),
+        ),
+        migrations.RunPython(categoria_actual, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext as _
@@ -103,6 +105,9 @@ class Localizacion(models.Model):
     provincia = models.CharField(max_length=20)
     # Departamento: Campo string, longitud maxima de 20 caracters
     departamento = models.CharField(max_length=20)
+    # Latitud y longitud: Campos float opcionales, usados para calcular tarifas
+    latitud = models.FloatField(blank=True, null=True)
+    longitud = models.FloatField(blank=True, null=True)
 
     def __str__(self):
         return f'{self.distrito}, {self.provincia}, {self.departamento}'
@@ -140,6 +145,9 @@ class Producto(models.Model):
     ####
     categoria = models.ForeignKey('Categoria', on_delete=models.SET_NULL, null=True)
     proveedor = models.ForeignKey('Proveedor', on_delete=models.SET_NULL, null=True)
+    # Imagen principal (la primera imagen registrada), se mantiene con senales
+    # Permite cargar la imagen de cada producto con select_related
+    imagen_principal = models.ForeignKey('ProductoImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
     # Atributos
     # Nombre: Campo string con longitud maxima 20
@@ -153,6 +161,14 @@ class Producto(models.Model):
     # Descuento: Campo tipo float con valor default 0
     descuento = models.FloatField(default=0)
 
+    class Meta:
+        indexes = [
+            # Indice para ordenar (y paginar por cursor) por precio
+            models.Index(fields=['precio', 'id']),
+            # Productos de una categoria, de los mas recientes a los mas antiguos
+            models.Index(fields=['categoria', '-id']),
+        ]
+
     def __str__(self):
         return self.nombre
 
@@ -188,6 +204,28 @@ class ProductoImage(models.Model):
     product = models.ForeignKey('Producto', on_delete=models.CASCADE, related_name='images')
     # Image: Campo tipo imagen
     image = models.ImageField(upload_to="products", null=True, blank=True)
+    # Variantes de tamano fijo (WebP), generadas fuera de la peticion (ver main/images.py)
+    thumb = models.ImageField(upload_to="products/variants", null=True, blank=True, editable=False)
+    card = models.ImageField(upload_to="products/variants", null=True, blank=True, editable=False)
+    detail = models.ImageField(upload_to="products/variants", null=True, blank=True, editable=False)
+
+    # Archivo de la variante; si aun no se genera, la imagen original
+    def archivo_variante(self, variante):
+        return getattr(self, variante) or self.image
+
+    # Url de la variante (o '' si no hay imagen)
+    def url_variante(self, variante):
+        archivo = self.archivo_variante(variante)
+        return archivo.url if archivo else ''
+
+    def thumb_url(self):
+        return self.url_variante('thumb')
+
+    def card_url(self):
+        return self.url_variante('card')
+
+    def detail_url(self):
+        return self.url_variante('detail')
 
 
 # Modelo Proveedor
@@ -200,6 +238,8 @@ class Proveedor(models.Model):
     razon_social = models.CharField(max_length=20)
     #Telefono: Campo string con longitud maxima 9
     telefono = models.CharField(max_length=9)
+    # Ubicacion: origen de los envios, usado para calcular tarifas
+    ubicacion = models.ForeignKey('Localizacion', on_delete=models.SET_NULL, blank=True, null=True)
 
     def __str__(self):
         return self.razon_social
@@ -261,21 +301,61 @@ class Pedido(models.Model):
     BOLETA = 'Boleta'
     TIPO_COMPROBANTE = [(FACTURA, 'Factura'),(BOLETA, 'Boleta')]
     comprobante = models.CharField(max_length=7, choices=TIPO_COMPROBANTE, null=True)
-
+    # Subtotal: suma de los subtotales del detalle (materializado)
+    subtotal = models.FloatField(default=0)
+    # Total: subtotal mas tarifa (materializado)
+    total = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # Un solo carrito (pedido en proceso) por cliente; es tambien el indice del carrito
+            models.UniqueConstraint(fields=['cliente'], condition=models.Q(estado='EP'),
+                                    name='un_carrito_por_cliente'),
+        ]
+        indexes = [
+            # Pedidos de un repartidor por estado (inicio, asignacion, pedidos en vivo)
+            models.Index(fields=['repartidor', 'estado']),
+            # Pedidos de un cliente o de un repartidor, recientes primero (ramas de la lista de pedidos)
+            models.Index(fields=['cliente', '-id']),
+            models.Index(fields=['repartidor', '-id']),
+        ]
 
     def __str__(self):
         return f'{self.cliente} - {self.fecha_creacion} - {self.estado}'
 
-    # Retorna el total de costo del pedido
+    # Retorna el total de costo del pedido (sin consultar el detalle)
     def get_total(self):
-        # Obtiene el detalle dle pedido
-        detalles = self.detallepedido_set.all()
-        total = 0
-        # Para cada elemento, suma el subtotal
-        for detalle in detalles:
-            total += detalle.get_subtotal()
-        total += self.tarifa
-        return total
+        return self.total
+
+    # Suma (o resta, con monto negativo) un monto al subtotal y total
+    # La actualizacion es atomica en la base de datos (F), sin leer el detalle
+    def agregar_monto(self, monto):
+        Pedido.objects.filter(pk=self.pk).update(
+            subtotal=F('subtotal') + monto, total=F('total') + monto)
+
+    # Pone en el detalle del carrito los precios y categorias actuales de los productos
+    # Solo para pedidos en proceso: los pedidos pagados mantienen los de su compra
+    def actualizar_precios(self):
+        if self.estado == 'EP':
+            self.detallepedido_set.update(
+                precio_unitario=DetallePedido.precio_actual(),
+                categoria_id=Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values('categoria_id')[:1]))
+
+    # Recalcula subtotal y total con un agregado en la base de datos (precios del detalle)
+    def recalcular_total(self, save=True):
+        self.subtotal = self.detallepedido_set.aggregate(
+            subtotal=DetallePedido.subtotal_expression())['subtotal'] or 0
+        self.total = self.subtotal + (self.tarifa or 0)
+        if save:
+            self.save(update_fields=['subtotal', 'total'])
+
+    # Subtotal calculado en la base de datos para cada pedido de un queryset
+    # Ej: Pedido.objects.annotate(calculado=Pedido.subtotal_calculado())
+    @staticmethod
+    def subtotal_calculado():
+        detalle = DetallePedido.objects.filter(pedido=OuterRef('pk')).values('pedido').annotate(
+            subtotal=DetallePedido.subtotal_expression()).values('subtotal')
+        return Coalesce(Subquery(detalle), 0.0, output_field=models.FloatField())
 
     # Retorna true si se puede cancelar pedido o false, de lo contrario
     def puede_cancelar(self):
@@ -303,17 +383,46 @@ class DetallePedido(models.Model):
     # Relaciones (many to one)
     producto = models.ForeignKey('Producto', on_delete=models.CASCADE)
     pedido = models.ForeignKey('Pedido', on_delete=models.CASCADE)
+    # Categoria del producto al venderse (resumen de ventas, ver main/ventas.py)
+    # Se guarda como el precio: un cambio de categoria del producto no mueve sus ventas
+    categoria = models.ForeignKey('Categoria', on_delete=models.SET_NULL, null=True, blank=True)
 
     # Atributos
     # Cantidad: Campo tipo entero
     cantidad = models.IntegerField(blank=True, null=True)
+    # Precio unitario: precio final del producto al agregarlo al carrito
+    # Se actualiza al confirmar el pedido (ver Pedido.actualizar_precios); despues no cambia
+    precio_unitario = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # Un detalle por producto en cada pedido (la cantidad se acumula)
+            models.UniqueConstraint(fields=['pedido', 'producto'], name='un_detalle_por_producto'),
+        ]
+        indexes = [
+            # Ventas de un producto en orden de pedido (exportacion de ventas del proveedor)
+            models.Index(fields=['producto', 'pedido']),
+        ]
 
     def __str__(self):
-        return f'{self.pedido.id} - {self.cantidad} x {self.producto.nombre}'
+        return f'{self.pedido_id} - {self.cantidad} x {self.producto.nombre}'
 
-    # Retorna el subtotal del pedido
+    # Retorna el subtotal del pedido (con el precio guardado en el detalle)
     def get_subtotal(self):
-        return self.producto.get_precio_final() * self.cantidad
+        return self.precio_unitario * self.cantidad
+
+    # Suma de subtotales calculada en la base de datos (misma formula que get_subtotal)
+    @staticmethod
+    def subtotal_expression():
+        return Sum(F('cantidad') * F('precio_unitario'), output_field=models.FloatField())
+
+    # Precio final actual del producto de cada detalle de un queryset
+    # Ej: detalles.update(precio_unitario=DetallePedido.precio_actual())
+    @staticmethod
+    def precio_actual():
+        producto = Producto.objects.filter(pk=OuterRef('producto_id'))
+        return Subquery(producto.values(precio_final=F('precio') * (1 - F('descuento')))[:1],
+                        output_field=models.FloatField())
 
 
 # Comentarios en el pedido
@@ -323,5 +432,41 @@ class Comment(models.Model):
     body = models.TextField()
     created_on = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Comentarios de un pedido en orden (paginas del hilo y comentarios nuevos)
+            models.Index(fields=['pedido', 'id']),
+        ]
+
     def __str__(self):
         return 'Comentario {} escrito por {}'.format(self.body, self.usuario)
+
+
+# Resumen de ventas por proveedor, categoria y dia (ver main/ventas.py)
+# Se actualiza con senales cuando un pedido pasa a pagado o entregado
+# y se reconstruye con el comando rebuild_sales_rollups
+# Al eliminar una categoria, sus filas se suman a las filas sin categoria (ver ventas.categoria_eliminada)
+class VentaDiaria(models.Model):
+    # Relaciones (many to one)
+    proveedor = models.ForeignKey('Proveedor', on_delete=models.CASCADE)
+    categoria = models.ForeignKey('Categoria', on_delete=models.SET_NULL, null=True)
+
+    # Atributos
+    # Fecha: dia (zona horaria local) de la fecha de creacion del pedido
+    fecha = models.DateField()
+    # Unidades: suma de las cantidades vendidas
+    unidades = models.IntegerField(default=0)
+    # Ingresos: suma de los subtotales (precio final por cantidad)
+    ingresos = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # Una fila por proveedor, dia y categoria; es tambien el indice del resumen del proveedor
+            models.UniqueConstraint(fields=['proveedor', 'fecha', 'categoria'], name='una_venta_por_dia_y_categoria'),
+            # Los NULL son distintos entre si: la fila sin categoria necesita su propia restriccion
+            models.UniqueConstraint(fields=['proveedor', 'fecha'], condition=models.Q(categoria__isnull=True),
+                                    name='una_venta_por_dia_sin_categoria'),
+        ]
+
+    def __str__(self):
+        return f'{self.proveedor_id} - {self.fecha} - {self.categoria_id}: {self.ingresos}'
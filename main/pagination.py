@@ -0,0 +1,155 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+"""
+Paginacion por cursor (keyset) para las vistas tipo lista
+En lugar de OFFSET y COUNT(*), cada pagina filtra a partir de los valores
+de orden de la ultima (o primera) fila de la pagina anterior
+"""
+
+# Codifica los valores de orden de una fila en un cursor para la url
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+# Decodifica un cursor; retorna (direccion, valores) o lanza ValueError
+def decode_cursor(cursor):
+    padding = '=' * (-len(cursor) % 4)
+    direction, values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode())
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    if any(isinstance(value, (list, dict)) for value in values):
+        raise ValueError('Invalid cursor')
+    return direction, values
+
+
+# Retorna el filtro de las filas que van despues de 'values' en el orden dado
+# Para (a DESC, id DESC): a <= va AND (a < va OR (a = va AND id < vid))
+# La primera condicion (rango sobre el primer campo) permite recorrer el indice
+def keyset_filter(ordering, values, reverse=False):
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    if len(ordering) > 1:
+        descending = ordering[0].startswith('-')
+        lookup = 'lte' if descending != reverse else 'gte'
+        condition = Q(**{f'{ordering[0].lstrip("-")}__{lookup}': values[0]}) & condition
+    return condition
+
+
+# Filtra el queryset a las filas que van despues de 'values'
+# Lanza ValueError si un valor no es del tipo de su campo (cursor alterado): el filtro
+# convierte los valores al armarse, antes de consultar
+def filter_after(queryset, ordering, values, reverse=False):
+    try:
+        return queryset.filter(keyset_filter(ordering, values, reverse=reverse))
+    except (ValueError, TypeError, ValidationError):
+        raise ValueError('Invalid cursor')
+
+
+# Invierte la direccion de cada campo del orden
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+
+# Pagina de resultados (misma interfaz basica que django.core.paginator.Page)
+class KeysetPage:
+    def __init__(self, object_list, next_url=None, previous_url=None):
+        self.object_list = object_list
+        self.next_url = next_url
+        self.previous_url = previous_url
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_url is not None
+
+    def has_previous(self):
+        return self.previous_url is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+"""
+Mixin para ListView: reemplaza la paginacion por numero de pagina
+El orden se toma del queryset; el ultimo campo debe ser unico (se agrega -id si falta)
+Los demas parametros GET (q, categoria, orden...) se conservan en los enlaces
+"""
+class KeysetPaginationMixin:
+    paginate_by = 24
+    cursor_kwarg = 'cursor'
+
+    # Orden del queryset, terminado en un campo unico
+    def get_keyset_ordering(self, queryset):
+        ordering = tuple(queryset.query.order_by) or ('-id',)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id',)
+        return ordering
+
+    # Primeras 'limit' filas del queryset ya ordenado y filtrado por el cursor
+    def get_keyset_rows(self, queryset, limit):
+        return list(queryset[:limit])
+
+    # Url de la pagina actual con otro cursor
+    def get_cursor_url(self, cursor):
+        params = self.request.GET.copy()
+        params[self.cursor_kwarg] = cursor
+        return '?' + params.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering(queryset)
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                raise Http404('Invalid cursor')
+            if len(values) != len(ordering):
+                raise Http404('Invalid cursor')
+
+        # Hacia atras se recorre en orden inverso y luego se invierte la pagina
+        backwards = direction == 'p'
+        queryset = queryset.order_by(*(reverse_ordering(ordering) if backwards else ordering))
+        if values is not None:
+            try:
+                queryset = filter_after(queryset, ordering, values, reverse=backwards)
+            except ValueError:
+                raise Http404('Invalid cursor')
+
+        # Se pide una fila extra para saber si hay mas paginas (sin COUNT)
+        rows = self.get_keyset_rows(queryset, page_size + 1)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_url = previous_url = None
+        if rows:
+            if has_next:
+                last = [getattr(rows[-1], field.lstrip('-')) for field in ordering]
+                next_url = self.get_cursor_url(encode_cursor('n', last))
+            if has_previous:
+                first = [getattr(rows[0], field.lstrip('-')) for field in ordering]
+                previous_url = self.get_cursor_url(encode_cursor('p', first))
+
+        page = KeysetPage(rows, next_url, previous_url)
+        return (None, page, page.object_list, page.has_other_pages())
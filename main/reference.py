@@ -0,0 +1,106 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import cache
+from .models import Categoria, Localizacion
+
+"""
+Datos de referencia: categorias y localizaciones
+Tablas pequenas que cambian poco; cada proceso guarda una copia en memoria
+La version de cada tabla esta en el cache compartido ('shared'): las senales la
+reemplazan al escribir y todos los procesos recargan su copia al verla cambiar
+Cada proceso lee la version a lo sumo cada VERSION_CHECK_INTERVAL segundos, y siempre
+que busca un registro que no tiene (uno recien creado por otro proceso)
+Los objetos son compartidos entre peticiones: no se deben modificar
+"""
+
+# Segundos entre lecturas de la version compartida (cada lectura abre un archivo)
+VERSION_CHECK_INTERVAL = 1
+
+
+# Copia en memoria de una tabla
+class ReferenceTable:
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded_at = 0
+        self.checked_at = 0
+        self.objects = []
+        self.by_pk = {}
+        self.indexes = {}
+
+    def version_key(self):
+        return f'reference:{self.model._meta.label_lower}:version'
+
+    # Recarga si otro proceso cambio la tabla o si la copia es vieja
+    # check: lee la version aunque se haya leido hace menos de VERSION_CHECK_INTERVAL
+    def ensure_fresh(self, check=False):
+        now = time.monotonic()
+        ttl = getattr(settings, 'REFERENCE_CACHE_TTL', 300)
+        if not check and now - self.checked_at < VERSION_CHECK_INTERVAL and now - self.loaded_at <= ttl:
+            return
+        version = cache.get_version(self.version_key())
+        self.checked_at = now
+        if self.version != version or now - self.loaded_at > ttl:
+            with self.lock:
+                objects = list(self.model.objects.order_by('pk'))
+                self.by_pk = {obj.pk: obj for obj in objects}
+                self.indexes = {}
+                self.objects = objects
+                self.version = version
+                self.loaded_at = time.monotonic()
+
+    # Todos los registros, ordenados por id
+    def all(self):
+        self.ensure_fresh()
+        return self.objects
+
+    # Registro por id (o None)
+    def get(self, pk):
+        self.ensure_fresh()
+        if pk is not None and pk not in self.by_pk:
+            self.ensure_fresh(check=True)
+        return self.by_pk.get(pk)
+
+    def find_by(self, field, value):
+        self.ensure_fresh()
+        index = self.indexes.get(field)
+        if index is None:
+            index = {}
+            for obj in reversed(self.objects):
+                index[getattr(obj, field)] = obj
+            self.indexes[field] = index
+        return index.get(value)
+
+    # Primer registro con field == value (o None); si no esta, vuelve a leer la version
+    def get_by(self, field, value):
+        obj = self.find_by(field, value)
+        if obj is None:
+            self.ensure_fresh(check=True)
+            obj = self.find_by(field, value)
+        return obj
+
+    def bump_version(self):
+        cache.bump_version(self.version_key())
+        # Este proceso recarga en su siguiente acceso
+        self.checked_at = 0
+
+    # Invalida la copia de todos los procesos; se llama desde las senales
+    # Se repite al confirmar la transaccion: otro proceso pudo recargar antes del commit
+    def invalidate(self):
+        self.bump_version()
+        transaction.on_commit(self.bump_version)
+
+
+categorias = ReferenceTable(Categoria)
+localizaciones = ReferenceTable(Localizacion)
+
+# Tablas por modelo
+TABLES = {
+    Categoria: categorias,
+    Localizacion: localizaciones,
+}
@@ -0,0 +1,110 @@
+import time
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import cache
+from .models import Profile, Cliente, Colaborador, Comerciante, Proveedor
+
+"""
+Roles del usuario (perfil, cliente, colaborador, comerciante, proveedor)
+Se resuelven en una sola consulta y se guardan en la sesion
+Las senales cambian una version por usuario en el cache compartido ('shared') al crear o
+eliminar un rol: las sesiones del usuario vuelven a consultar sus roles en cualquier worker
+"""
+
+# Clave de los roles dentro de la sesion
+SESSION_KEY = '_roles'
+
+# Roles y sus modelos
+ROLE_MODELS = {
+    'profile': Profile,
+    'cliente': Cliente,
+    'colaborador': Colaborador,
+    'comerciante': Comerciante,
+    'proveedor': Proveedor,
+}
+
+
+# Roles del usuario de la peticion (request.roles)
+# Guarda los ids; los objetos se cargan solo si una vista los necesita
+class Roles:
+    def __init__(self, ids=None, objects=None):
+        self.ids = ids or {}
+        self._objects = objects or {}
+
+    def __getattr__(self, name):
+        # <rol>_id: id del rol o None
+        if name.endswith('_id') and name[:-3] in ROLE_MODELS:
+            return self.ids.get(name[:-3])
+        # <rol>: objeto del rol o None
+        if name in ROLE_MODELS:
+            if name not in self._objects:
+                pk = self.ids.get(name)
+                self._objects[name] = ROLE_MODELS[name].objects.get(pk=pk) if pk else None
+            return self._objects[name]
+        raise AttributeError(name)
+
+    @property
+    def is_cliente(self):
+        return self.cliente_id is not None
+
+    @property
+    def is_colaborador(self):
+        return self.colaborador_id is not None
+
+    @property
+    def is_comerciante(self):
+        return self.comerciante_id is not None
+
+    @property
+    def is_proveedor(self):
+        return self.proveedor_id is not None
+
+
+# Clave de la version de roles del usuario en el cache compartido
+def version_key(user_id):
+    return f'roles:version:{user_id}'
+
+
+# Invalida los roles cacheados del usuario (en todas sus sesiones)
+def bump_version(user_id):
+    cache.bump_version(version_key(user_id))
+
+
+# Consulta el perfil y todos los roles del usuario en una sola consulta
+def resolve_roles(user):
+    perfil = Profile.objects.select_related(
+        'cliente', 'colaborador', 'comerciante__proveedor').filter(user=user).first()
+    if perfil is None:
+        return Roles()
+    objects = {'profile': perfil}
+    for name in ('cliente', 'colaborador', 'comerciante'):
+        objects[name] = getattr(perfil, name, None)
+    objects['proveedor'] = getattr(objects['comerciante'], 'proveedor', None)
+    ids = {name: obj.pk for name, obj in objects.items() if obj is not None}
+    return Roles(ids, objects)
+
+
+# Roles del usuario de la peticion: de la sesion si siguen vigentes, si no de la base de datos
+def get_roles(request):
+    user = request.user
+    if not user.is_authenticated:
+        return Roles()
+    version = cache.get_version(version_key(user.pk))
+    data = request.session.get(SESSION_KEY)
+    timeout = getattr(settings, 'ROLES_CACHE_TIMEOUT', 300)
+    if (data and data['user'] == user.pk and data['version'] == version
+            and time.time() - data['time'] < timeout):
+        return Roles(data['ids'])
+    roles = resolve_roles(user)
+    request.session[SESSION_KEY] = {
+        'user': user.pk, 'version': version, 'time': time.time(), 'ids': roles.ids}
+    return roles
+
+
+# Descarta los roles de la sesion actual y los vuelve a consultar al usarlos
+# Se usa cuando la propia peticion crea un rol para el usuario
+def forget_roles(request):
+    request.session.pop(SESSION_KEY, None)
+    request.roles = SimpleLazyObject(lambda: get_roles(request))
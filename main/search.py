@@ -0,0 +1,165 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Producto
+
+"""
+Motor de busqueda de productos
+Indice invertido sobre nombre, descripcion, categoria y razon social del proveedor
+El backend se elige con settings.SEARCH_BACKEND
+"""
+
+# Tabla virtual FTS5 con el indice (solo SQLite)
+FTS_TABLE = 'main_producto_fts'
+
+# Separa el texto buscado en palabras
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Backend base: interfaz comun de los motores de busqueda
+class BaseSearchBackend:
+    # Orden de los resultados (el ultimo campo es unico, para paginar por cursor)
+    ordering = ('-id',)
+
+    # Retorna los productos que coinciden con la busqueda, ordenados por relevancia
+    def search(self, query, queryset=None):
+        raise NotImplementedError
+
+    # Indexa (o reindexa) los productos indicados
+    def index_productos(self, producto_ids):
+        pass
+
+    # Reindexa los productos de una categoria
+    def index_categoria(self, categoria_id):
+        pass
+
+    # Reindexa los productos de un proveedor
+    def index_proveedor(self, proveedor_id):
+        pass
+
+    # Elimina productos del indice
+    def remove_productos(self, producto_ids):
+        pass
+
+    # Reconstruye el indice completo
+    def rebuild(self):
+        pass
+
+
+# Backend sin indice: filtra con icontains, funciona en cualquier base de datos
+class ORMSearchBackend(BaseSearchBackend):
+    def search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Producto.objects.all()
+        # Cada palabra debe aparecer en alguno de los campos
+        for term in TOKEN_RE.findall(query):
+            queryset = queryset.filter(
+                Q(nombre__icontains=term) |
+                Q(descripcion__icontains=term) |
+                Q(categoria__nombre__icontains=term) |
+                Q(proveedor__razon_social__icontains=term))
+        return queryset.order_by(*self.ordering)
+
+
+# Backend SQLite FTS5: indice invertido con ranking bm25
+class SQLiteFTSBackend(BaseSearchBackend):
+    # Pesos bm25 por columna: nombre, descripcion, categoria, proveedor
+    weights = (10.0, 1.0, 4.0, 2.0)
+    # Maximo de coincidencias (las mas recientes) que se ordenan por bm25; las demas van
+    # despues, de la mas reciente a la mas antigua
+    # Acota el costo de palabras muy frecuentes, que coinciden con casi todo el catalogo
+    rank_window = 2000
+    # Rank de las coincidencias fuera de la ventana (bm25 es siempre negativo)
+    unranked = 1
+    # Menor rank bm25 = mas relevante
+    ordering = ('rank', '-id')
+
+    # Filas a indexar: el producto con el nombre de su categoria y proveedor
+    index_select = (
+        "SELECT p.id, p.nombre, p.descripcion, COALESCE(c.nombre, ''), COALESCE(v.razon_social, '') "
+        "FROM main_producto p "
+        "LEFT JOIN main_categoria c ON c.id = p.categoria_id "
+        "LEFT JOIN main_proveedor v ON v.id = p.proveedor_id"
+    )
+
+    # Convierte el texto buscado en una consulta FTS5 (prefijos unidos con AND)
+    def build_match(self, query):
+        return ' '.join('"%s"*' % term for term in TOKEN_RE.findall(query))
+
+    def search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Producto.objects.all()
+        match = self.build_match(query)
+        if not match:
+            return queryset.order_by(*BaseSearchBackend.ordering)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        # El join con la tabla FTS usa el indice invertido
+        # El rank es una anotacion, asi se puede filtrar por el al paginar
+        # Solo se puntuan las ultimas rank_window coincidencias (rango de rowid)
+        window = (
+            f'(SELECT COALESCE(MIN(rowid), 0) FROM ('
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s))'
+        )
+        rank = (
+            f'CASE WHEN {FTS_TABLE}.rowid >= {window} '
+            f'THEN bm25({FTS_TABLE}, {weights}) ELSE {self.unranked} END'
+        )
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = main_producto.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(rank=RawSQL(rank, [match, self.rank_window])).order_by(*self.ordering)
+
+    # Borra y vuelve a insertar las filas que cumplen la condicion
+    def _reindex(self, where, params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM main_producto p WHERE {where})',
+                params)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion, categoria, proveedor) '
+                f'{self.index_select} WHERE {where}',
+                params)
+
+    def index_productos(self, producto_ids):
+        producto_ids = list(producto_ids)
+        if producto_ids:
+            placeholders = ', '.join(['%s'] * len(producto_ids))
+            self._reindex(f'p.id IN ({placeholders})', producto_ids)
+
+    def index_categoria(self, categoria_id):
+        self._reindex('p.categoria_id = %s', [categoria_id])
+
+    def index_proveedor(self, proveedor_id):
+        self._reindex('p.proveedor_id = %s', [proveedor_id])
+
+    def remove_productos(self, producto_ids):
+        producto_ids = list(producto_ids)
+        if producto_ids:
+            placeholders = ', '.join(['%s'] * len(producto_ids))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', producto_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion, categoria, proveedor) {self.index_select}')
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+# Retorna el backend configurado
+# Por defecto: FTS5 en SQLite, icontains en el resto de bases de datos
+def get_search_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path is None:
+        if connection.vendor == 'sqlite':
+            path = 'main.search.SQLiteFTSBackend'
+        else:
+            path = 'main.search.ORMSearchBackend'
+    return import_string(path)()
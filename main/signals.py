@@ -0,0 +1,233 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Producto, ProductoImage, Categoria, Proveedor, Profile, Cliente, Colaborador, Comerciante, Localizacion, Pedido
+from .roles import bump_version
+from . import api, dispatch, eventos, fragments, images, metrics, reference, slowlog, tarifas, ventas
+from .search import get_search_backend
+
+"""
+Senales de la aplicacion
+Mantienen el indice de busqueda, la imagen principal, sus variantes, los fragmentos cacheados
+y los ETags de la API sincronizados con los productos
+e invalidan los roles cacheados en la sesion, los datos de referencia y el indice de repartidores
+Tambien mantienen el resumen diario de ventas y avisan a los repartidores (pedidos en vivo)
+al pagar, entregar o cancelar pedidos
+y miden las consultas de cada conexion a la base de datos (metricas por vista y consultas lentas)
+"""
+
+# Al guardar un producto, se reindexa
+@receiver(post_save, sender=Producto)
+def index_producto(sender, instance, raw=False, **kwargs):
+    # Los fixtures (loaddata) se indexan con el comando rebuild_search_index
+    if raw:
+        return
+    get_search_backend().index_productos([instance.pk])
+
+
+# Al eliminar un producto, se quita del indice
+@receiver(post_delete, sender=Producto)
+def remove_producto(sender, instance, **kwargs):
+    get_search_backend().remove_productos([instance.pk])
+
+
+# Al cambiar una categoria, se reindexan sus productos
+@receiver(post_save, sender=Categoria)
+def index_categoria(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    get_search_backend().index_categoria(instance.pk)
+
+
+# Al cambiar un proveedor, se reindexan sus productos
+@receiver(post_save, sender=Proveedor)
+def index_proveedor(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    get_search_backend().index_proveedor(instance.pk)
+
+
+# Antes de eliminar una categoria o proveedor, se guardan sus productos
+# (al eliminar, sus productos quedan con el campo en null)
+@receiver(pre_delete, sender=Categoria)
+@receiver(pre_delete, sender=Proveedor)
+def collect_productos(sender, instance, **kwargs):
+    instance._search_producto_ids = list(instance.producto_set.values_list('id', flat=True))
+
+
+# Despues de eliminar una categoria o proveedor, se reindexan sus productos
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Proveedor)
+def reindex_productos(sender, instance, **kwargs):
+    get_search_backend().index_productos(getattr(instance, '_search_producto_ids', []))
+
+
+# Al registrar una imagen, se usa como principal si el producto no tiene una
+@receiver(post_save, sender=ProductoImage)
+def set_imagen_principal(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    Producto.objects.filter(pk=instance.product_id, imagen_principal__isnull=True).update(imagen_principal=instance)
+
+
+# Al guardar una imagen sin variantes (desde la tienda o el admin), se generan en segundo plano
+@receiver(post_save, sender=ProductoImage)
+def generate_variantes(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image or instance.card:
+        return
+    images.encolar(images.procesar_imagen, instance.pk)
+
+
+# Al cambiar una categoria o localizacion, se invalida su copia en memoria en todos los procesos
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=Localizacion)
+@receiver(post_delete, sender=Localizacion)
+def invalidate_reference(sender, **kwargs):
+    reference.TABLES[sender].invalidate()
+
+
+# Al cambiar un producto o sus imagenes, se invalidan los fragmentos cacheados que los muestran
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=ProductoImage)
+@receiver(post_delete, sender=ProductoImage)
+def invalidate_fragments(sender, raw=False, **kwargs):
+    if raw:
+        return
+    fragments.invalidate(fragments.HOME_LATEST)
+
+
+# Al cambiar un producto, sus imagenes o una categoria, cambian los ETags de la API
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=ProductoImage)
+@receiver(post_delete, sender=ProductoImage)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidate_api(sender, **kwargs):
+    api.invalidar()
+
+
+# Al eliminar la imagen principal, se usa la siguiente imagen del producto
+@receiver(post_delete, sender=ProductoImage)
+def replace_imagen_principal(sender, instance, **kwargs):
+    siguiente = ProductoImage.objects.filter(product_id=instance.product_id).order_by('id').first()
+    Producto.objects.filter(pk=instance.product_id, imagen_principal__isnull=True).update(imagen_principal=siguiente)
+
+
+# Al crear o eliminar un rol, se invalidan los roles cacheados de su usuario
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Cliente)
+@receiver(post_save, sender=Colaborador)
+@receiver(post_save, sender=Comerciante)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Colaborador)
+@receiver(post_delete, sender=Comerciante)
+@receiver(post_delete, sender=Proveedor)
+def invalidate_roles(sender, instance, created=True, raw=False, **kwargs):
+    if raw or not created:
+        return
+    if sender is Profile:
+        user_id = instance.user_id
+    elif sender is Proveedor:
+        if instance.comerciante_id is None:
+            return
+        user_id = Comerciante.objects.filter(pk=instance.comerciante_id).values_list('user_profile__user_id', flat=True).first()
+    else:
+        user_id = Profile.objects.filter(pk=instance.user_profile_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_version(user_id)
+
+
+# Al crear o modificar un colaborador, se actualiza el indice de repartidores
+@receiver(post_save, sender=Colaborador)
+def update_colaborador(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dispatch.actualizar_colaboradores([instance.pk])
+
+
+# Al eliminar un colaborador, se quita del indice de repartidores
+@receiver(post_delete, sender=Colaborador)
+def remove_colaborador(sender, instance, **kwargs):
+    dispatch.eliminar_colaborador(instance.pk)
+
+
+# Al cambiar la cobertura de entrega, se actualiza el indice de repartidores
+@receiver(m2m_changed, sender=Colaborador.cobertura_entrega.through)
+def update_cobertura(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        dispatch.actualizar_colaboradores([instance.pk])
+    elif pk_set:
+        dispatch.actualizar_colaboradores(list(pk_set))
+    else:
+        # post_clear desde una localizacion: no se conocen los colaboradores afectados
+        dispatch.actualizar_colaboradores(list(Colaborador.objects.values_list('pk', flat=True)))
+
+
+# Al crear o modificar una localizacion, se recalcula su fila y columna de tarifas
+@receiver(post_save, sender=Localizacion)
+def update_localizacion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    tarifas.actualizar_localizacion(instance.pk)
+
+
+# Al eliminar una localizacion, se libera su lugar en la matriz de tarifas
+@receiver(post_delete, sender=Localizacion)
+def remove_localizacion(sender, instance, **kwargs):
+    tarifas.eliminar_localizacion(instance.pk)
+
+
+# Antes de guardar un pedido, se lee su estado anterior (el guardado cambia la fecha de creacion)
+@receiver(pre_save, sender=Pedido)
+def collect_pedido(sender, instance, raw=False, **kwargs):
+    instance._pedido_anterior = None
+    if raw or instance.pk is None:
+        return
+    instance._pedido_anterior = Pedido.objects.filter(pk=instance.pk).values_list(
+        'estado', 'fecha_creacion', 'repartidor_id').first()
+
+
+# Al pagar o entregar un pedido (o si cambia su dia de venta), se actualiza el resumen de ventas
+@receiver(post_save, sender=Pedido)
+def update_ventas(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_pedido_anterior', None)
+    ventas.pedido_guardado(instance, ventas.dia_de_venta(*anterior[:2]) if anterior else None)
+
+
+# Al asignar, entregar o retirar un pedido, se avisa a su repartidor (pedidos en vivo)
+@receiver(post_save, sender=Pedido)
+def publish_pedido(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_pedido_anterior', None)
+    eventos.pedido_guardado(instance, (anterior[0], anterior[2]) if anterior else None)
+
+
+# Al eliminar una categoria, sus ventas pasan a las ventas sin categoria del resumen
+@receiver(pre_delete, sender=Categoria)
+def remove_categoria_ventas(sender, instance, **kwargs):
+    ventas.categoria_eliminada(instance.pk)
+
+
+# Al cancelar (eliminar) un pedido vendido, se resta del resumen de ventas y se avisa al repartidor
+@receiver(pre_delete, sender=Pedido)
+def remove_pedido(sender, instance, **kwargs):
+    ventas.pedido_eliminado(instance)
+    eventos.pedido_eliminado(instance)
+
+
+# Al abrir una conexion a la base de datos, se miden sus consultas (metricas por vista y consultas lentas)
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrumentar(connection)
+    slowlog.instrumentar(connection)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:
+    # Sin fcntl (Windows) los procesos no se coordinan al rotar el archivo
+    fcntl = None
+
+"""
+Registro de consultas lentas
+Cada consulta que tarda SLOW_QUERY_MS o mas se escribe como una linea JSON en
+SLOW_QUERY_LOG, con la vista de la peticion, la linea del proyecto que la hizo y su
+huella: el SQL normalizado (sin valores ni largos de listas IN), igual para todas
+las ejecuciones de la misma consulta
+La primera vez que un proceso ve una huella guarda tambien su plan (EXPLAIN)
+El archivo rota al pasar SLOW_QUERY_LOG_MAX_BYTES (SLOW_QUERY_LOG_BACKUPS copias); los
+workers lo comparten con un lock de archivo
+El comando slow_queries resume las consultas que mas tiempo toman
+"""
+
+# Huellas con plan guardado en este proceso (hasta MAX_HUELLAS; despues no se guardan mas planes)
+MAX_HUELLAS = 10000
+_huellas = set()
+_lock = threading.Lock()
+_escritura = threading.Lock()
+# Evita registrar las consultas hechas al registrar (savepoint del EXPLAIN)
+_local = threading.local()
+
+# Archivos que no cuentan como origen de una consulta (los middlewares solo llaman a la vista)
+_ARCHIVOS_PROPIOS = {os.path.abspath(__file__), os.path.abspath(metrics.__file__),
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'middleware.py')}
+_ORM = os.path.join('django', 'db', '')
+
+
+# SQL sin valores: literales y parametros como ?, listas IN como (...), espacios simples
+def normalizar(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def huella(sql_normalizado):
+    return hashlib.md5(sql_normalizado.encode()).hexdigest()[:16]
+
+
+# Primera linea del proyecto (fuera de las librerias) en la pila: 'main/views.py:120 in get_queryset'
+# Si no hay (vistas genericas de Django, templates), la primera linea fuera del ORM
+def origen():
+    base = os.path.abspath(settings.BASE_DIR)
+    respaldo = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        archivo = os.path.abspath(frame.f_code.co_filename)
+        if archivo not in _ARCHIVOS_PROPIOS:
+            if archivo.startswith(base + os.sep) and 'site-packages' not in archivo:
+                return linea(os.path.relpath(archivo, base), frame)
+            if respaldo is None and _ORM not in archivo:
+                respaldo = linea(archivo.rpartition('site-packages' + os.sep)[2], frame)
+        frame = frame.f_back
+    return respaldo
+
+
+def linea(archivo, frame):
+    return f'{archivo}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+# True la primera vez que el proceso ve la huella
+def primera_vez(fingerprint):
+    with _lock:
+        if fingerprint in _huellas or len(_huellas) >= MAX_HUELLAS:
+            return False
+        _huellas.add(fingerprint)
+        return True
+
+
+# Plan de un SELECT (lineas de texto, como QuerySet.explain()), o None si no se pudo obtener
+# Usa un cursor propio (sin los wrappers de la conexion) dentro de un savepoint: si el
+# EXPLAIN falla, la transaccion de la peticion sigue valida
+def explicar(connection, sql, params):
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    try:
+        with transaction.atomic(using=connection.alias):
+            cursor = connection.create_cursor()
+            try:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                filas = cursor.fetchall()
+            finally:
+                cursor.close()
+    except DatabaseError:
+        return None
+    return [' '.join(str(columna) for columna in fila) for fila in filas]
+
+
+# Wrapper de las consultas de una conexion (ver instrumentar)
+def registrar_consulta(execute, sql, params, many, context):
+    limite = getattr(settings, 'SLOW_QUERY_MS', None)
+    if limite is None or getattr(_local, 'registrando', False):
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    resultado = execute(sql, params, many, context)
+    ms = (time.perf_counter() - inicio) * 1000
+    if ms >= limite:
+        registrar(context['connection'], sql, params, many, ms)
+    return resultado
+
+
+# Escribe una consulta lenta en el registro
+def registrar(connection, sql, params, many, ms):
+    _local.registrando = True
+    try:
+        normalizado = normalizar(sql)
+        fingerprint = huella(normalizado)
+        entrada = {
+            'time': timezone.now().isoformat(),
+            'ms': round(ms, 3),
+            'fingerprint': fingerprint,
+            'view': metrics.vista_actual(),
+            'frame': origen(),
+            'alias': connection.alias,
+            'pid': os.getpid(),
+            'sql': normalizado,
+        }
+        if not many and primera_vez(fingerprint):
+            entrada['explain'] = explicar(connection, sql, params)
+        escribir(json.dumps(entrada))
+    except OSError:
+        # Sin espacio o sin permisos: la peticion sigue aunque no se registre la consulta
+        pass
+    finally:
+        _local.registrando = False
+
+
+# Mide las consultas de una conexion (senal connection_created)
+# Va primero en la lista: connection.execute_wrapper() quita el ultimo wrapper al salir
+def instrumentar(connection):
+    if registrar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, registrar_consulta)
+
+
+def log_path():
+    return getattr(settings, 'SLOW_QUERY_LOG', None) or os.path.join(
+        tempfile.gettempdir(), 'linioexp-slow-queries.log')
+
+
+# Archivos del registro, del actual al mas antiguo
+def archivos():
+    ruta = log_path()
+    copias = getattr(settings, 'SLOW_QUERY_LOG_BACKUPS', 5)
+    return [ruta] + [f'{ruta}.{i}' for i in range(1, copias + 1)]
+
+
+# Agrega una linea al registro; rota los archivos si el actual pasa el tamano maximo
+# El lock de archivo coordina a los procesos: cada escritura abre el archivo actual
+def escribir(linea):
+    actual, *copias = archivos()
+    maximo = getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024)
+    directorio = os.path.dirname(actual)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with _escritura, open(actual + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.getsize(actual) + len(linea) >= maximo:
+                rotar(actual, copias)
+        except FileNotFoundError:
+            pass
+        with open(actual, 'a', encoding='utf-8') as archivo:
+            archivo.write(linea + '\n')
+
+
+def rotar(actual, copias):
+    if not copias:
+        os.remove(actual)
+        return
+    for anterior, siguiente in reversed(list(zip([actual] + copias, copias))):
+        if os.path.exists(anterior):
+            os.replace(anterior, siguiente)
+
+
+# Entradas del registro (todas las copias); omite las lineas que no se pueden leer
+def entradas():
+    for ruta in archivos():
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                for linea in archivo:
+                    try:
+                        yield json.loads(linea)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,66 @@
+import os
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import auth
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import cached
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+from django.utils import translation
+from django.utils.module_loading import import_string
+
+from . import tarifas
+
+"""
+Arranque de los procesos web
+Lo que no se usa en todas las peticiones se carga recien al usarse (el storage de
+Dropbox, Pillow, los templates): manage.py y el release no lo pagan
+Con APP_WARMUP (gunicorn con preload_app, ver gunicorn.conf.py) precargar() lo carga
+una vez en el proceso principal y los workers lo heredan al crearse (fork), en vez de
+pagarlo cada uno en sus primeras peticiones
+El comando startup_profile mide cada etapa del arranque y los imports que la componen
+"""
+
+
+# Carga lo que cada worker cargaria en sus primeras peticiones
+# No abre conexiones ni inicia hilos: nada de esto queda compartido entre workers
+def precargar():
+    import_string(settings.DEFAULT_FILE_STORAGE)
+    import_module(settings.SESSION_ENGINE)
+    import_string(settings.MESSAGE_STORAGE)
+    for cache in settings.CACHES.values():
+        import_string(cache['BACKEND'])
+    auth.get_backends()
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+    get_resolver().reverse_dict
+    for backend, template in templates_del_proyecto():
+        backend.get_template(template)
+    # La matriz de tarifas se construye una vez por host, antes de crear los workers
+    tarifas.asegurar_matriz()
+    connections.close_all()
+
+
+# Templates del proyecto: [(backend, nombre)] de los backends de Django cuyo loader los
+# guarda ya compilados (DEBUG = False); los de Django (admin) se compilan al usarse
+def templates_del_proyecto():
+    base = os.path.abspath(settings.BASE_DIR)
+    templates = []
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        engine = backend.engine
+        if not any(isinstance(loader, cached.Loader) for loader in engine.template_loaders):
+            continue
+        directorios = list(engine.dirs) + (list(get_app_template_dirs('templates')) if engine.app_dirs else [])
+        for directorio in directorios:
+            directorio = os.path.abspath(directorio)
+            if not directorio.startswith(base + os.sep):
+                continue
+            for raiz, _, archivos in os.walk(directorio):
+                templates += [(backend, os.path.relpath(os.path.join(raiz, archivo), directorio).replace(os.sep, '/'))
+                              for archivo in archivos if archivo.endswith('.html')]
+    return templates
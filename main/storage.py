@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+
+from .asyncdb import en_hilo
+from .metrics import medir
+
+"""
+Storages con cache de urls
+DropBoxStorage.url() pide a la API de Dropbox un enlace temporal en cada llamada
+Las urls se guardan en el cache hasta poco antes de que venza el enlace, y las de
+una pagina completa se resuelven juntas (en paralelo) con precargar_urls
+(o precargar_urls_async desde las vistas async)
+Las llamadas al storage se miden en la peticion que las hace (main/metrics.py)
+El storage de Dropbox esta en main/storage_dropbox.py: el SDK de Dropbox se importa
+solo cuando se usa el storage, no al cargar las vistas
+"""
+
+# Hilos para resolver en paralelo las urls que no estan en el cache
+# (compartidos por todas las peticiones del proceso)
+URL_WORKERS = 8
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=URL_WORKERS, thread_name_prefix='storage-url')
+    return _executor
+
+
+# Mixin para cualquier storage: cachea el resultado de url(name)
+class CachedURLMixin:
+    # Segundos que una url sigue en el cache (None: no vence)
+    url_cache_timeout = None
+
+    # settings.STORAGE_URL_CACHE_TIMEOUT reemplaza el valor de la clase
+    def get_url_cache_timeout(self):
+        timeout = getattr(settings, 'STORAGE_URL_CACHE_TIMEOUT', None)
+        return self.url_cache_timeout if timeout is None else timeout
+
+    def url_cache_key(self, name):
+        digest = hashlib.md5(f'{type(self).__name__}:{name}'.encode()).hexdigest()
+        return f'storage:url:{digest}'
+
+    def url(self, name):
+        key = self.url_cache_key(name)
+        url = cache.get(key)
+        if url is None:
+            with medir('storage'):
+                url = super().url(name)
+            cache.set(key, url, self.get_url_cache_timeout())
+        return url
+
+    # Urls de varios archivos: una lectura del cache y las faltantes en paralelo
+    # Retorna {name: url}; omite los archivos cuya url no se pudo obtener
+    def urls(self, names):
+        urls, faltantes = self.urls_en_cache(names)
+        if not faltantes:
+            return urls
+        with medir('storage', len(faltantes)):
+            if len(faltantes) == 1:
+                resueltas = [self.resolver_url(faltantes[0])]
+            else:
+                resueltas = list(get_executor().map(self.resolver_url, faltantes))
+        urls.update(self.guardar_urls(resueltas))
+        return urls
+
+    # Version async de urls(): no ocupa un hilo mientras espera las urls faltantes
+    async def aurls(self, names):
+        urls, faltantes = await en_hilo(self.urls_en_cache, names)
+        if faltantes:
+            loop = asyncio.get_running_loop()
+            with medir('storage', len(faltantes)):
+                resueltas = await asyncio.gather(*(
+                    loop.run_in_executor(get_executor(), self.resolver_url, name) for name in faltantes))
+            urls.update(await en_hilo(self.guardar_urls, resueltas))
+        return urls
+
+    # Retorna ({name: url} de las que estan en el cache, [names faltantes])
+    def urls_en_cache(self, names):
+        names = list(dict.fromkeys(name for name in names if name))
+        keys = {self.url_cache_key(name): name for name in names}
+        cached = cache.get_many(list(keys))
+        urls = {keys[key]: url for key, url in cached.items()}
+        return urls, [name for name in names if name not in urls]
+
+    # Pide la url al storage (sin cache); retorna (name, url o None si fallo)
+    def resolver_url(self, name):
+        try:
+            return name, super().url(name)
+        except Exception:
+            return name, None
+
+    # Guarda en el cache las urls resueltas; retorna {name: url}
+    def guardar_urls(self, resueltas):
+        nuevas = {name: url for name, url in resueltas if url is not None}
+        if nuevas:
+            cache.set_many({self.url_cache_key(name): url for name, url in nuevas.items()},
+                           self.get_url_cache_timeout())
+        return nuevas
+
+    def _save(self, name, content):
+        with medir('storage'):
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with medir('storage'):
+            super().delete(name)
+        cache.delete(self.url_cache_key(name))
+
+
+# Storage local con cache de urls (desarrollo y pruebas)
+class CachedFileSystemStorage(CachedURLMixin, FileSystemStorage):
+    pass
+
+
+# Resuelve juntas las urls de varios archivos (FieldFile) para que las llamadas
+# a .url en el template lean del cache
+def precargar_urls(archivos):
+    for storage, names in agrupar_por_storage(archivos):
+        storage.urls(names)
+
+
+# Igual que precargar_urls, con los storages resueltos a la vez
+async def precargar_urls_async(archivos):
+    await asyncio.gather(*(storage.aurls(names) for storage, names in agrupar_por_storage(archivos)))
+
+
+# [(storage, [names])] de los archivos cuyo storage cachea urls
+def agrupar_por_storage(archivos):
+    por_storage = {}
+    for archivo in archivos:
+        if archivo and hasattr(archivo.storage, 'urls'):
+            por_storage.setdefault(id(archivo.storage), (archivo.storage, []))[1].append(archivo.name)
+    return list(por_storage.values())
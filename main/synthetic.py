@@ -0,0 +1,409 @@
+import bisect
+import datetime
+import itertools
+import multiprocessing
+import random
+from array import array
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (Categoria, Cliente, Colaborador, Comerciante, DetallePedido, Localizacion, Pedido,
+                     Producto, Profile, Proveedor)
+from .search import get_search_backend
+from . import api, dispatch, fragments, reference, tarifas, ventas
+
+"""
+Datos sinteticos para benchmarks y pruebas de carga
+Genera localizaciones, categorias, usuarios con todos los roles, un catalogo y un
+historial de pedidos con distribuciones sesgadas (productos, proveedores, clientes y
+localizaciones populares)
+Las filas se generan por bloques, cada uno con su propia semilla, en varios procesos;
+el proceso principal las inserta con bulk_create
+Es determinista: la misma semilla y volumen generan los mismos datos con cualquier
+cantidad de procesos (las fechas son relativas al dia de la generacion)
+"""
+
+# Filas por unidad de escala
+VOLUMEN = {
+    'clientes': 200,
+    'colaboradores': 50,
+    'comerciantes': 30,
+    'productos': 2000,
+    'pedidos': 1000,
+}
+
+# Tablas de referencia (no dependen de la escala)
+LOCALIZACIONES = 50
+CATEGORIAS = 20
+
+# Contrasena de todos los usuarios generados (se calcula un solo hash)
+PASSWORD = 'linioexp-synthetic'
+
+# Fraccion de comerciantes que ya registraron su comercio (proveedor)
+PROVEEDORES = 0.7
+
+# Dias de historial de pedidos
+DIAS_HISTORIAL = 365
+
+# Filas generadas por bloque (unidad de trabajo de cada proceso)
+FILAS_POR_BLOQUE = 10000
+
+VOCABULARIO = [
+    'polo', 'casaca', 'zapatilla', 'mochila', 'reloj', 'lampara', 'silla', 'mesa', 'audifono',
+    'celular', 'laptop', 'monitor', 'teclado', 'mouse', 'cafetera', 'licuadora', 'olla', 'sarten',
+    'pelota', 'bicicleta', 'muneca', 'libro', 'cuaderno', 'perfume', 'crema', 'shampoo', 'toalla',
+    'sabana', 'almohada', 'cortina', 'negro', 'blanco', 'azul', 'rojo', 'verde', 'grande', 'mediano',
+    'pequeno', 'clasico', 'deportivo', 'infantil', 'premium', 'basico', 'inalambrico', 'portatil',
+]
+
+
+# Pesos tipo Zipf: el elemento de rango r tiene peso 1 / (r + 1) ** s
+def pesos_zipf(n, s=1.0):
+    return array('d', itertools.accumulate(1.0 / (rank + 1) ** s for rank in range(n)))
+
+
+# Elige un elemento de la lista segun pesos acumulados
+def elegir(rnd, elementos, acumulados):
+    return elementos[bisect.bisect(acumulados, rnd.random() * acumulados[-1])]
+
+
+# Inserta objetos en bloques con bulk_create
+def insertar(model, objetos, batch_size=5000):
+    total = 0
+    while True:
+        bloque = list(itertools.islice(objetos, batch_size))
+        if not bloque:
+            return total
+        model.objects.bulk_create(bloque, batch_size=batch_size)
+        total += len(bloque)
+
+
+# Primer id libre de un modelo (los datos se agregan despues de los existentes)
+def siguiente_id(model):
+    return (model.objects.aggregate(maximo=Max('pk'))['maximo'] or 0) + 1
+
+
+# bulk_create aplica auto_now; se desactiva para insertar fechas historicas
+@contextmanager
+def fechas_historicas(model, campo):
+    field = model._meta.get_field(campo)
+    auto_now = field.auto_now
+    field.auto_now = False
+    try:
+        yield
+    finally:
+        field.auto_now = auto_now
+
+
+# Generacion de filas por bloque (se ejecuta en los procesos de trabajo, sin base de datos)
+# Cada funcion recibe (rnd, rango de posiciones, contexto) y retorna listas de filas (tuplas)
+# en el orden en que se deben insertar
+
+def filas_usuarios(rnd, posiciones, ctx):
+    users, profiles, clientes, colaboradores, cobertura, comerciantes, proveedores = [], [], [], [], [], [], []
+    localizaciones, localizacion_pesos = ctx['localizacion_ids'], ctx['localizacion_pesos']
+    for i in posiciones:
+        user_id = ctx['user_inicio'] + i
+        profile_id = ctx['profile_inicio'] + i
+        users.append((user_id, f'synthetic{user_id}', ctx['password'], f'synthetic{user_id}@example.com',
+                      ctx['ahora'] - datetime.timedelta(days=rnd.randrange(3 * DIAS_HISTORIAL))))
+        profiles.append((profile_id, user_id, f'{rnd.randrange(10 ** 8):08d}',
+                         datetime.date(1960, 1, 1) + datetime.timedelta(days=rnd.randrange(40 * 365)),
+                         'A', rnd.choice(('MA', 'FE', 'NB'))))
+        if i < ctx['clientes']:
+            clientes.append((ctx['cliente_inicio'] + i, profile_id))
+        elif i < ctx['clientes'] + ctx['colaboradores']:
+            colaborador_id = ctx['colaborador_inicio'] + i - ctx['clientes']
+            colaboradores.append((colaborador_id, profile_id, round(rnd.uniform(1, 5), 2)))
+            # Cobertura: 1 a 3 localizaciones, sesgada hacia las populares
+            for localizacion_id in sorted({elegir(rnd, localizaciones, localizacion_pesos)
+                                           for _ in range(rnd.randint(1, 3))}):
+                cobertura.append((colaborador_id, localizacion_id))
+        else:
+            j = i - ctx['clientes'] - ctx['colaboradores']
+            comerciante_id = ctx['comerciante_inicio'] + j
+            comerciantes.append((comerciante_id, profile_id))
+            if j < ctx['proveedores']:
+                proveedor_id = ctx['proveedor_inicio'] + j
+                proveedores.append((proveedor_id, comerciante_id, f'{20 * 10 ** 9 + proveedor_id:011d}'[-11:],
+                                    f'Comercio {proveedor_id}'[:20], f'9{rnd.randrange(10 ** 8):08d}',
+                                    elegir(rnd, localizaciones, localizacion_pesos)))
+    return [users, profiles, clientes, colaboradores, cobertura, comerciantes, proveedores]
+
+
+def filas_productos(rnd, posiciones, ctx):
+    productos = []
+    for i in posiciones:
+        producto_id = ctx['producto_inicio'] + i
+        precio = round(rnd.lognormvariate(4, 0.9), 2)
+        productos.append((
+            producto_id, ' '.join(rnd.sample(VOCABULARIO, 2))[:20],
+            ' '.join(rnd.choices(VOCABULARIO, k=rnd.randint(8, 30))),
+            precio, rnd.choice((0, 0, 0, 0.1, 0.2, 0.3)), 'A',
+            # Algunos proveedores y categorias tienen muchos mas productos que otros
+            elegir(rnd, ctx['categoria_ids'], ctx['categoria_pesos']),
+            ctx['proveedor_inicio'] + bisect.bisect(
+                ctx['proveedor_pesos'], rnd.random() * ctx['proveedor_pesos'][-1])))
+    return [productos]
+
+
+# Pedidos pagados y entregados de los ultimos DIAS_HISTORIAL dias, con 1 a 5 productos
+def filas_pedidos(rnd, posiciones, ctx):
+    pedidos, detalles = [], []
+    localizaciones, localizacion_pesos = ctx['localizacion_ids'], ctx['localizacion_pesos']
+    popularidad, producto_pesos, precios = ctx['popularidad'], ctx['producto_pesos'], ctx['precios']
+    tarifa = tarifas.TARIFA_POR_DEFECTO
+    for i in posiciones:
+        pedido_id = ctx['pedido_inicio'] + i
+        ubicacion_id = elegir(rnd, localizaciones, localizacion_pesos)
+        repartidores = ctx['repartidores'].get(ubicacion_id)
+        repartidor_id = rnd.choice(repartidores) if repartidores else (
+            ctx['colaborador_inicio'] + rnd.randrange(ctx['colaboradores']))
+        subtotal = 0
+        for producto_id in sorted({elegir(rnd, popularidad, producto_pesos) for _ in range(rnd.randint(1, 5))}):
+            cantidad = rnd.choices((1, 2, 3), (8, 2, 1))[0]
+            precio = precios[producto_id - ctx['producto_inicio']]
+            subtotal += precio * cantidad
+            detalles.append((pedido_id, producto_id, cantidad, precio,
+                             ctx['producto_categorias'][producto_id - ctx['producto_inicio']]))
+        # Mas pedidos en los dias recientes; los de mas de 2 dias casi todos entregados
+        edad = datetime.timedelta(minutes=int(DIAS_HISTORIAL * 24 * 60 * rnd.random() ** 1.5))
+        creado = ctx['ahora'] - edad
+        entregado = edad > datetime.timedelta(days=2) and rnd.random() < 0.97
+        pedidos.append((
+            pedido_id, ctx['cliente_inicio'] + bisect.bisect(
+                ctx['cliente_pesos'], rnd.random() * ctx['cliente_pesos'][-1]),
+            repartidor_id, ubicacion_id, creado, 'ENT' if entregado else 'PAG',
+            creado + datetime.timedelta(hours=rnd.randint(2, 72)) if entregado else None,
+            f'Calle {rnd.randint(1, 999)}', rnd.choice(('Boleta', 'Factura')), tarifa, subtotal, subtotal + tarifa))
+    return [pedidos, detalles]
+
+
+# Por tabla: funcion que genera las filas y (modelo, campos) de cada lista de filas que retorna
+FILAS = {
+    'usuarios': (filas_usuarios, [
+        (User, ('id', 'username', 'password', 'email', 'date_joined')),
+        (Profile, ('id', 'user_id', 'documento_identidad', 'fecha_nacimiento', 'estado', 'genero')),
+        (Cliente, ('id', 'user_profile_id')),
+        (Colaborador, ('id', 'user_profile_id', 'reputacion')),
+        (Colaborador.cobertura_entrega.through, ('colaborador_id', 'localizacion_id')),
+        (Comerciante, ('id', 'user_profile_id')),
+        (Proveedor, ('id', 'comerciante_id', 'ruc', 'razon_social', 'telefono', 'ubicacion_id')),
+    ]),
+    'productos': (filas_productos, [
+        (Producto, ('id', 'nombre', 'descripcion', 'precio', 'descuento', 'estado', 'categoria_id',
+                    'proveedor_id')),
+    ]),
+    'pedidos': (filas_pedidos, [
+        (Pedido, ('id', 'cliente_id', 'repartidor_id', 'ubicacion_id', 'fecha_creacion', 'estado',
+                  'fecha_entrega', 'direccion_entrega', 'comprobante', 'tarifa', 'subtotal', 'total')),
+        (DetallePedido, ('pedido_id', 'producto_id', 'cantidad', 'precio_unitario', 'categoria_id')),
+    ]),
+}
+
+# Contexto del proceso de trabajo (se recibe una vez al iniciar el proceso)
+_contexto = None
+
+
+def _iniciar_proceso(contexto):
+    global _contexto
+    _contexto = contexto
+
+
+def _generar_bloque(tarea):
+    tabla, bloque, inicio, fin = tarea
+    rnd = random.Random(f'{_contexto["semilla"]}:{tabla}:{bloque}')
+    return bloque, FILAS[tabla][0](rnd, range(inicio, fin), _contexto)
+
+
+# Generador de datos sinteticos
+# volumen: filas por tabla (reemplaza a escala * VOLUMEN); workers: procesos que generan filas
+class Generador:
+    def __init__(self, escala=1, semilla=1, batch_size=5000, workers=1, volumen=None, progreso=None):
+        self.escala = escala
+        self.semilla = semilla
+        self.batch_size = batch_size
+        self.workers = workers
+        self.volumen = volumen or {}
+        self.progreso = progreso
+        self.ahora = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    # Cada tabla usa su propio generador aleatorio: agregar una tabla no cambia las demas
+    def random(self, tabla):
+        return random.Random(f'{self.semilla}:{tabla}')
+
+    def cantidad(self, tabla):
+        if self.volumen.get(tabla) is not None:
+            return self.volumen[tabla]
+        return max(1, int(VOLUMEN[tabla] * self.escala))
+
+    # Genera todos los datos; retorna {modelo: filas creadas}
+    def generar(self):
+        self.creadas = {}
+        self.localizaciones()
+        self.categorias()
+        self.usuarios()
+        self.productos()
+        with fechas_historicas(Pedido, 'fecha_creacion'):
+            self.pedidos()
+        self.reset_sequences()
+        self.invalidar()
+        return self.creadas
+
+    # Genera las filas de 'total' posiciones por bloques (en paralelo si hay varios workers)
+    # y las inserta en orden; llama a al_insertar(bloque, filas) despues de cada bloque
+    def ejecutar(self, tabla, total, contexto, al_insertar=None):
+        contexto = dict(contexto, semilla=self.semilla)
+        tareas = [(tabla, bloque, inicio, min(total, inicio + FILAS_POR_BLOQUE))
+                  for bloque, inicio in enumerate(range(0, total, FILAS_POR_BLOQUE))]
+        if self.workers > 1 and len(tareas) > 1:
+            # Los procesos no usan la base de datos; la conexion no se comparte con ellos
+            connection.close()
+            pool = multiprocessing.get_context('fork').Pool(
+                min(self.workers, len(tareas)), _iniciar_proceso, (contexto,))
+            resultados = pool.imap(_generar_bloque, tareas)
+        else:
+            pool = None
+            _iniciar_proceso(contexto)
+            resultados = map(_generar_bloque, tareas)
+        if self.progreso:
+            self.progreso(tabla, 0, total)
+        try:
+            for bloque, filas in resultados:
+                for (model, campos), valores in zip(FILAS[tabla][1], filas):
+                    nombre = model._meta.model_name
+                    self.creadas[nombre] = self.creadas.get(nombre, 0) + insertar(
+                        model, (model(**dict(zip(campos, fila))) for fila in valores), self.batch_size)
+                if al_insertar:
+                    al_insertar(bloque, filas)
+                if self.progreso:
+                    self.progreso(tabla, min(total, (bloque + 1) * FILAS_POR_BLOQUE), total)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def localizaciones(self):
+        rnd = self.random('localizaciones')
+        inicio = siguiente_id(Localizacion)
+        ids = range(inicio, inicio + LOCALIZACIONES)
+        self.creadas['localizacion'] = insertar(Localizacion, (Localizacion(
+            id=pk, distrito=f'Distrito {pk}', provincia=f'Provincia {pk // 5}',
+            departamento=f'Departamento {pk // 25}',
+            latitud=round(rnd.uniform(-18.0, -0.5), 5), longitud=round(rnd.uniform(-81.0, -69.0), 5))
+            for pk in ids), self.batch_size)
+        # Pocas localizaciones concentran la mayoria de pedidos y repartidores
+        self.localizacion_ids = list(ids)
+        rnd.shuffle(self.localizacion_ids)
+        self.localizacion_pesos = pesos_zipf(len(self.localizacion_ids), 0.8)
+
+    def categorias(self):
+        inicio = siguiente_id(Categoria)
+        self.categoria_ids = list(range(inicio, inicio + CATEGORIAS))
+        self.creadas['categoria'] = insertar(Categoria, (
+            Categoria(id=pk, codigo=f'{pk % 10000:04d}', nombre=f'categoria{pk}') for pk in self.categoria_ids),
+            self.batch_size)
+
+    # Usuarios y perfiles; cada perfil tiene un rol: cliente, colaborador o comerciante
+    # (y proveedor para una parte de los comerciantes)
+    def usuarios(self):
+        self.clientes = self.cantidad('clientes')
+        self.colaboradores = self.cantidad('colaboradores')
+        # A cualquier escala hay comerciantes con proveedor y sin el (aun no registran su comercio)
+        comerciantes = max(2, self.cantidad('comerciantes'))
+        self.proveedores = min(comerciantes - 1, max(1, int(comerciantes * PROVEEDORES)))
+        self.cliente_inicio = siguiente_id(Cliente)
+        self.colaborador_inicio = siguiente_id(Colaborador)
+        self.proveedor_inicio = siguiente_id(Proveedor)
+        contexto = {
+            # Sal fija: el hash tambien depende solo de la semilla
+            'password': make_password(PASSWORD, salt=f'synthetic{self.semilla}'),
+            'ahora': self.ahora,
+            'localizacion_ids': self.localizacion_ids,
+            'localizacion_pesos': self.localizacion_pesos,
+            'clientes': self.clientes,
+            'colaboradores': self.colaboradores,
+            'proveedores': self.proveedores,
+            'user_inicio': siguiente_id(User),
+            'profile_inicio': siguiente_id(Profile),
+            'cliente_inicio': self.cliente_inicio,
+            'colaborador_inicio': self.colaborador_inicio,
+            'comerciante_inicio': siguiente_id(Comerciante),
+            'proveedor_inicio': self.proveedor_inicio,
+        }
+        # Repartidores que cubren cada localizacion (para asignar los pedidos)
+        self.repartidores = {}
+
+        def registrar_cobertura(bloque, filas):
+            for colaborador_id, localizacion_id in filas[4]:
+                self.repartidores.setdefault(localizacion_id, array('l')).append(colaborador_id)
+
+        self.ejecutar('usuarios', self.clientes + self.colaboradores + comerciantes, contexto, registrar_cobertura)
+
+    def productos(self):
+        total = self.cantidad('productos')
+        self.producto_inicio = siguiente_id(Producto)
+        # Precio final (con descuento) y categoria de cada producto, para el detalle de los pedidos
+        self.precios = array('d', bytes(8 * total))
+        self.producto_categorias = array('l', bytes(array('l').itemsize * total))
+
+        def registrar_precios(bloque, filas):
+            for fila in filas[0]:
+                self.precios[fila[0] - self.producto_inicio] = fila[3] * (1 - fila[4])
+                self.producto_categorias[fila[0] - self.producto_inicio] = fila[6]
+
+        self.ejecutar('productos', total, {
+            'producto_inicio': self.producto_inicio,
+            'categoria_ids': self.categoria_ids,
+            'categoria_pesos': pesos_zipf(len(self.categoria_ids), 0.5),
+            'proveedor_inicio': self.proveedor_inicio,
+            'proveedor_pesos': pesos_zipf(self.proveedores, 0.7),
+        }, registrar_precios)
+
+    def pedidos(self):
+        # Popularidad: pocos productos aparecen en la mayoria de pedidos
+        popularidad = array('l', range(self.producto_inicio, self.producto_inicio + len(self.precios)))
+        self.random('popularidad').shuffle(popularidad)
+        self.ejecutar('pedidos', self.cantidad('pedidos'), {
+            'ahora': self.ahora,
+            'pedido_inicio': siguiente_id(Pedido),
+            'localizacion_ids': self.localizacion_ids,
+            'localizacion_pesos': self.localizacion_pesos,
+            'repartidores': self.repartidores,
+            'colaborador_inicio': self.colaborador_inicio,
+            'colaboradores': self.colaboradores,
+            'cliente_inicio': self.cliente_inicio,
+            'cliente_pesos': pesos_zipf(self.clientes, 0.6),
+            'producto_inicio': self.producto_inicio,
+            'popularidad': popularidad,
+            'producto_pesos': pesos_zipf(len(popularidad), 1.1),
+            'precios': self.precios,
+            'producto_categorias': self.producto_categorias,
+        })
+
+    # Como loaddata: las secuencias de ids continuan despues de los ids generados
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), [
+            User, Profile, Localizacion, Categoria, Cliente, Colaborador, Comerciante, Proveedor,
+            Producto, Pedido, DetallePedido])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    # bulk_create no envia senales: se actualizan los indices y caches derivados
+    def invalidar(self):
+        for table in reference.TABLES.values():
+            table.invalidate()
+        fragments.invalidate(fragments.HOME_LATEST)
+        api.invalidar()
+        get_search_backend().rebuild()
+        dispatch.invalidar_indice()
+        tarifas.reconstruir_matriz()
+        tarifas.asegurar_matriz()
+        ventas.reconstruir()
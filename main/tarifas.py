@@ -0,0 +1,362 @@
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Localizacion, DetallePedido
+
+try:
+    import fcntl
+except ImportError:
+    # Sin fcntl (Windows) los procesos no se coordinan al escribir la matriz
+    fcntl = None
+
+"""
+Tarifas de envio
+Matriz precalculada origen x destino (localizaciones) guardada en un archivo
+y leida con mmap: la consulta en el checkout es O(1) y no toca la base de datos
+Formato: cabecera | ids de localizacion por slot (int32) | tarifas en centimos (uint16)
+Al cambiar una localizacion se recalcula solo su fila y su columna (O(n))
+La matriz completa (O(n^2)) se construye al arrancar (startup.precargar, en el proceso
+principal de gunicorn); si un proceso no la encuentra, la construye en un hilo y mientras
+tanto calcula cada tarifa desde la base de datos
+"""
+
+# Cabecera: magic, generacion, capacidad (slots), reservado
+HEADER = struct.Struct('=4sIII')
+MAGIC = b'TRF1'
+# Capacidad minima de la matriz
+MIN_CAPACITY = 64
+
+# Tarifa con coordenadas: base + costo por km, con tope
+TARIFA_BASE = 5.0
+TARIFA_POR_KM = 0.4
+TARIFA_MAXIMA = 60.0
+# Tarifa sin coordenadas, segun la division territorial en comun
+TARIFA_DISTRITO = 5.0
+TARIFA_PROVINCIA = 8.0
+TARIFA_DEPARTAMENTO = 12.0
+TARIFA_NACIONAL = 20.0
+# Tarifa si no se conoce el origen o el destino
+TARIFA_POR_DEFECTO = 12.0
+
+# Campos de Localizacion que usa el calculo
+CAMPOS = ('id', 'distrito', 'provincia', 'departamento', 'latitud', 'longitud')
+
+
+# Radio de la tierra en km
+RADIO_KM = 6371.0
+
+
+# Datos de una localizacion listos para el calculo: (id, distrito, provincia,
+# departamento, latitud y longitud en radianes, coseno de la latitud)
+def preparar(localizacion):
+    loc_id, distrito, provincia, departamento, latitud, longitud = localizacion
+    if latitud is None or longitud is None:
+        return (loc_id, distrito, provincia, departamento, None, None, None)
+    latitud, longitud = math.radians(latitud), math.radians(longitud)
+    return (loc_id, distrito, provincia, departamento, latitud, longitud, math.cos(latitud))
+
+
+# Tarifas (en centimos) de un origen a cada destino; la tarifa es simetrica
+# Distancia por la formula de haversine si ambos tienen coordenadas,
+# si no segun la division territorial que comparten
+def fila_tarifas(origen, destinos):
+    _, distrito, provincia, departamento, latitud, longitud, coseno = origen
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+    fila = []
+    for _, distrito2, provincia2, departamento2, latitud2, longitud2, coseno2 in destinos:
+        if latitud is not None and latitud2 is not None:
+            a = sin((latitud2 - latitud) / 2) ** 2 + coseno * coseno2 * sin((longitud2 - longitud) / 2) ** 2
+            tarifa = min(TARIFA_BASE + TARIFA_POR_KM * 2 * RADIO_KM * asin(sqrt(min(a, 1.0))), TARIFA_MAXIMA)
+        elif departamento != departamento2:
+            tarifa = TARIFA_NACIONAL
+        elif provincia != provincia2:
+            tarifa = TARIFA_DEPARTAMENTO
+        elif distrito != distrito2:
+            tarifa = TARIFA_PROVINCIA
+        else:
+            tarifa = TARIFA_DISTRITO
+        fila.append(round(tarifa * 100))
+    return fila
+
+
+# Matriz de tarifas de un proceso, sobre el archivo compartido
+class FeeMatrix:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.file = None
+        self.mm = None
+        self.generation = None
+        self.capacity = 0
+        self.slots = {}
+        self.ids = None
+        self.values = None
+        self.lock_depth = 0
+        # Construccion en curso en un hilo del proceso (las consultas no la esperan)
+        self.building = False
+
+    # Bloqueo entre procesos para las escrituras (reentrante dentro del proceso)
+    @contextmanager
+    def write_lock(self):
+        with self.lock:
+            if self.lock_depth:
+                self.lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self.lock_depth -= 1
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self.lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self.lock_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        # Las vistas de memoria se liberan antes de cerrar el mmap
+        for view in (self.ids, self.values):
+            if view is not None:
+                view.release()
+        self.ids = self.values = None
+        if self.mm is not None:
+            self.mm.close()
+            self.file.close()
+        self.mm = self.file = None
+        self.generation = None
+
+    # Abre el archivo (si otro proceso lo reemplazo, abre el nuevo) y lee los slots
+    def open(self):
+        self.close()
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, generation, capacity, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{self.path} is not a fee matrix')
+        offset = HEADER.size
+        self.ids = memoryview(self.mm)[offset:offset + 4 * capacity].cast('i')
+        self.values = memoryview(self.mm)[offset + 4 * capacity:].cast('H')
+        self.capacity = capacity
+        self.generation = generation
+        self.slots = {loc_id: slot for slot, loc_id in enumerate(self.ids) if loc_id}
+
+    # Asegura que el mapeo este vigente; False si el archivo no existe
+    def ensure_current(self):
+        if self.mm is None:
+            if not os.path.exists(self.path):
+                return False
+            self.open()
+        elif HEADER.unpack_from(self.mm, 0)[1] != self.generation:
+            self.open()
+        return True
+
+    # Tarifa de origen a destino (ids de Localizacion); None si alguno no existe
+    # Sin la matriz (o sin alguno de los dos en ella) se calcula desde la base de datos
+    def lookup(self, origen_id, destino_id):
+        if self.mm is None and not os.path.exists(self.path):
+            self.build_in_background()
+        if self.building:
+            return tarifa_directa(origen_id, destino_id)
+        with self.lock:
+            if self.ensure_current():
+                origen = self.slots.get(origen_id)
+                destino = self.slots.get(destino_id)
+                if origen is not None and destino is not None:
+                    return self.values[origen * self.capacity + destino] / 100
+        return tarifa_directa(origen_id, destino_id)
+
+    # Construye el archivo si falta (otro proceso pudo construirlo mientras se esperaba el lock)
+    def build_missing(self):
+        with self.lock, self.write_lock():
+            if not os.path.exists(self.path):
+                self.build()
+
+    # Construye el archivo que falta en un hilo del proceso
+    def build_in_background(self):
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._build_thread, name='tarifas', daemon=True).start()
+
+    def _build_thread(self):
+        try:
+            self.build_missing()
+        finally:
+            self.building = False
+            connections.close_all()
+
+    # Marca un cambio de slots: los demas procesos releen el mapeo
+    def bump_generation(self, generation=None):
+        if generation is None:
+            generation = HEADER.unpack_from(self.mm, 0)[1] + 1
+        HEADER.pack_into(self.mm, 0, MAGIC, generation, self.capacity, 0)
+        self.generation = generation
+
+    # Construye el archivo completo; la capacidad deja espacio para nuevas localizaciones
+    def build(self):
+        with self.lock, self.write_lock():
+            localizaciones = [preparar(row) for row in
+                              Localizacion.objects.values_list(*CAMPOS).order_by('id')]
+            capacity = MIN_CAPACITY
+            while capacity < len(localizaciones) * 5 // 4:
+                capacity *= 2
+            ids = array('i', [0] * capacity)
+            values = array('H', bytes(2 * capacity * capacity))
+            # Se calcula el triangulo superior y se copia en la columna
+            for slot, origen in enumerate(localizaciones):
+                ids[slot] = origen[0]
+                fila = fila_tarifas(origen, localizaciones[slot:])
+                row = slot * capacity
+                values[row + slot:row + len(localizaciones)] = array('H', fila)
+                values[row + slot + capacity:len(localizaciones) * capacity:capacity] = array('H', fila[1:])
+
+            # El archivo anterior queda con la nueva generacion: quien lo tenga mapeado
+            # detecta el cambio y abre el nuevo
+            previous = None
+            if os.path.exists(self.path):
+                try:
+                    self.open()
+                    previous = self.generation
+                except ValueError:
+                    self.close()
+            generation = (previous or 0) + 1
+
+            directory = os.path.dirname(self.path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tarifas')
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(HEADER.pack(MAGIC, generation, capacity, 0))
+                tmp.write(ids.tobytes())
+                tmp.write(values.tobytes())
+            os.replace(tmp_path, self.path)
+            if previous is not None:
+                self.bump_generation(generation)
+            self.close()
+
+    # Recalcula la fila y la columna de una localizacion (nueva o modificada)
+    def update(self, localizacion_id):
+        with self.lock:
+            if not self.ensure_current():
+                return
+            with self.write_lock():
+                if not self.ensure_current():
+                    return
+                localizaciones = dict(
+                    (row[0], preparar(row)) for row in Localizacion.objects.values_list(*CAMPOS))
+                localizacion = localizaciones.get(localizacion_id)
+                if localizacion is None:
+                    return
+                slot = self.slots.get(localizacion_id)
+                nuevo = slot is None
+                if nuevo:
+                    libres = [i for i in range(self.capacity) if not self.ids[i]]
+                    if not libres:
+                        # Matriz llena: se reconstruye con el doble de capacidad
+                        self.build()
+                        return
+                    slot = libres[0]
+                    self.ids[slot] = localizacion_id
+                    self.slots[localizacion_id] = slot
+                capacity = self.capacity
+                otros = [(other_slot, localizaciones[other_id])
+                         for other_id, other_slot in self.slots.items() if other_id in localizaciones]
+                fila = fila_tarifas(localizacion, [other for _, other in otros])
+                for (other_slot, _), centimos in zip(otros, fila):
+                    self.values[slot * capacity + other_slot] = centimos
+                    self.values[other_slot * capacity + slot] = centimos
+                if nuevo:
+                    self.bump_generation()
+
+    # Libera el slot de una localizacion eliminada
+    def remove(self, localizacion_id):
+        with self.lock:
+            if not self.ensure_current():
+                return
+            with self.write_lock():
+                if not self.ensure_current():
+                    return
+                slot = self.slots.pop(localizacion_id, None)
+                if slot is not None:
+                    self.ids[slot] = 0
+                    self.bump_generation()
+
+
+# Matriz del proceso
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_matrix():
+    global _matrix
+    with _matrix_lock:
+        path = getattr(settings, 'FEE_MATRIX_PATH', None) or os.path.join(
+            tempfile.gettempdir(), 'linioexp-tarifas.bin')
+        if _matrix is None or _matrix.path != path:
+            if _matrix is not None:
+                _matrix.close()
+            _matrix = FeeMatrix(path)
+        return _matrix
+
+
+# Tarifa calculada desde la base de datos, sin la matriz; None si alguna no existe
+def tarifa_directa(origen_id, destino_id):
+    localizaciones = {row[0]: preparar(row) for row in Localizacion.objects.filter(
+        pk__in=[origen_id, destino_id]).values_list(*CAMPOS)}
+    if origen_id not in localizaciones or destino_id not in localizaciones:
+        return None
+    return fila_tarifas(localizaciones[origen_id], [localizaciones[destino_id]])[0] / 100
+
+
+# Construye la matriz si falta; se llama al arrancar (startup.precargar)
+def asegurar_matriz():
+    get_matrix().build_missing()
+
+
+# Tarifa de un pedido: la mayor entre los origenes (ubicacion de los proveedores)
+# de sus productos y la ubicacion de entrega
+def tarifa_pedido(pedido):
+    if pedido.ubicacion_id is None:
+        return TARIFA_POR_DEFECTO
+    origenes = set(DetallePedido.objects.filter(pedido_id=pedido.pk).values_list(
+        'producto__proveedor__ubicacion_id', flat=True).distinct())
+    origenes.discard(None)
+    matrix = get_matrix()
+    tarifas = [matrix.lookup(origen, pedido.ubicacion_id) for origen in origenes]
+    tarifas = [tarifa for tarifa in tarifas if tarifa is not None]
+    return max(tarifas) if tarifas else TARIFA_POR_DEFECTO
+
+
+# Actualiza la matriz al crear o modificar una localizacion; se llama desde las senales
+def actualizar_localizacion(localizacion_id):
+    matrix = get_matrix()
+    if os.path.exists(matrix.path):
+        matrix.update(localizacion_id)
+
+
+# Quita una localizacion de la matriz; se llama desde las senales
+def eliminar_localizacion(localizacion_id):
+    matrix = get_matrix()
+    if os.path.exists(matrix.path):
+        matrix.remove(localizacion_id)
+
+
+# Reconstruye la matriz completa (despues de cargas masivas de localizaciones)
+def reconstruir_matriz():
+    matrix = get_matrix()
+    if os.path.exists(matrix.path):
+        matrix.build()
@@ -1,3 +1,322 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .catalog_import import iter_records
+from .dispatch import TODAS, DispatchIndex
+from .models import (Categoria, Cliente, DetallePedido, Localizacion, Pedido, Producto, Profile, Proveedor,
+                     VentaDiaria)
+from .pagination import decode_cursor, encode_cursor, filter_after
+from .storage import CachedURLMixin, precargar_urls
+from . import tarifas, ventas
+
+"""
+Pruebas de la logica de main sin el servidor: cache de urls de los storages,
+cursores de paginacion, indice de repartidores, matriz de tarifas, lectura de
+archivos de importacion y resumen de ventas
+"""
+
+
+# Storage local que anota los names de cada llamada a url() (en lugar de la API de Dropbox)
+class StorageContado(FileSystemStorage):
+    def __init__(self, *args, fallidos=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.llamadas = []
+        self.fallidos = set(fallidos)
+
+    def url(self, name):
+        self.llamadas.append(name)
+        if name in self.fallidos:
+            raise ConnectionError(name)
+        return super().url(name)
+
+
+class StorageCacheado(CachedURLMixin, StorageContado):
+    url_cache_timeout = 60
+
+
+class CachedURLTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.storage = StorageCacheado(location=tempfile.gettempdir(), base_url='/media/')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_url_se_pide_una_vez(self):
+        self.assertEqual(self.storage.url('a.png'), '/media/a.png')
+        self.assertEqual(self.storage.url('a.png'), '/media/a.png')
+        self.assertEqual(self.storage.llamadas, ['a.png'])
+
+    def test_urls_solo_pide_las_faltantes(self):
+        self.storage.url('a.png')
+        urls = self.storage.urls(['a.png', 'b.png', 'c.png', 'b.png', ''])
+        self.assertEqual(urls, {'a.png': '/media/a.png', 'b.png': '/media/b.png', 'c.png': '/media/c.png'})
+        self.assertEqual(sorted(self.storage.llamadas), ['a.png', 'b.png', 'c.png'])
+
+    def test_urls_omite_las_que_fallan(self):
+        storage = StorageCacheado(location=tempfile.gettempdir(), base_url='/media/', fallidos={'b.png'})
+        self.assertEqual(storage.urls(['a.png', 'b.png']), {'a.png': '/media/a.png'})
+        # La que fallo no queda en el cache: se vuelve a pedir
+        storage.urls(['a.png', 'b.png'])
+        self.assertEqual(sorted(storage.llamadas), ['a.png', 'b.png', 'b.png'])
+
+    def test_delete_invalida_la_url(self):
+        self.storage.url('a.png')
+        self.storage.delete('a.png')
+        self.storage.url('a.png')
+        self.assertEqual(self.storage.llamadas, ['a.png', 'a.png'])
+
+    def test_precargar_urls(self):
+        otro = StorageCacheado(location=tempfile.gettempdir(), base_url='/otro/')
+        sin_cache = StorageContado(location=tempfile.gettempdir(), base_url='/media/')
+        archivos = [SimpleNamespace(storage=self.storage, name=f'{i}.png') for i in range(5)]
+        archivos += [SimpleNamespace(storage=otro, name='x.png'), SimpleNamespace(storage=sin_cache, name='y.png'),
+                     None]
+        precargar_urls(archivos)
+        self.assertEqual(sorted(self.storage.llamadas), [f'{i}.png' for i in range(5)])
+        self.assertEqual(otro.llamadas, ['x.png'])
+        # Los storages sin cache de urls no se consultan al precargar
+        self.assertEqual(sin_cache.llamadas, [])
+        # En el template, .url lee del cache
+        for archivo in archivos[:6]:
+            archivo.storage.url(archivo.name)
+        self.assertEqual(len(self.storage.llamadas) + len(otro.llamadas), 6)
+
+
+class CursorTest(TestCase):
+    def setUp(self):
+        for nombre, precio in (('a', 10), ('b', 20), ('c', 20), ('d', 30), ('e', 20)):
+            Producto.objects.create(nombre=nombre, descripcion='x', precio=precio, estado='A')
+        self.ordering = ('-precio', '-id')
+        self.productos = list(Producto.objects.order_by(*self.ordering))
+
+    def test_encode_decode(self):
+        cursor = encode_cursor('n', [19.9, 12, 'texto', None])
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), ('n', [19.9, 12, 'texto', None]))
+
+    def test_cursor_invalido(self):
+        for cursor in ('', 'xx', encode_cursor('x', [1]), encode_cursor('p', [[1]]), encode_cursor('n', [{}]),
+                       encode_cursor('n', 1)):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_filter_after(self):
+        queryset = Producto.objects.order_by(*self.ordering)
+        for i, producto in enumerate(self.productos):
+            values = [producto.precio, producto.pk]
+            self.assertEqual(list(filter_after(queryset, self.ordering, values)), self.productos[i + 1:])
+            anteriores = filter_after(queryset.order_by('precio', 'id'), self.ordering, values, reverse=True)
+            self.assertEqual(list(anteriores), self.productos[:i][::-1])
+
+    def test_filter_after_valor_invalido(self):
+        with self.assertRaises(ValueError):
+            filter_after(Producto.objects.all(), self.ordering, ['caro', 1])
+
+
+class DispatchIndexTest(SimpleTestCase):
+    def setUp(self):
+        # Colaboradores (id, reputacion, perfil): 1 y 2 cubren la localizacion 100, 3 la 200
+        self.index = DispatchIndex()
+        self.index.load([(1, 4.0, 10), (2, 1.0, 20), (3, None, 30)],
+                        [(1, 100), (2, 100), (3, 200), (4, 100)], {})
+
+    def test_prefiere_menor_carga_por_reputacion(self):
+        self.assertEqual(self.index.peek(100), 1)
+        self.index.add_carga(1, 1)
+        self.assertEqual(self.index.peek(100), 1)
+        # (2 + 1) / 5 supera a (0 + 1) / 2
+        self.index.add_carga(1, 1)
+        self.assertEqual(self.index.peek(100), 2)
+        self.index.add_carga(1, -2)
+        self.assertEqual(self.index.peek(100), 1)
+
+    def test_localizacion_sin_colaboradores(self):
+        self.assertEqual(self.index.peek(200), 3)
+        self.assertIsNone(self.index.peek(300))
+        self.assertEqual(self.index.peek(TODAS), 1)
+
+    def test_excluir_perfil(self):
+        self.assertEqual(self.index.peek(100, excluir_perfil_id=10), 2)
+        self.assertIsNone(self.index.peek(200, excluir_perfil_id=30))
+        # Los excluidos vuelven al heap
+        self.assertEqual(self.index.peek(100), 1)
+        self.assertEqual(self.index.peek(200), 3)
+
+    def test_cambios_de_colaboradores(self):
+        self.index.set_colaborador(3, 5.0, 30, [100])
+        self.assertEqual(self.index.peek(100), 3)
+        # La entrada anterior de la localizacion 200 ya no vale
+        self.assertIsNone(self.index.peek(200))
+        self.index.remove_colaborador(3)
+        self.index.remove_colaborador(1)
+        self.assertEqual(self.index.peek(100), 2)
+        self.assertEqual(self.index.peek(TODAS), 2)
+
+    def test_compacta_los_heaps(self):
+        for _ in range(1100):
+            self.index.add_carga(2, 1)
+            self.index.add_carga(2, -1)
+        self.assertLessEqual(len(self.index.heaps[100]), 1000)
+        self.assertEqual(self.index.peek(100), 1)
+
+
+class FeeMatrixTest(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.settings_override = override_settings(FEE_MATRIX_PATH=os.path.join(self.directorio, 'tarifas.bin'))
+        self.settings_override.enable()
+        self.miraflores = Localizacion.objects.create(
+            distrito='Miraflores', provincia='Lima', departamento='Lima', latitud=-12.12, longitud=-77.03)
+        self.cusco = Localizacion.objects.create(
+            distrito='Cusco', provincia='Cusco', departamento='Cusco', latitud=-13.53, longitud=-71.97)
+        self.surco = Localizacion.objects.create(distrito='Surco', provincia='Lima', departamento='Lima')
+        tarifas.asegurar_matriz()
+        self.matrix = tarifas.get_matrix()
+
+    def tearDown(self):
+        tarifas.get_matrix().close()
+        self.settings_override.disable()
+        shutil.rmtree(self.directorio)
+
+    def test_lookup(self):
+        self.assertAlmostEqual(self.matrix.lookup(self.miraflores.pk, self.miraflores.pk), tarifas.TARIFA_DISTRITO)
+        self.assertAlmostEqual(self.matrix.lookup(self.miraflores.pk, self.cusco.pk), tarifas.TARIFA_MAXIMA)
+        self.assertAlmostEqual(self.matrix.lookup(self.miraflores.pk, self.surco.pk), tarifas.TARIFA_PROVINCIA)
+        self.assertAlmostEqual(self.matrix.lookup(self.surco.pk, self.cusco.pk), tarifas.TARIFA_NACIONAL)
+        self.assertIsNone(self.matrix.lookup(self.miraflores.pk, 0))
+        self.assertEqual(self.matrix.lookup(self.cusco.pk, self.surco.pk),
+                         tarifas.tarifa_directa(self.cusco.pk, self.surco.pk))
+
+    def test_update(self):
+        # Las senales recalculan la fila de la localizacion modificada
+        self.surco.latitud, self.surco.longitud = -12.13, -77.0
+        self.surco.save()
+        tarifa = self.matrix.lookup(self.miraflores.pk, self.surco.pk)
+        self.assertTrue(tarifas.TARIFA_BASE < tarifa < tarifas.TARIFA_BASE + 2)
+        self.assertEqual(self.matrix.lookup(self.surco.pk, self.miraflores.pk), tarifa)
+
+    def test_update_desde_otro_proceso(self):
+        otro = tarifas.FeeMatrix(self.matrix.path)
+        self.assertAlmostEqual(otro.lookup(self.miraflores.pk, self.surco.pk), tarifas.TARIFA_PROVINCIA)
+        barranco = Localizacion.objects.create(distrito='Barranco', provincia='Lima', departamento='Lima')
+        self.assertIn(barranco.pk, self.matrix.slots)
+        self.assertAlmostEqual(otro.lookup(barranco.pk, self.surco.pk), tarifas.TARIFA_PROVINCIA)
+        self.assertIn(barranco.pk, otro.slots)
+        barranco.delete()
+        self.assertIsNone(otro.lookup(barranco.pk, self.surco.pk))
+        otro.close()
+
+    def test_matriz_llena(self):
+        self.matrix.lookup(self.miraflores.pk, self.surco.pk)
+        capacidad = self.matrix.capacity
+        for i in range(capacidad):
+            Localizacion.objects.create(distrito=f'Distrito {i}', provincia='Lima', departamento='Lima')
+        self.assertEqual(self.matrix.lookup(self.miraflores.pk, self.surco.pk), tarifas.TARIFA_PROVINCIA)
+        self.assertEqual(self.matrix.capacity, 2 * capacidad)
+
+
+class IterRecordsTest(SimpleTestCase):
+    registros = [{'model': 'main.categoria', 'pk': 1, 'fields': {'nombre': 'Polos, camisas [y] mas'}},
+                 {'model': 'main.producto', 'fields': {'nombre': 'Polo {rojo}', 'precio': 19.9}}]
+
+    def leer(self, texto, **kwargs):
+        return list(iter_records(io.StringIO(texto), chunk_size=7, **kwargs))
+
+    def test_json(self):
+        self.assertEqual(self.leer(json.dumps(self.registros, indent=2)), self.registros)
+        self.assertEqual(self.leer('\n  [ ]'), [])
+
+    def test_ndjson(self):
+        texto = '\n'.join(json.dumps(registro) for registro in self.registros)
+        self.assertEqual(self.leer(texto), self.registros)
+        self.assertEqual(self.leer(texto + '\n\n'), self.registros)
+        self.assertEqual(self.leer(''), [])
+
+    def test_formato_explicito(self):
+        self.assertEqual(self.leer(json.dumps(self.registros), format='json'), self.registros)
+        with self.assertRaises(ValueError):
+            self.leer(json.dumps(self.registros[0]), format='json')
+
+    def test_json_incompleto(self):
+        with self.assertRaises(ValueError):
+            self.leer(json.dumps(self.registros)[:-1])
+        with self.assertRaises(ValueError):
+            self.leer(json.dumps(self.registros)[:-10])
+
+
+class VentasTest(TestCase):
+    def setUp(self):
+        self.categoria = Categoria.objects.create(codigo='1', nombre='Electronica')
+        self.otra_categoria = Categoria.objects.create(codigo='2', nombre='Hogar')
+        self.proveedor = Proveedor.objects.create(ruc='1' * 11, razon_social='Sony', telefono='9' * 9)
+        self.tele = Producto.objects.create(nombre='Tele', descripcion='x', precio=100, descuento=0.1, estado='A',
+                                            categoria=self.categoria, proveedor=self.proveedor)
+        self.radio = Producto.objects.create(nombre='Radio', descripcion='x', precio=50, estado='A',
+                                             proveedor=self.proveedor)
+        user = User.objects.create_user(username='cliente', password='clave')
+        perfil = Profile.objects.create(user=user, documento_identidad='12345678', estado='A', genero='MA',
+                                        fecha_nacimiento=datetime.date(1990, 1, 1))
+        self.cliente = Cliente.objects.create(user_profile=perfil)
+        self.fecha = datetime.date(2020, 10, 1)
+
+    def resumen(self):
+        return {(venta.categoria_id, venta.fecha): (venta.unidades, round(venta.ingresos, 2))
+                for venta in VentaDiaria.objects.filter(proveedor=self.proveedor)}
+
+    # Pedido pagado con 2 teles y 1 radio, al precio y categoria de hoy
+    def pedido_pagado(self):
+        pedido = Pedido.objects.create(cliente=self.cliente, estado='EP')
+        for producto, cantidad in ((self.tele, 2), (self.radio, 1)):
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad,
+                                         precio_unitario=producto.precio * (1 - producto.descuento),
+                                         categoria_id=producto.categoria_id)
+        pedido.estado = 'PAG'
+        pedido.save()
+        return pedido
+
+    def test_aplicar(self):
+        filas = [(self.proveedor.pk, self.categoria.pk, 2, 180.0), (self.proveedor.pk, None, 1, 50.0)]
+        ventas.aplicar(filas, self.fecha)
+        ventas.aplicar(filas, self.fecha)
+        self.assertEqual(self.resumen(), {(self.categoria.pk, self.fecha): (4, 360.0), (None, self.fecha): (2, 100.0)})
+        ventas.aplicar(filas, self.fecha, -1)
+        ventas.aplicar(filas, self.fecha, -1)
+        self.assertEqual(self.resumen(), {(self.categoria.pk, self.fecha): (0, 0.0), (None, self.fecha): (0, 0.0)})
+
+    def test_pedido_pagado_y_cancelado(self):
+        pedido = self.pedido_pagado()
+        hoy = timezone.localdate(pedido.fecha_creacion)
+        esperado = {(self.categoria.pk, hoy): (2, 180.0), (None, hoy): (1, 50.0)}
+        self.assertEqual(self.resumen(), esperado)
+        # Se resta lo que se sumo al pagar aunque el producto cambie despues
+        self.tele.precio, self.tele.categoria = 10, self.otra_categoria
+        self.tele.save()
+        pedido.cancelar_pedido()
+        self.assertEqual(self.resumen(), {(self.categoria.pk, hoy): (0, 0.0), (None, hoy): (0, 0.0)})
+
+    def test_reconstruir(self):
+        pedido = self.pedido_pagado()
+        self.pedido_pagado()
+        Pedido.objects.create(cliente=self.cliente, estado='EP')
+        incremental = self.resumen()
+        VentaDiaria.objects.create(proveedor=self.proveedor, categoria=self.otra_categoria, fecha=self.fecha,
+                                   unidades=5, ingresos=5)
+        self.assertEqual(ventas.reconstruir(), 2)
+        self.assertEqual(self.resumen(), incremental)
+        hoy = timezone.localdate(pedido.fecha_creacion)
+        self.assertEqual(incremental[(self.categoria.pk, hoy)], (4, 360.0))
+        # Solo el rango pedido
+        self.assertEqual(ventas.reconstruir(desde=self.fecha, hasta=self.fecha), 0)
+        self.assertEqual(self.resumen(), incremental)
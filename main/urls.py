@@ -1,24 +1,35 @@
 from django.urls import path
 
-from . import views
+from . import api, comentarios, eventos, export, metrics, ventas, views
 from django.conf import settings
 from django.conf.urls.static import static
 
+# Bajo ASGI el catalogo usa las vistas async (settings.ASYNC_VIEWS)
+if settings.ASYNC_VIEWS:
+    HomePageView, ProductListView, ProductDetailView = (
+        views.AsyncHomePageView, views.AsyncProductListView, views.AsyncProductDetailView)
+else:
+    HomePageView, ProductListView, ProductDetailView = (
+        views.HomePageView, views.ProductListView, views.ProductDetailView)
+
 # Mapeo entre endpoints de la web / direcciones url y las vistas en el archivo views.py
 urlpatterns = [
-    path('', views.HomePageView.as_view(), name='home'),
-    path('productos', views.ProductListView.as_view(), name='product-list'),
-    path('productos/<int:pk>', views.ProductDetailView.as_view(), name='product-detail'),
+    path('', HomePageView.as_view(), name='home'),
+    path('productos', ProductListView.as_view(), name='product-list'),
+    path('productos/<int:pk>', ProductDetailView.as_view(), name='product-detail'),
     path('add_to_cart/<int:product_pk>', views.AddToCartView.as_view(), name='add-to-cart'),
     path('remove_from_cart/<int:product_pk>', views.RemoveFromCartView.as_view(), name='remove-from-cart'),
     path('carrito/', views.PedidoDetailView.as_view(), name='pedido-detail'),
     path('pedido/<int:pedido_pk>', views.PedidoDetailView.as_view(), name='paid-pedido-detail'),
+    # Comentarios nuevos del pedido (JSON, consulta periodica de la pagina del pedido)
+    path('pedido/<int:pedido_pk>/comentarios', comentarios.ComentariosNuevosView.as_view(), name='comentarios-nuevos'),
     path('checkout/<int:pk>', views.PedidoUpdateView.as_view(), name='pedido-update'),
     path('payment/', views.PaymentView.as_view(), name='payment'),
     path('complete_payment/', views.CompletePaymentView.as_view(), name='complete-payment'),
     path('registro/', views.RegistrationView.as_view(), name='register'),
     path('empty_car/', views.empty_car, name='empty-car'),
     path('no_client/', views.no_client, name='no-client'),
+    path('no_provider/', views.no_provider, name='no-provider'),
     path('invalid_age/', views.invalid_age, name='invalid-age'),
     path('invalid_dni/', views.invalid_dni, name='invalid-dni'),
     path('invalid_ruc/', views.invalid_ruc, name='invalid-ruc'),
@@ -29,7 +40,19 @@ urlpatterns = [
     path('register_product/', views.RegisterProductView.as_view(), name='registar-producto'),
     path('edit_product/<int:pk>', views.EditProductView.as_view(), name='editar-producto'),
     path('pedidos', views.PedidoListView.as_view(), name='pedido-list'),
+    # Pedidos del repartidor en vivo (server-sent events; bajo ASGI lo atiende eventos.application)
+    path('pedidos/eventos', eventos.EventosRepartidorView.as_view(), name='eventos-repartidor'),
     path('cancel_pedido/<int:pedido_pk>', views.DeletePedido.as_view(), name='cancelar-pedido'),
     path('register_comment/<int:pedido_pk>', views.RegisterCommentView.as_view(), name='registrar-comentario'),
-    path('deliver_pedido/<int:pedido_pk>', views.PedidoDeliveredView.as_view(), name='pedido-delivered')
+    path('deliver_pedido/<int:pedido_pk>', views.PedidoDeliveredView.as_view(), name='pedido-delivered'),
+    # Panel de ventas del proveedor (lee el resumen diario)
+    path('ventas/', ventas.VentasDashboardView.as_view(), name='ventas-dashboard'),
+    # Ventas del proveedor (csv o ndjson)
+    path('ventas/export.<str:formato>', export.ExportVentasView.as_view(), name='exportar-ventas'),
+    # API JSON del catalogo (solo lectura)
+    path('api/productos', api.ProductoListAPI.as_view(), name='api-producto-list'),
+    path('api/productos/<int:pk>', api.ProductoDetailAPI.as_view(), name='api-producto-detail'),
+    path('api/categorias', api.CategoriaListAPI.as_view(), name='api-categoria-list'),
+    # Metricas por vista de todos los workers (formato Prometheus)
+    path('metrics', metrics.MetricsView.as_view(), name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,181 @@
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.http import HttpResponseBadRequest
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.views.generic import TemplateView
+
+from .export import inicio_del_dia
+from .models import DetallePedido, VentaDiaria
+from . import reference
+
+"""
+Resumen diario de ventas por proveedor y categoria (tabla VentaDiaria)
+Un pedido cuenta como venta mientras esta pagado o entregado, en el dia (local) de
+su fecha de creacion; las senales suman su aporte al pasar a esos estados y lo
+restan al salir de ellos, al cambiar de dia o al cancelarse
+El panel de ventas del proveedor lee solo esta tabla: su costo depende de los dias
+consultados y no de la cantidad de detalles vendidos
+El resumen usa el precio y la categoria guardados en el detalle del pedido (los de la
+venta): lo que se resta al cancelar un pedido es lo mismo que se sumo al pagarlo, aunque
+despues cambie el producto; rebuild_sales_rollups lo recalcula desde los pedidos
+"""
+
+# Estados de un pedido vendido
+VENDIDO = ('PAG', 'ENT')
+
+
+# Dia (local) en que cuenta la venta de un pedido, o None si no esta vendido
+def dia_de_venta(estado, fecha_creacion):
+    if estado not in VENDIDO or fecha_creacion is None:
+        return None
+    return timezone.localdate(fecha_creacion)
+
+
+# Aporte de un pedido al resumen: [(proveedor_id, categoria_id, unidades, ingresos)] (una consulta)
+def aporte(pedido_id):
+    return list(DetallePedido.objects.filter(pedido_id=pedido_id, producto__proveedor__isnull=False).values_list(
+        'producto__proveedor_id', 'categoria_id').annotate(
+        unidades=Sum('cantidad'), ingresos=DetallePedido.subtotal_expression()).order_by())
+
+
+# Suma (signo=1) o resta (signo=-1) un aporte al resumen del dia
+# La actualizacion es atomica en la base de datos (F); las filas que faltan se crean
+def aplicar(filas, fecha, signo=1):
+    for proveedor_id, categoria_id, unidades, ingresos in filas:
+        unidades, ingresos = signo * (unidades or 0), signo * (ingresos or 0)
+        venta = VentaDiaria.objects.filter(proveedor_id=proveedor_id, categoria_id=categoria_id, fecha=fecha)
+        if venta.update(unidades=F('unidades') + unidades, ingresos=F('ingresos') + ingresos):
+            continue
+        try:
+            with transaction.atomic():
+                VentaDiaria.objects.create(proveedor_id=proveedor_id, categoria_id=categoria_id, fecha=fecha,
+                                           unidades=unidades, ingresos=ingresos)
+        except IntegrityError:
+            # Otra peticion creo la fila al mismo tiempo
+            venta.update(unidades=F('unidades') + unidades, ingresos=F('ingresos') + ingresos)
+
+
+# Actualiza el resumen despues de guardar un pedido
+# anterior: dia de venta del pedido antes de guardarlo (ver dia_de_venta)
+def pedido_guardado(pedido, anterior):
+    actual = dia_de_venta(pedido.estado, pedido.fecha_creacion)
+    if anterior == actual:
+        return
+    filas = aporte(pedido.pk)
+    with transaction.atomic():
+        if anterior is not None:
+            aplicar(filas, anterior, -1)
+        if actual is not None:
+            aplicar(filas, actual)
+
+
+# Quita un pedido vendido del resumen (antes de eliminarlo, mientras existe su detalle)
+def pedido_eliminado(pedido):
+    dia = dia_de_venta(pedido.estado, pedido.fecha_creacion)
+    if dia is not None:
+        aplicar(aporte(pedido.pk), dia, -1)
+
+
+# Pasa las filas de una categoria que se va a eliminar a las filas sin categoria del
+# mismo proveedor y dia (en lugar de SET_NULL, que dejaria varias filas sin categoria)
+# como sus detalles vendidos, que quedan sin categoria
+def categoria_eliminada(categoria_id):
+    filas = VentaDiaria.objects.filter(categoria_id=categoria_id)
+    de_la_categoria = filas.filter(proveedor_id=OuterRef('proveedor_id'), fecha=OuterRef('fecha'))
+    sin_categoria = VentaDiaria.objects.filter(
+        categoria__isnull=True, proveedor_id=OuterRef('proveedor_id'), fecha=OuterRef('fecha'))
+    with transaction.atomic():
+        # Se suman a la fila sin categoria si ya existe; si no, pasan a serlo
+        VentaDiaria.objects.filter(Exists(de_la_categoria), categoria__isnull=True).update(
+            unidades=F('unidades') + Subquery(de_la_categoria.values('unidades')[:1]),
+            ingresos=F('ingresos') + Subquery(de_la_categoria.values('ingresos')[:1]))
+        filas.filter(~Exists(sin_categoria)).update(categoria=None)
+        filas.delete()
+
+
+# Recalcula el resumen desde los pedidos vendidos (todos o los de un rango de dias / proveedor)
+# Retorna la cantidad de filas creadas
+def reconstruir(desde=None, hasta=None, proveedor_id=None, batch_size=1000):
+    detalles = DetallePedido.objects.filter(pedido__estado__in=VENDIDO, producto__proveedor__isnull=False)
+    resumen = VentaDiaria.objects.all()
+    if proveedor_id is not None:
+        detalles = detalles.filter(producto__proveedor_id=proveedor_id)
+        resumen = resumen.filter(proveedor_id=proveedor_id)
+    if desde:
+        detalles = detalles.filter(pedido__fecha_creacion__gte=inicio_del_dia(desde))
+        resumen = resumen.filter(fecha__gte=desde)
+    if hasta:
+        detalles = detalles.filter(pedido__fecha_creacion__lt=inicio_del_dia(hasta + datetime.timedelta(days=1)))
+        resumen = resumen.filter(fecha__lte=hasta)
+    # TruncDate usa la zona horaria actual, como dia_de_venta
+    filas = detalles.annotate(fecha=TruncDate('pedido__fecha_creacion')).values_list(
+        'producto__proveedor_id', 'categoria_id', 'fecha').annotate(
+        unidades=Sum('cantidad'), ingresos=DetallePedido.subtotal_expression()).order_by()
+
+    creadas = 0
+    with transaction.atomic():
+        resumen.delete()
+        lote = []
+        for proveedor, categoria, fecha, unidades, ingresos in filas.iterator():
+            lote.append(VentaDiaria(proveedor_id=proveedor, categoria_id=categoria, fecha=fecha,
+                                    unidades=unidades or 0, ingresos=ingresos or 0))
+            if len(lote) >= batch_size:
+                VentaDiaria.objects.bulk_create(lote)
+                creadas += len(lote)
+                lote = []
+        VentaDiaria.objects.bulk_create(lote)
+        creadas += len(lote)
+    return creadas
+
+
+# Ventas del proveedor por dia, en el rango (un registro por dia, incluidos los dias sin ventas)
+def por_dia(proveedor_id, desde, hasta):
+    ventas = {fila['fecha']: fila for fila in VentaDiaria.objects.filter(
+        proveedor_id=proveedor_id, fecha__range=(desde, hasta)).values('fecha').annotate(
+        unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by()}
+    dias = [desde + datetime.timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    return [ventas.get(dia) or {'fecha': dia, 'unidades': 0, 'ingresos': 0} for dia in dias]
+
+
+# Ventas del proveedor por categoria en el rango, de mayor a menor ingreso
+# Los nombres de las categorias se leen de la copia en memoria
+def por_categoria(proveedor_id, desde, hasta):
+    filas = VentaDiaria.objects.filter(proveedor_id=proveedor_id, fecha__range=(desde, hasta)).values(
+        'categoria_id').annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by('-ingresos')
+    return [dict(fila, categoria=reference.categorias.get(fila['categoria_id'])) for fila in filas]
+
+
+# Panel de ventas del proveedor del usuario
+# Parametros GET opcionales: desde, hasta (AAAA-MM-DD); por defecto los ultimos SALES_DASHBOARD_DAYS dias
+class VentasDashboardView(TemplateView):
+    template_name = 'main/ventas_dashboard.html'
+
+    def get(self, request, *args, **kwargs):
+        proveedor_id = request.roles.proveedor_id
+        if proveedor_id is None:
+            return redirect('/no_provider/')
+        try:
+            desde, hasta = (datetime.date.fromisoformat(request.GET[parametro]) if request.GET.get(parametro)
+                            else None for parametro in ('desde', 'hasta'))
+        except ValueError:
+            return HttpResponseBadRequest('desde and hasta must be dates (YYYY-MM-DD)')
+        hasta = hasta or timezone.localdate()
+        desde = desde or hasta - datetime.timedelta(days=getattr(settings, 'SALES_DASHBOARD_DAYS', 30) - 1)
+        maximo = getattr(settings, 'SALES_DASHBOARD_MAX_DAYS', 366)
+        if not 0 <= (hasta - desde).days < maximo:
+            return HttpResponseBadRequest(f'desde must be before hasta, at most {maximo} days apart')
+        return super().get(request, proveedor_id=proveedor_id, desde=desde, hasta=hasta)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        dias = por_dia(context['proveedor_id'], context['desde'], context['hasta'])
+        context['dias'] = dias
+        context['categorias'] = por_categoria(context['proveedor_id'], context['desde'], context['hasta'])
+        context['unidades'] = sum(dia['unidades'] for dia in dias)
+        context['ingresos'] = sum(dia['ingresos'] for dia in dias)
+        return context
@@ -1,16 +1,25 @@
+import asyncio
+
 from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView, FormView, TemplateView, View, UpdateView
 from django.urls import reverse_lazy
+from django.conf import settings
 from django.contrib.auth import login
+from django.db import transaction
 from django.db.models import F
 from django.contrib import messages
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.db.models import Q
-from random import randint
 from django.forms import ImageField
 
 from .models import *
 from .forms import *
+from .search import get_search_backend
+from .pagination import KeysetPaginationMixin
+from .roles import forget_roles
+from .storage import precargar_urls, precargar_urls_async
+from .asyncdb import en_hilo, marcar_async
+from . import comentarios, dispatch, eventos, fragments, images, reference, tarifas
 
 # Create your views here.
 # Vista principal (default)
@@ -23,45 +32,34 @@ class HomePageView(TemplateView):
 
     # Carga la pagina
     def get(self, request, *args, **kwargs):
-        # Es el perfil comerciante?
-        user = request.user
-        # Se consulta si el comerciante ha registrado su comercio
-        try:
-            perfil = Profile.objects.get(user=user)
-            comerciante = Comerciante.objects.get(user_profile=perfil)
-            print(Proveedor.objects.filter(
-                comerciante=comerciante))
-            self.puede_registrar_comercio = Proveedor.objects.filter(
-                comerciante=comerciante).count() == 0
-            self.puede_registrar_producto = not self.puede_registrar_comercio
-        except Exception as e:
-            self.puede_registrar_comercio = False
-            self.puede_registrar_producto = False
-
-        # Se consulta si el cliente tiene pedido
-        try:
-            cliente = Cliente.objects.get(user_profile=perfil)
-            self.tiene_pedido = Pedido.objects.filter(
-                cliente=cliente).count() >= 1
-        except Exception as e:
-            self.tiene_pedido = False
+        # Roles del usuario (resueltos por RolesMiddleware)
+        roles = request.roles
+        # Es comerciante? Se consulta si ha registrado su comercio
+        self.puede_registrar_comercio = roles.is_comerciante and not roles.is_proveedor
+        self.puede_registrar_producto = roles.is_proveedor
 
-        # Se consulta si el colaborador tiene pedidos por enviar
-        try:
-            colaborador = Colaborador.objects.get(user_profile=perfil)
-            self.tiene_por_entregar = Pedido.objects.filter(
-                repartidor=colaborador).count() >= 1
-        except Exception as e:
-            self.tiene_por_entregar = False
+        self.tiene_pedido = self.consultar_pedido(roles)
+        self.tiene_por_entregar = self.consultar_por_entregar(roles)
 
         return super().get(self,request,*args,**kwargs)
 
+    # Se consulta si el cliente tiene pedido
+    def consultar_pedido(self, roles):
+        return roles.is_cliente and Pedido.objects.filter(cliente_id=roles.cliente_id).exists()
+
+    # Se consulta si el colaborador tiene pedidos por enviar
+    def consultar_por_entregar(self, roles):
+        return roles.is_colaborador and Pedido.objects.filter(repartidor_id=roles.colaborador_id).exists()
+
 
     # Carga los elementos de la pagina
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Carga los ultimos 5 productos añadidos
+        # El queryset es perezoso: solo se consulta si el fragmento no esta en el cache
         context['latest_products'] = Producto.objects.all().order_by('-id')[:5]
+        context['latest_version'] = fragments.get_version(fragments.HOME_LATEST)
+        context['home_cache_timeout'] = settings.HOME_CACHE_TIMEOUT
         context['puede_registrar_comercio'] = self.puede_registrar_comercio
         context['puede_registrar_producto'] = self.puede_registrar_producto
         context['tiene_pedido'] = self.tiene_pedido
@@ -71,43 +69,59 @@ class HomePageView(TemplateView):
 
 
 
-# Vista de pedidos (vista tipo lista)
-class PedidoListView(ListView):
+# Vista de pedidos (vista tipo lista, paginada por cursor)
+class PedidoListView(KeysetPaginationMixin, ListView):
     # La lista se basa en el modelo producto
     model = Pedido
 
     # Filtro de productos
     def get_queryset(self):
-        perfil = Profile.objects.filter(user=self.request.user)[0]
-        try:
-            cliente = Cliente.objects.filter(user_profile=perfil)[0]
-        except Exception as e:
-            cliente = None
-
-        try:
-            self.colaborador = Colaborador.objects.filter(user_profile=perfil)[0]
-        except Exception as e:
-            self.colaborador = None
-
-        object_list = Pedido.objects.filter(
-            Q(cliente=cliente) | Q(repartidor=self.colaborador),
-            Q(estado='PAG') | Q(estado='ENT'))
+        roles = self.request.roles
+        self.colaborador_id = roles.colaborador_id
+
+        # Pedidos del usuario como cliente o como repartidor (solo de los roles que tiene)
+        # Cada rol es una rama de la consulta (ver get_keyset_rows)
+        self.ramas = []
+        if roles.is_cliente:
+            self.ramas.append(Q(cliente_id=roles.cliente_id))
+        if roles.is_colaborador:
+            self.ramas.append(Q(repartidor_id=self.colaborador_id))
+
+        # Carga cliente, repartidor y ubicacion en la misma consulta
+        # (el total esta materializado en el pedido, no se lee el detalle)
+        object_list = Pedido.objects.filter(estado__in=['PAG', 'ENT']).select_related(
+            'cliente__user_profile__user', 'repartidor__user_profile__user', 'ubicacion')
         return object_list
 
+    # En lugar de un OR sobre cliente y repartidor (que no puede usar un indice), cada rama
+    # recorre su indice (rol, -id) y aporta a lo mas 'limit' ids; la consulta une las ramas
+    # por clave primaria y ordena solo esas filas
+    def get_keyset_rows(self, queryset, limit):
+        if not self.ramas:
+            return []
+        ramas = Q(pk__in=[])
+        for rama in self.ramas:
+            ramas |= Q(pk__in=queryset.filter(rama).values('pk')[:limit])
+        return list(queryset.filter(ramas)[:limit])
+
     def get_context_data(self, **kwargs):
         context = super(PedidoListView, self).get_context_data(**kwargs)
-        if(self.colaborador is None):
-            context['colaborador'] = ""
-        else:
-            context['colaborador'] = self.colaborador
+        context['colaborador_id'] = self.colaborador_id
         return context
 
 
-# Vista de productos (vista tipo lista)
-class ProductListView(ListView):
+# Vista de productos (vista tipo lista, paginada por cursor)
+class ProductListView(KeysetPaginationMixin, ListView):
     # La lista se basa en el modelo producto
     model = Producto
     selectedCategory = ""
+    selectedOrder = ""
+    # Ordenes disponibles (parametro GET 'orden'); el ultimo campo es unico
+    ORDENES = {
+        'recientes': ('-id',),
+        'precio_asc': ('precio', 'id'),
+        'precio_desc': ('-precio', '-id'),
+    }
 
     # Filtro de productos
     def get_queryset(self):
@@ -119,42 +133,112 @@ class ProductListView(ListView):
             if(query=="buscar_por_categoria"):
                 query = self.request.GET.get('categoria')
                 self.selectedCategory = query
-                categoria_id = Categoria.objects.filter(nombre=query)[0]
-                object_list = Producto.objects.filter(categoria=categoria_id)
-            # Por key word
+                categoria = reference.categorias.get_by('nombre', query)
+                object_list = Producto.objects.filter(categoria=categoria) if categoria else Producto.objects.none()
+            # Por key word (indice de busqueda, ordenado por relevancia)
             else:
-                object_list = Producto.objects.filter(nombre__icontains=query)
-            return object_list
+                object_list = get_search_backend().search(query)
         else:
-            return Producto.objects.all()
+            object_list = Producto.objects.all()
+
+        # Orden elegido (por defecto: relevancia en busquedas, recientes en el resto)
+        orden = self.request.GET.get('orden')
+        if orden in self.ORDENES:
+            self.selectedOrder = orden
+            object_list = object_list.order_by(*self.ORDENES[orden])
+        # La imagen de cada tarjeta se carga en la misma consulta
+        return object_list.select_related('imagen_principal')
 
     def get_context_data(self, **kwargs):
         context = super(ProductListView, self).get_context_data(**kwargs)
-        context['categoria_list'] = Categoria.objects.all()
+        # Categorias desde la copia en memoria (sin consulta)
+        context['categoria_list'] = reference.categorias.all()
         context['categoria_selected'] = self.selectedCategory
+        context['orden_selected'] = self.selectedOrder
+        # Urls de las imagenes de la pagina en un solo paso (el storage las cachea)
+        self.precargar_imagenes(producto.imagen_principal.archivo_variante('card')
+                                for producto in context['object_list'] if producto.imagen_principal)
         return context
 
+    def precargar_imagenes(self, archivos):
+        precargar_urls(archivos)
+
 
 # Detalle del producto (vista tipo detalle)
 class ProductDetailView(DetailView):
     # El detalle se basa en el modelo producto
     model = Producto
+    queryset = Producto.objects.select_related('categoria', 'proveedor').prefetch_related('images')
 
     def get_context_data(self, **kwargs):
         context = super(ProductDetailView, self).get_context_data(**kwargs)
-        # Extraemos el modelo proveedor del usuario
-        try:
-            perfil = Profile.objects.get(user=self.request.user)
-            comerciante = Comerciante.objects.get(user_profile=perfil)
-            proveedor = Proveedor.objects.get(comerciante=comerciante)
-            # Extreamos el modelo proveedor del producto
-            prov_producto = Proveedor.objects.get(producto=self.object)
-            # Si son el mismo, se puede editar este producto
-            context['puede_editar_producto'] = proveedor == prov_producto
-        except Exception as e:
-            context['puede_editar_producto'] = False
+        imagenes = self.object.images.all()
+        self.precargar_imagenes([imagen.archivo_variante('detail') for imagen in imagenes] +
+                                [imagen.image for imagen in imagenes])
+        # Si el proveedor del usuario es el del producto, se puede editar este producto
+        proveedor_id = self.request.roles.proveedor_id
+        context['puede_editar_producto'] = (
+            proveedor_id is not None and self.object.proveedor_id == proveedor_id)
         return context
 
+    def precargar_imagenes(self, archivos):
+        precargar_urls(archivos)
+
+
+
+# Vistas async del catalogo (se usan bajo ASGI, ver settings.ASYNC_VIEWS)
+# El ORM, el cache y el render del template se ejecutan en el pool de asyncdb;
+# las urls de las imagenes se piden al storage a la vez, sin ocupar un hilo por peticion
+class AsyncCatalogoMixin:
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return marcar_async(super().as_view(**initkwargs))
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return super().http_method_not_allowed(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+    # Las imagenes se precargan despues de armar el contexto, fuera del hilo
+    def precargar_imagenes(self, archivos):
+        self.imagenes = list(archivos)
+
+    # Arma el contexto en un hilo, precarga las imagenes y renderiza en un hilo
+    async def responder(self, contexto):
+        self.imagenes = []
+        context = await en_hilo(contexto)
+        await precargar_urls_async(self.imagenes)
+        response = self.render_to_response(context)
+        return await en_hilo(response.render)
+
+
+class AsyncHomePageView(AsyncCatalogoMixin, HomePageView):
+    async def get(self, request, *args, **kwargs):
+        # Roles de la sesion (o de la base de datos)
+        await en_hilo(getattr, request.roles, 'ids')
+        roles = request.roles
+        self.puede_registrar_comercio = roles.is_comerciante and not roles.is_proveedor
+        self.puede_registrar_producto = roles.is_proveedor
+        # Ambas consultas a la vez
+        self.tiene_pedido, self.tiene_por_entregar = await asyncio.gather(
+            en_hilo(self.consultar_pedido, roles), en_hilo(self.consultar_por_entregar, roles))
+        return await self.responder(lambda: self.get_context_data(**kwargs))
+
+
+class AsyncProductListView(AsyncCatalogoMixin, ProductListView):
+    async def get(self, request, *args, **kwargs):
+        def contexto():
+            self.object_list = self.get_queryset()
+            return self.get_context_data()
+        return await self.responder(contexto)
+
+
+class AsyncProductDetailView(AsyncCatalogoMixin, ProductDetailView):
+    async def get(self, request, *args, **kwargs):
+        # El producto (con sus imagenes) y los roles del usuario a la vez
+        self.object, _ = await asyncio.gather(en_hilo(self.get_object), en_hilo(getattr, request.roles, 'ids'))
+        return await self.responder(lambda: self.get_context_data(object=self.object))
 
 
 # Vista de registro (vista tipo formulario)
@@ -213,9 +297,8 @@ class RegistrationView(FormView):
 
             # Handle special attribute
             cobertura_entrega = form.cleaned_data['cobertura_entrega']
-            # La cobertura debe ser valida para la tabla Localizacion
-            cobertura_entrega_set = Localizacion.objects.filter(pk=cobertura_entrega.pk)
-            colaborador.cobertura_entrega.set(cobertura_entrega_set)
+            # La cobertura ya fue validada contra la tabla Localizacion por el formulario
+            colaborador.cobertura_entrega.set([cobertura_entrega] if cobertura_entrega else [])
 
             colaborador.save()
 
@@ -226,9 +309,8 @@ class RegistrationView(FormView):
 
             # Handle special attribute
             preferencias = form.cleaned_data['preferencias']
-            # Las preferencias deben estar en la tabla Categoria
-            preferencias_set = Categoria.objects.filter(pk=preferencias.pk)
-            cliente.preferencias.set(preferencias_set)
+            # Las preferencias ya fueron validadas contra la tabla Categoria por el formulario
+            cliente.preferencias.set([preferencias] if preferencias else [])
 
             cliente.save()
 
@@ -249,29 +331,32 @@ class RegistrationView(FormView):
 class AddToCartView(View):
     def get(self, request, product_pk):
         # Obten el cliente
-        try:
-            user_profile = Profile.objects.get(user=request.user)
-            cliente = Cliente.objects.get(user_profile=user_profile)
-        except Exception as e:
+        cliente_id = request.roles.cliente_id
+        if cliente_id is None:
             return redirect('/no_client/')
         # Obtén el producto que queremos añadir al carrito
         producto = Producto.objects.get(pk=product_pk)
-        # Obtén/Crea un/el pedido en proceso (EP) del usuario
-        pedido, _  = Pedido.objects.get_or_create(cliente=cliente, estado='EP')
-        # Obtén/Crea un/el detalle de pedido
-        detalle_pedido, created = DetallePedido.objects.get_or_create(
-            producto=producto,
-            pedido=pedido,
-        )
-
-        # Si el detalle de pedido es creado la cantidad es 1
-        # Si no sumamos 1 a la cantidad actual
-        if created:
-            detalle_pedido.cantidad = 1
-        else:
-            detalle_pedido.cantidad = F('cantidad') + 1
-        # Guardamos los cambios
-        detalle_pedido.save()
+        # El detalle y los totales del pedido se actualizan juntos
+        with transaction.atomic():
+            # Obtén/Crea un/el pedido en proceso (EP) del usuario
+            pedido, _  = Pedido.objects.get_or_create(cliente_id=cliente_id, estado='EP')
+            # Obtén/Crea un/el detalle de pedido (con el precio y la categoria actuales del producto)
+            detalle_pedido, created = DetallePedido.objects.get_or_create(
+                producto=producto,
+                pedido=pedido,
+                defaults={'precio_unitario': producto.get_precio_final(), 'categoria_id': producto.categoria_id},
+            )
+
+            # Si el detalle de pedido es creado la cantidad es 1
+            # Si no sumamos 1 a la cantidad actual
+            if created:
+                detalle_pedido.cantidad = 1
+            else:
+                detalle_pedido.cantidad = F('cantidad') + 1
+            # Guardamos los cambios
+            detalle_pedido.save()
+            # Suma el precio del detalle al total del pedido
+            pedido.agregar_monto(detalle_pedido.precio_unitario)
         # Recarga la página
         return redirect(request.META['HTTP_REFERER'])
 
@@ -280,25 +365,28 @@ class AddToCartView(View):
 class RemoveFromCartView(View):
     def get(self, request, product_pk):
         # Obten el cliente
-        user_profile = Profile.objects.get(user=request.user)
-        cliente = Cliente.objects.get(user_profile=user_profile)
+        cliente_id = request.roles.cliente_id
         # Obtén el producto que queremos añadir al carrito
         producto = Producto.objects.get(pk=product_pk)
-        # Obtén/Crea un/el pedido en proceso (EP) del usuario
-        pedido, _  = Pedido.objects.get_or_create(cliente=cliente, estado='EP')
-        # Obtén/Crea un/el detalle de pedido
-        detalle_pedido = DetallePedido.objects.get(
-            producto=producto,
-            pedido=pedido,
-        )
-        # Si la cantidad actual menos 1 es 0 elmina el producto del carrito
-        # Si no restamos 1 a la cantidad actual
-        if detalle_pedido.cantidad - 1 == 0:
-            detalle_pedido.delete()
-        else:
-            detalle_pedido.cantidad = F('cantidad') - 1
-            # Guardamos los cambios
-            detalle_pedido.save()
+        # El detalle y los totales del pedido se actualizan juntos
+        with transaction.atomic():
+            # Obtén/Crea un/el pedido en proceso (EP) del usuario
+            pedido, _  = Pedido.objects.get_or_create(cliente_id=cliente_id, estado='EP')
+            # Obtén/Crea un/el detalle de pedido
+            detalle_pedido = DetallePedido.objects.get(
+                producto=producto,
+                pedido=pedido,
+            )
+            # Si la cantidad actual menos 1 es 0 elmina el producto del carrito
+            # Si no restamos 1 a la cantidad actual
+            if detalle_pedido.cantidad - 1 == 0:
+                detalle_pedido.delete()
+            else:
+                detalle_pedido.cantidad = F('cantidad') - 1
+                # Guardamos los cambios
+                detalle_pedido.save()
+            # Resta el precio del detalle (el mismo que se sumo) al total del pedido
+            pedido.agregar_monto(-detalle_pedido.precio_unitario)
         # Recarga la página
         return redirect(request.META['HTTP_REFERER'])
 
@@ -319,26 +407,34 @@ class PedidoDetailView(DetailView):
     def get_object(self):
         if(not self.es_carrito):
             # Obtén pedido
-            pedido  = Pedido.objects.get(pk=self.pedido_pk)
-            self.comentario = Comment.objects.filter(
-            usuario=self.request.user,pedido=pedido).order_by('-id')
+            pedido  = Pedido.objects.select_related('cliente__user_profile__user').get(pk=self.pedido_pk)
+            # Pagina del hilo de comentarios (?antes=<id> para los anteriores)
+            # Quien no es el cliente ni el repartidor del pedido solo ve sus comentarios
+            self.participa = comentarios.participa(self.request.roles, pedido.cliente_id, pedido.repartidor_id)
+            self.antes = comentarios.parametro_id(self.request, 'antes')
+            self.comentario, self.comentarios_antes = comentarios.pagina(
+                pedido.pk, self.antes, None if self.participa else self.request.user.pk)
             return pedido
         else:
             # Obten el cliente
-            user_profile = Profile.objects.get(user=self.request.user)
-            cliente = Cliente.objects.get(user_profile=user_profile)
+            cliente_id = self.request.roles.cliente_id
             # Obtén/Crea un/el pedido en proceso (EP) del usuario
-            pedido  = Pedido.objects.get(cliente=cliente, estado='EP')
+            pedido  = Pedido.objects.select_related('cliente__user_profile__user').get(cliente_id=cliente_id, estado='EP')
             return pedido
 
     # Cargar pagina
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Obtener el detalle de los objetos
-        context['detalles'] = context['object'].detallepedido_set.all()
+        # Obtener el detalle de los objetos (con su producto, en una sola consulta)
+        context['detalles'] = context['object'].detallepedido_set.select_related('producto')
         context['es_carrito'] = self.es_carrito
         if(not self.es_carrito):
             context['comments'] =self.comentario
+            context['comments_antes'] = self.comentarios_antes
+            # En la primera pagina, el cliente y el repartidor reciben los comentarios nuevos sin recargar
+            context['comments_since'] = self.comentario[0].pk if self.comentario else 0
+            context['comments_poll'] = self.participa and self.antes is None
+            context['comments_poll_interval'] = getattr(settings, 'COMMENTS_POLL_INTERVAL', 5)
         return context
 
 
@@ -346,16 +442,19 @@ class PedidoDetailView(DetailView):
 # Vista actualizar pedido
 class PedidoUpdateView(UpdateView):
     model = Pedido
-    # Campos para actualizar
-    fields = ['ubicacion', 'direccion_entrega','comprobante']
+    # Campos para actualizar (ubicacion, direccion_entrega, comprobante)
+    form_class = PedidoForm
     success_url = reverse_lazy('payment')
 
     def form_valid(self, form):
         # This method is called when valid form data has been POSTed.
         # It should return an HttpResponse.
         self.object = form.save(commit=False)
-        # Calculo de tarifa
-        self.object.tarifa = randint(5, 20)
+        # Calculo de tarifa: del origen de los productos a la ubicacion de entrega
+        self.object.tarifa = tarifas.tarifa_pedido(self.object)
+        # Recalcula los totales con los precios actuales de los productos
+        self.object.actualizar_precios()
+        self.object.recalcular_total(save=False)
         return super().form_valid(form)
 
 # Vista para pago
@@ -366,9 +465,8 @@ class PaymentView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Obten el cliente
-        user_profile = Profile.objects.get(user=self.request.user)
-        cliente = Cliente.objects.get(user_profile=user_profile)
-        context['pedido'] = Pedido.objects.get(cliente=cliente, estado='EP')
+        cliente_id = self.request.roles.cliente_id
+        context['pedido'] = Pedido.objects.get(cliente_id=cliente_id, estado='EP')
 
         return context
 
@@ -376,17 +474,15 @@ class PaymentView(TemplateView):
 class CompletePaymentView(View):
     def get(self, request):
         # Obten el cliente
-        user_profile = Profile.objects.get(user=request.user)
-
-        cliente = Cliente.objects.get(user_profile=user_profile)
+        roles = request.roles
 
         # Obtén/Crea un/el pedido en proceso (EP) del usuario
-        pedido = Pedido.objects.get(cliente=cliente, estado='EP')
+        pedido = Pedido.objects.get(cliente_id=roles.cliente_id, estado='EP')
 
         # Cambia el estado del pedido
         pedido.estado = 'PAG'
-        # Asignacion de repartidor
-        pedido.repartidor = Colaborador.objects.filter(~Q(user_profile=user_profile)).order_by('?').first()
+        # Asignacion de repartidor: el menos cargado que cubre la ubicacion del pedido
+        pedido.repartidor_id = dispatch.asignar_repartidor(pedido.ubicacion_id, excluir_perfil_id=roles.profile_id)
         # Guardamos los cambios
         pedido.save()
         messages.success(request, 'Gracias por tu compra! Un repartidor ha sido asignado a tu pedido.')
@@ -411,17 +507,20 @@ class RegisterCommerceView(FormView):
     def form_valid(self, form):
         # This method is called when valid from data has been POSTed
         # It should return an HttpResponse
-        perfil = Profile.objects.get(user=form.user)
-        comerciante = Comerciante.objects.get(user_profile=perfil)
+        comerciante_id = self.request.roles.comerciante_id
+        if comerciante_id is None:
+            raise Http404("No tiene usuario tipo comerciante")
 
         # Create Commerce (Proveedor)
         # Cleaned_data valida la informacion (longitudes y campos requeridos)
         ruc = form.cleaned_data['ruc']
         razon_social = form.cleaned_data['razon_social']
         telefono = form.cleaned_data['telefono']
+        ubicacion = form.cleaned_data['ubicacion']
 
         # Se crea el proveedor
-        provider = Proveedor.objects.create(ruc=ruc, razon_social=razon_social, telefono=telefono, comerciante=comerciante)
+        provider = Proveedor.objects.create(ruc=ruc, razon_social=razon_social, telefono=telefono,
+                                            ubicacion=ubicacion, comerciante_id=comerciante_id)
 
         try:
             provider.validate_data()
@@ -434,6 +533,8 @@ class RegisterCommerceView(FormView):
                 return redirect('/invalid_ruc/')
         # Se guarda en la base de datos
         provider.save()
+        # El usuario ahora tiene el rol proveedor
+        forget_roles(self.request)
 
         return super().form_valid(form)
 
@@ -457,9 +558,7 @@ class RegisterProductView(FormView):
     def form_valid(self, form):
         # This method is called when valid from data has been POSTed
         # It should return an HttpResponse
-        perfil = Profile.objects.get(user=form.user)
-        comerciante = Comerciante.objects.get(user_profile=perfil)
-        proveedor = Proveedor.objects.get(comerciante=comerciante)
+        proveedor = self.request.roles.proveedor
 
         # Create Producto
         # Cleaned_data valida la informacion (longitudes y campos requeridos)
@@ -471,18 +570,22 @@ class RegisterProductView(FormView):
         descuento = form.cleaned_data['descuento']
         imagen = form.cleaned_data['imagen']
 
-        # Se crea el producto
-        try:
-            producto = proveedor.register_product(categoria,nombre,descripcion,precio,estado,descuento)
-            ProductoImage.objects.create(product=producto, image=imagen)
-        except Exception as e:
-            print("error2")
-            print(e)
-            if("Price must be over 0" in str(e)):
-                return redirect('/invalid_price/')
-            if("Discount must be over 0" in str(e)):
-                return redirect('/invalid_discount/')
-
+        # Se crea el producto (con su imagen: si falla la subida, no queda el producto)
+        producto = None
+        with transaction.atomic():
+            try:
+                producto = proveedor.register_product(categoria,nombre,descripcion,precio,estado,descuento)
+            except Exception as e:
+                print("error2")
+                print(e)
+                if("Price must be over 0" in str(e)):
+                    return redirect('/invalid_price/')
+                if("Discount must be over 0" in str(e)):
+                    return redirect('/invalid_discount/')
+            # Fuera del try: un error al subir la imagen llega al usuario
+            # Las variantes se generan en segundo plano
+            if producto is not None:
+                images.registrar_imagen(producto, imagen)
 
         return super().form_valid(form)
 
@@ -510,11 +613,12 @@ class EditProductView(UpdateView):
 class DeletePedido(View):
     def get(self, request, pedido_pk):
         # Obten el cliente
-        user_profile = Profile.objects.get(user=request.user)
-        cliente = Cliente.objects.get(user_profile=user_profile)
+        cliente_id = request.roles.cliente_id
         # Obtén el pedido que se eliminara
-        pedido  = Pedido.objects.get(cliente=cliente, estado='PAG')
+        pedido  = Pedido.objects.get(pk=pedido_pk, cliente_id=cliente_id, estado='PAG')
         pedido.cancelar_pedido()
+        # El repartidor tiene un pedido menos por entregar
+        dispatch.liberar_repartidor(pedido.repartidor_id)
         messages.success(request, 'Tu pedido ha sido cancelado correctamente.')
 
         return redirect('home')
@@ -537,7 +641,7 @@ class RegisterCommentView(FormView):
     def form_valid(self, form):
         # Informacion de usuario y pedido
         usuario = form.user
-        pedido = Pedido.objects.get(pk=form.pedido_pk)[0]
+        pedido = Pedido.objects.get(pk=form.pedido_pk)
         # Create Comment
         # Cleaned_data valida la informacion (longitudes y campos requeridos)
         body = form.cleaned_data['body']
@@ -557,11 +661,18 @@ class PedidoDeliveredView(View):
     def get(self, request, pedido_pk):
         # Obtén/Crea un/el pedido
         pedido = Pedido.objects.get(pk=pedido_pk)
+        entregado = pedido.estado == 'PAG'
         pedido.estado = 'ENT'
         # Guardamos los cambios
         pedido.save()
+        # El repartidor tiene un pedido menos por entregar
+        if entregado:
+            dispatch.liberar_repartidor(pedido.repartidor_id)
+        # Desde la lista de pedidos (fetch): solo la tarjeta actualizada, sin recargar la lista
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({'pedido': pedido.pk, 'html': eventos.tarjeta(pedido, request.roles.colaborador_id)})
         # Recarga la página
-        return redirect(request.META['HTTP_REFERER'])
+        return redirect(request.META.get('HTTP_REFERER') or 'pedido-list')
 
 
 def empty_car(request):
@@ -588,3 +699,6 @@ def invalid_discount(request):
 
 def no_client(request):
     return render(request, 'main/custom_alert.html',{"mensaje":"No tiene usuario tipo cliente"})
+
+def no_provider(request):
+    return render(request, 'main/custom_alert.html',{"mensaje":"No tiene un comercio registrado"})